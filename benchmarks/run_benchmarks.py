@@ -0,0 +1,230 @@
+"""Benchmark suite for the correction pipeline.
+
+Generates a synthetic TDMS file, measures throughput and peak memory of
+fix.preprocess, error_handling.check_for_correct_repetition and
+fix.export_to_tmds and appends the results to a JSON file. Every run is
+compared against the latest stored run of another fixitfelix version with
+the same parameters, so performance regressions between versions show up.
+
+Usage: python benchmarks/run_benchmarks.py --size_mb 500 --channels 8
+"""
+import datetime
+import json
+import pathlib
+import platform
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import click
+
+import fixitfelix
+from fixitfelix import error_handling, fix, source, synthetic
+
+RESULTS_FILE = pathlib.Path(__file__).parent / "results.json"
+
+
+def measure(func: Callable[[], Any]) -> Tuple[Any, float, int]:
+    """Runs func and returns its result, the elapsed seconds and the peak of
+    memory allocated by Python and NumPy in bytes.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def stage_result(elapsed: float, peak: int, nbytes: int) -> Dict[str, float]:
+    return {
+        "seconds": elapsed,
+        "mb_per_s": nbytes / 1e6 / elapsed if elapsed > 0 else float("inf"),
+        "peak_mb": peak / 1e6,
+    }
+
+
+def run_benchmark(
+    spec: synthetic.SyntheticSpec,
+    meta: source.MetaData,
+    work_dir: pathlib.Path,
+) -> Dict[str, Dict[str, float]]:
+    """Runs all stages on a synthetic file in work_dir and returns the
+    measurements per stage.
+    """
+    tdms_path = work_dir / "synthetic.tdms"
+    export_path = work_dir / "synthetic_corrected.tdms"
+    synthetic.write_synthetic_tdms(tdms_path, spec)
+    nbytes = tdms_path.stat().st_size
+
+    results = {}
+    source_file, elapsed, peak = measure(
+        lambda: fix.preprocess(meta=meta, path=tdms_path)
+    )
+    results["preprocess"] = stage_result(elapsed, peak, nbytes)
+
+    _, elapsed, peak = measure(
+        lambda: error_handling.check_for_correct_repetition(source_file)
+    )
+    results["check_for_correct_repetition"] = stage_result(
+        elapsed, peak, nbytes
+    )
+
+    _, elapsed, peak = measure(
+        lambda: fix.export_to_tmds(
+            meta=meta, source_file=source_file, export_path=export_path
+        )
+    )
+    results["export_to_tmds"] = stage_result(elapsed, peak, nbytes)
+    return results
+
+
+def load_results(results_file: pathlib.Path) -> List[Dict[str, Any]]:
+    try:
+        with results_file.open() as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def find_baseline(
+    records: List[Dict[str, Any]], parameters: Dict[str, Any], version: str
+) -> Optional[Dict[str, Any]]:
+    """Returns the latest record with the same parameters of another version"""
+    candidates = [
+        record
+        for record in records
+        if record["parameters"] == parameters and record["version"] != version
+    ]
+    return candidates[-1] if candidates else None
+
+
+def compare(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """Returns a description of each stage that got slower or needs more
+    memory than the baseline by more than tolerance.
+    """
+    regressions = []
+    for stage, values in current.items():
+        if stage not in baseline:
+            continue
+        old = baseline[stage]
+        if values["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append(
+                f"{stage}: {old['seconds']:.2f}s -> {values['seconds']:.2f}s"
+            )
+        if values["peak_mb"] > old["peak_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{stage}: {old['peak_mb']:.1f}MB -> {values['peak_mb']:.1f}MB"
+            )
+    return regressions
+
+
+@click.command()
+@click.option("--size_mb", default=100, type=int, help="Raw data size in MB")
+@click.option("--channels", default=4, type=int)
+@click.option("--dtype", default="int64")
+@click.option("--segment_samples", default=1_000_000, type=int)
+@click.option("--chunk_size", default=100_000, type=int)
+@click.option("--recurrence_size", default=2_000, type=int)
+@click.option("--recurrence_distance", default=3_000, type=int)
+@click.option("--consistency_sample_size", default=10, type=int)
+@click.option(
+    "--segment_size", default=1, type=int, help="Output segment size in GB"
+)
+@click.option(
+    "--work_dir",
+    default=None,
+    type=click.Path(file_okay=False, exists=True),
+    help="Folder for the generated files, defaults to a temporary folder",
+)
+@click.option("--results_file", default=str(RESULTS_FILE))
+@click.option(
+    "--tolerance",
+    default=0.1,
+    type=float,
+    help="Relative slowdown or memory growth reported as regression",
+)
+@click.option("--fail_on_regression", is_flag=True)
+def main(
+    size_mb: int,
+    channels: int,
+    dtype: str,
+    segment_samples: int,
+    chunk_size: int,
+    recurrence_size: int,
+    recurrence_distance: int,
+    consistency_sample_size: int,
+    segment_size: int,
+    work_dir: Optional[str],
+    results_file: str,
+    tolerance: float,
+    fail_on_regression: bool,
+):
+    spec = synthetic.SyntheticSpec(
+        chunk_size=chunk_size,
+        recurrence_size=recurrence_size,
+        recurrence_distance=recurrence_distance,
+        total_samples=synthetic.samples_for_size(
+            size_mb * 1_000_000, channels, dtype
+        ),
+        channel_count=channels,
+        dtype=dtype,
+        segment_samples=segment_samples,
+    )
+    meta = source.MetaData(
+        chunk_size=chunk_size,
+        recurrence_size=recurrence_size,
+        recurrence_distance=recurrence_distance,
+        consistency_sample_size=consistency_sample_size,
+        segment_size=segment_size,
+    )
+    parameters = {**spec._asdict(), **meta._asdict()}
+
+    if work_dir is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stages = run_benchmark(spec, meta, pathlib.Path(tmp_dir))
+    else:
+        stages = run_benchmark(spec, meta, pathlib.Path(work_dir))
+
+    for stage, values in stages.items():
+        print(
+            f"{stage:>30}: {values['seconds']:8.2f}s "
+            f"{values['mb_per_s']:10.1f}MB/s {values['peak_mb']:10.1f}MB peak"
+        )
+
+    results_path = pathlib.Path(results_file)
+    records = load_results(results_path)
+    baseline = find_baseline(records, parameters, fixitfelix.__version__)
+    records.append(
+        {
+            "version": fixitfelix.__version__,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "machine": platform.node(),
+            "parameters": parameters,
+            "stages": stages,
+        }
+    )
+    with results_path.open(mode="w") as f:
+        json.dump(records, f, indent=2)
+
+    if baseline is None:
+        return
+    regressions = compare(stages, baseline["stages"], tolerance)
+    if regressions:
+        print(f"Regressions against version {baseline['version']}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        if fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""Corrections for asyncio services.
+
+A Corrector checks and exports files in executors, so the event loop of the
+service keeps running. Its correct method is an async iterator of the
+progress of a correction. Files of a folder are checked and exported
+concurrently, limited by the number of corrections of the Corrector. Every
+file, also a single one, is exported to its partial file, and the partial
+files are renamed to their corrected files once every file is exported.
+Corrected files of an earlier correction are only replaced if all partial
+files are renamed.
+
+A cancelled correction, e.g. by cancelling the task that iterates over its
+progress or by leaving the iteration early, stops its exports at the next
+written segment and removes all partial files it wrote. Failed corrections
+are removed as well, corrected files of earlier corrections are kept.
+"""
+import asyncio
+import functools
+import os
+import pathlib
+import threading
+import time
+from concurrent import futures
+from typing import Any, AsyncIterator, List, NamedTuple, Optional, Tuple
+
+from fixitfelix import checkpoint, error_handling, fix, listeners, source
+
+# Minimal number of seconds between two progress reports of an export
+PROGRESS_INTERVAL = 0.5
+
+# Suffix of a corrected file of an earlier correction while the new one is
+# published
+PREVIOUS_SUFFIX = ".fixit_previous"
+
+
+class Progress(NamedTuple):
+    # Source file and its corrected file
+    path: pathlib.Path
+    export_path: pathlib.Path
+    # Number of completely written channels and number of channels
+    channels_done: int
+    channels: int
+    # Number of written index ranges of the current channel and their number
+    ranges_done: int
+    ranges: int
+
+
+class ProgressReporter(listeners.ExportListener):
+    """Puts the progress of an export running in an executor into an asyncio
+    queue, and stops the export once the correction is cancelled.
+
+    Arguments:
+    loop: Event loop of queue
+    queue: Receives Progress tuples
+    cancelled: Is set when the correction is cancelled
+    progress: Progress of the export before the first channel is written
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        queue: asyncio.Queue,
+        cancelled: threading.Event,
+        progress: Progress,
+    ):
+        self.loop = loop
+        self.queue = queue
+        self.cancelled = cancelled
+        self.progress = progress
+        self.last_report = time.monotonic()
+
+    def report(self, **changes: int) -> None:
+        self.progress = self.progress._replace(**changes)
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, self.progress)
+        self.last_report = time.monotonic()
+
+    def channel_started(self, group, channel) -> None:
+        self.progress = self.progress._replace(ranges_done=0)
+
+    def segment_written(self, data, ranges_done: int) -> None:
+        if self.cancelled.is_set():
+            raise Exception(
+                error_handling.ERROR_DESCRIPTIONS.get(
+                    error_handling.ErrorCode.CORRECTION_CANCELLED
+                )
+            )
+        if time.monotonic() - self.last_report >= PROGRESS_INTERVAL:
+            self.report(ranges_done=ranges_done)
+
+    def channel_finished(self) -> None:
+        self.report(
+            channels_done=self.progress.channels_done + 1,
+            ranges_done=self.progress.ranges,
+        )
+
+
+async def wait_for_thread(
+    future: asyncio.Future, cancelled: threading.Event
+) -> Any:
+    """Waits for a function that runs in an executor. If the waiting task is
+    cancelled, the function is asked to stop by cancelled and still awaited,
+    so it does not use any file after the task ended.
+    """
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancelled.set()
+        await asyncio.wait([future])
+        if future.done() and not future.cancelled():
+            # The error of the stopped function is replaced by the cancellation
+            future.exception()
+        raise
+
+
+def start_progress(
+    path: pathlib.Path,
+    export_path: pathlib.Path,
+    source_file: source.SourceFile,
+) -> Progress:
+    """Returns the progress of the export of a checked file before its first
+    channel is written
+    """
+    return Progress(
+        path=path,
+        export_path=export_path,
+        channels_done=0,
+        channels=len(fix.select_channels(source_file)),
+        ranges_done=0,
+        ranges=len(fix.prepare_data_correction(source_file)),
+    )
+
+
+def remove_outputs(paths: List[pathlib.Path]) -> None:
+    """Removes the partial files at paths with their sidecar and checkpoint
+    files, if they exist
+    """
+    for path in paths:
+        for output_path in [
+            path,
+            *fix.sidecar_paths(path),
+            checkpoint.checkpoint_path(path),
+        ]:
+            if output_path.exists():
+                output_path.unlink()
+
+
+def previous_path(export_path: pathlib.Path) -> pathlib.Path:
+    return export_path.with_name(export_path.name + PREVIOUS_SUFFIX)
+
+
+def rename_output(path: pathlib.Path, new_path: pathlib.Path) -> None:
+    """Renames the corrected or partial file at path and its sidecar files"""
+    os.replace(path, new_path)
+    for sidecar, new_sidecar in zip(
+        fix.sidecar_paths(path), fix.sidecar_paths(new_path)
+    ):
+        if sidecar.exists():
+            os.replace(sidecar, new_sidecar)
+
+
+def publish_outputs(export_paths: List[pathlib.Path]) -> None:
+    """Renames the partial files of export_paths to their export paths.
+
+    Corrected files of an earlier correction are kept aside until every
+    partial file is renamed. If a rename fails, the renamed files are moved
+    back to their partial files and the earlier files are restored.
+    """
+    replaced = []
+    published = []
+    try:
+        for export_path in export_paths:
+            if export_path.exists():
+                rename_output(export_path, previous_path(export_path))
+                replaced.append(export_path)
+            rename_output(fix.partial_path(export_path), export_path)
+            published.append(export_path)
+    except BaseException:
+        for export_path in published:
+            rename_output(export_path, fix.partial_path(export_path))
+        for export_path in replaced:
+            rename_output(previous_path(export_path), export_path)
+        raise
+    for export_path in replaced:
+        fix.remove_partial(previous_path(export_path))
+
+
+def prepare_export(
+    path: pathlib.Path, output_file: str
+) -> List[Tuple[pathlib.Path, pathlib.Path]]:
+    """Checks the paths of a correction and returns pairs of each tdms file
+    to correct and its export path, see fix.list_export_paths
+    """
+    export_path = fix.determine_export_path(path, output_file)
+    if path.is_dir():
+        export_path.mkdir(exist_ok=True)
+    return fix.list_export_paths(path, export_path)
+
+
+class Corrector:
+    """Runs corrections of a service in executors.
+
+    Arguments:
+    max_corrections: Number of files that are checked or exported at the
+        same time by all corrections of the Corrector
+    check_executor: Executor of the consistency checks, the default executor
+        of the event loop if None
+    export_executor: Executor of the exports and other file operations, the
+        default executor of the event loop if None
+    """
+
+    def __init__(
+        self,
+        max_corrections: int = 1,
+        check_executor: Optional[futures.Executor] = None,
+        export_executor: Optional[futures.Executor] = None,
+    ):
+        self.max_corrections = max_corrections
+        self.check_executor = check_executor
+        self.export_executor = export_executor
+        # Created in the event loop, as asyncio objects of Python 3.8 are
+        # bound to the loop they are created in
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    async def check_file(
+        self,
+        meta: source.MetaData,
+        path: pathlib.Path,
+        file_selection: Optional[source.Selection],
+        scan_drift: bool,
+        cancelled: threading.Event,
+    ) -> source.SourceFile:
+        """Runs fix.preprocess on the file at path in the check executor"""
+        loop = asyncio.get_running_loop()
+        check = loop.run_in_executor(
+            self.check_executor,
+            functools.partial(
+                fix.preprocess,
+                meta=meta,
+                path=path,
+                file_selection=file_selection,
+                scan_drift=scan_drift,
+            ),
+        )
+        try:
+            return await wait_for_thread(check, cancelled)
+        except asyncio.CancelledError:
+            if (
+                check.done()
+                and not check.cancelled()
+                and check.exception() is None
+            ):
+                check.result().tdms_operator.close()
+            raise
+
+    async def correct_file(
+        self,
+        meta: source.MetaData,
+        path: pathlib.Path,
+        export_path: pathlib.Path,
+        queue: asyncio.Queue,
+        cancelled: threading.Event,
+        file_selection: Optional[source.Selection] = None,
+        scan_drift: bool = False,
+        **export_options: Any,
+    ) -> None:
+        """Checks the file at path and exports it to the partial file of
+        export_path
+        """
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            source_file = await self.check_file(
+                meta, path, file_selection, scan_drift, cancelled
+            )
+            try:
+                progress = await wait_for_thread(
+                    loop.run_in_executor(
+                        self.export_executor,
+                        start_progress,
+                        path,
+                        export_path,
+                        source_file,
+                    ),
+                    cancelled,
+                )
+                reporter = ProgressReporter(loop, queue, cancelled, progress)
+                await wait_for_thread(
+                    loop.run_in_executor(
+                        self.export_executor,
+                        functools.partial(
+                            fix.export_to_tmds,
+                            meta=meta,
+                            source_file=source_file,
+                            export_path=fix.partial_path(export_path),
+                            export_listeners=[reporter],
+                            **export_options,
+                        ),
+                    ),
+                    cancelled,
+                )
+            finally:
+                source_file.tdms_operator.close()
+
+    async def run_correction(
+        self,
+        meta: source.MetaData,
+        export_paths: List[Tuple[pathlib.Path, pathlib.Path]],
+        queue: asyncio.Queue,
+        cancelled: threading.Event,
+        **options: Any,
+    ) -> None:
+        """Corrects each file of export_paths into its partial file. The
+        partial files are renamed to their export paths once every file is
+        exported.
+        """
+        loop = asyncio.get_running_loop()
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_corrections)
+        targets = [
+            fix.partial_path(export_path) for (_, export_path) in export_paths
+        ]
+        tasks = [
+            asyncio.ensure_future(
+                self.correct_file(
+                    meta, path, export_path, queue, cancelled, **options
+                )
+            )
+            for (path, export_path) in export_paths
+        ]
+        try:
+            await asyncio.gather(*tasks)
+            # A cancellation waits until the files are published or restored
+            await wait_for_thread(
+                loop.run_in_executor(
+                    self.export_executor,
+                    publish_outputs,
+                    [export_path for (_, export_path) in export_paths],
+                ),
+                cancelled,
+            )
+        except BaseException:
+            # The corrected files of a folder are only usable together
+            cancelled.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.run_in_executor(
+                self.export_executor, remove_outputs, targets
+            )
+            raise
+
+    async def correct(
+        self,
+        filename: str,
+        meta: source.MetaData,
+        output_file: str = "",
+        preserve_raw: bool = False,
+        file_selection: Optional[source.Selection] = None,
+        scan_drift: bool = False,
+        with_overview: bool = False,
+        drop_cache: bool = False,
+    ) -> AsyncIterator[Progress]:
+        """Corrects a TDMS file or a folder with TDMS files and yields the
+        progress of the exports, see fix.export_correct_data for the
+        arguments.
+
+        The progress of an export is yielded at most every PROGRESS_INTERVAL
+        seconds and after each written channel. Errors of the checks and
+        exports are raised at the end of the iteration.
+        """
+        loop = asyncio.get_running_loop()
+        path = pathlib.Path(filename)
+        export_paths = await loop.run_in_executor(
+            self.export_executor, prepare_export, path, output_file
+        )
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        task = asyncio.ensure_future(
+            self.run_correction(
+                meta,
+                export_paths,
+                queue,
+                cancelled,
+                preserve_raw=preserve_raw,
+                file_selection=file_selection,
+                scan_drift=scan_drift,
+                with_overview=with_overview,
+                drop_cache=drop_cache,
+            )
+        )
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                progress = await queue.get()
+                if progress is None:
+                    break
+                yield progress
+            await task
+        finally:
+            if not task.done():
+                cancelled.set()
+                task.cancel()
+                await asyncio.wait([task])
+
+    async def export_correct_data(
+        self, filename: str, meta: source.MetaData, *args: Any, **kwargs: Any
+    ) -> List[pathlib.Path]:
+        """Corrects a TDMS file or a folder with TDMS files like correct and
+        returns the paths of the corrected files
+        """
+        export_paths = set()
+        async for progress in self.correct(filename, meta, *args, **kwargs):
+            export_paths.add(progress.export_path)
+        return sorted(export_paths)
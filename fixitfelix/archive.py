@@ -0,0 +1,316 @@
+"""Export of corrected data into a chunked, compressed columnar archive.
+
+An archive is a folder with one subfolder per group and one file per channel,
+so single channels can be read without parsing TDMS:
+
+    <name>.fixit_archive/
+        archive.json          index with names, data types and chunk offsets
+        group_0/column_0.npy  memory mappable channel, codec "npy"
+        group_0/column_1.zlib compressed chunks of a channel, codec "zlib"
+
+Each chunk holds the corrected values of a number of periods of the
+recurrence pattern. Periods cut by a selected window or by a shift of the
+pattern hold fewer values, so the index stores the position of the first
+value of each chunk. The chunks are compressed in parallel.
+"""
+import collections
+import concurrent.futures
+import json
+import lzma
+import os
+import pathlib
+import shutil
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from fixitfelix import fix, source
+
+ARCHIVE_SUFFIX = ".fixit_archive"
+INDEX_FILE = "archive.json"
+
+# Approximate size of the uncompressed data of a chunk
+CHUNK_BYTES = 4_000_000
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "zlib": zlib.compress,
+    "lzma": lzma.compress,
+}
+
+DECOMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "zlib": zlib.decompress,
+    "lzma": lzma.decompress,
+}
+
+CODECS = ["npy", *COMPRESSORS]
+
+
+def archive_path(export_path: pathlib.Path) -> pathlib.Path:
+    """Returns the archive path that replaces the TDMS file export_path"""
+    return export_path.with_suffix(ARCHIVE_SUFFIX)
+
+
+def calculate_periods_per_chunk(chunk_size: int, itemsize: int) -> int:
+    """Returns the number of recurrence periods whose corrected values make up
+    a chunk of roughly CHUNK_BYTES bytes.
+    """
+    return max(1, CHUNK_BYTES // (chunk_size * itemsize))
+
+
+def read_column_chunks(
+    channel, index_ranges: List[Tuple[int, int]], periods_per_chunk: int
+):
+    """Yields the corrected values of channel chunk by chunk"""
+    for first in range(0, len(index_ranges), periods_per_chunk):
+        yield np.concatenate(
+            [
+                fix.read_chunk(channel, offset, length)
+                for (offset, length) in index_ranges[
+                    first : first + periods_per_chunk
+                ]
+            ]
+        )
+
+
+def write_npy_column(
+    path: pathlib.Path, chunks, dtype: np.dtype, samples: int
+) -> Dict[str, Any]:
+    column = np.lib.format.open_memmap(
+        str(path), mode="w+", dtype=dtype, shape=(samples,)
+    )
+    position = 0
+    for data in chunks:
+        column[position : position + len(data)] = data
+        position += len(data)
+    column.flush()
+    del column
+    return {}
+
+
+def write_compressed_column(
+    path: pathlib.Path,
+    chunks,
+    codec: str,
+    executor: concurrent.futures.Executor,
+    max_pending: int,
+) -> Dict[str, Any]:
+    """Compresses chunks in parallel and writes them in order to path.
+
+    Returns:
+    Index entries with the offsets of the compressed chunks in the file and
+    the positions of their first values in the channel, each followed by the
+    end of the last chunk
+    """
+    compress = COMPRESSORS[codec]
+    chunk_offsets = [0]
+    chunk_starts = [0]
+    pending: collections.deque = collections.deque()
+    with path.open(mode="wb") as f:
+
+        def write_next() -> None:
+            compressed = pending.popleft().result()
+            f.write(compressed)
+            chunk_offsets.append(chunk_offsets[-1] + len(compressed))
+
+        for data in chunks:
+            chunk_starts.append(chunk_starts[-1] + len(data))
+            pending.append(executor.submit(compress, data.tobytes()))
+            # Bounds the memory of chunks waiting for their compression
+            if len(pending) >= max_pending:
+                write_next()
+        while pending:
+            write_next()
+    return {"chunk_offsets": chunk_offsets, "chunk_starts": chunk_starts}
+
+
+def export_to_archive(
+    meta: source.MetaData,
+    source_file: source.SourceFile,
+    export_path: pathlib.Path,
+    codec: str = "zlib",
+    workers: Optional[int] = None,
+) -> None:
+    """Exports the valid data slices into a new archive on disk.
+
+    The archive is written to a temporary folder first and renamed in the
+    end, so an archive at export_path is always complete.
+
+    Arguments:
+    meta: meta data of source file
+    source_file: Tdms file, that passed all consistency checks
+    export_path: Folder path of the archive
+    codec: One of CODECS
+    workers: Number of threads compressing chunks, all cores by default
+    """
+    index_ranges = fix.prepare_data_correction(source_file)
+    workers = workers or os.cpu_count() or 1
+    tmp_path = export_path.with_name(export_path.name + ".tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir()
+
+    channels = fix.select_channels(source_file)
+    groups = []
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for group_number, group in enumerate(
+            source_file.tdms_operator.groups()
+        ):
+            group_channels = [c for g, c in channels if g.name == group.name]
+            if not group_channels:
+                continue
+            group_dir = f"group_{group_number}"
+            (tmp_path / group_dir).mkdir()
+            columns = []
+            for channel in group_channels:
+                dtype = fix.get_written_dtype(channel)
+                periods_per_chunk = calculate_periods_per_chunk(
+                    meta.chunk_size, dtype.itemsize
+                )
+                chunks = read_column_chunks(
+                    channel, index_ranges, periods_per_chunk
+                )
+                samples = sum(length for (_, length) in index_ranges)
+                column_file = f"column_{len(columns)}.{codec}"
+                column_path = tmp_path / group_dir / column_file
+                if codec == "npy":
+                    entries = write_npy_column(
+                        column_path, chunks, dtype, samples
+                    )
+                else:
+                    entries = write_compressed_column(
+                        column_path, chunks, codec, executor, 2 * workers
+                    )
+                columns.append(
+                    {
+                        "name": channel.name,
+                        "file": f"{group_dir}/{column_file}",
+                        "dtype": dtype.str,
+                        "samples": samples,
+                        **entries,
+                    }
+                )
+            groups.append({"name": group.name, "columns": columns})
+
+    with (tmp_path / INDEX_FILE).open(mode="w") as f:
+        json.dump(
+            {"codec": codec, "meta": meta._asdict(), "groups": groups},
+            f,
+            indent=2,
+        )
+    if export_path.exists():
+        shutil.rmtree(export_path)
+    os.replace(tmp_path, export_path)
+
+
+def export_correct_data(
+    filename: str,
+    meta: source.MetaData,
+    output_file: str,
+    codec: str = "zlib",
+    workers: Optional[int] = None,
+    file_selection: Optional[source.Selection] = None,
+    scan_drift: bool = False,
+) -> None:
+    """Corrects a tdms file or a folder with tdms files like
+    fix.export_correct_data, but writes archives instead of TDMS files.
+
+    Arguments:
+    filename: Path to the tdms file or folder with tdms files to correct.
+    meta: MetaData dict that contains all information needed for correction.
+    output_file: File path for the corrected archive or folder.
+    codec: One of CODECS
+    workers: Number of threads compressing chunks, all cores by default
+    file_selection: Groups, channels and window of each file to correct, the
+        whole file if None
+    scan_drift: Whether the files are scanned for shifts of the pattern
+    """
+    path = pathlib.Path(filename)
+    export_path = fix.determine_export_path(path, output_file)
+    export_paths = [
+        (tdms_file, archive_path(file_export_path))
+        for (tdms_file, file_export_path) in fix.list_export_paths(
+            path, export_path
+        )
+    ]
+
+    def export_file(
+        source_file: source.SourceFile, file_export_path: pathlib.Path
+    ) -> None:
+        export_to_archive(meta, source_file, file_export_path, codec, workers)
+
+    if path.is_dir():
+        if not export_path.exists():
+            export_path.mkdir()
+        fix.export_directory(
+            meta,
+            export_paths,
+            export_file,
+            file_selection=file_selection,
+            scan_drift=scan_drift,
+        )
+    else:
+        ((_, file_export_path),) = export_paths
+        source_file = fix.preprocess(
+            meta=meta,
+            path=path,
+            file_selection=file_selection,
+            scan_drift=scan_drift,
+        )
+        export_file(source_file, file_export_path)
+
+
+def load_index(path: pathlib.Path) -> Dict[str, Any]:
+    """Returns the index of the archive at path"""
+    with (path / INDEX_FILE).open() as f:
+        return json.load(f)
+
+
+def find_column(index: Dict[str, Any], group: str, channel: str):
+    for g in index["groups"]:
+        if g["name"] == group:
+            for column in g["columns"]:
+                if column["name"] == channel:
+                    return column
+    raise KeyError(f"No channel {channel} in group {group}")
+
+
+def read_column(
+    path: pathlib.Path,
+    group: str,
+    channel: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+) -> np.ndarray:
+    """Reads the values start to stop of a channel from the archive at path.
+
+    Columns of codec "npy" are memory mapped, so only the requested values
+    are read. Of compressed columns only the chunks containing them are
+    read and decompressed.
+    """
+    index = load_index(path)
+    column = find_column(index, group, channel)
+    stop = column["samples"] if stop is None else min(stop, column["samples"])
+    if index["codec"] == "npy":
+        return np.load(str(path / column["file"]), mmap_mode="r")[start:stop]
+
+    decompress = DECOMPRESSORS[index["codec"]]
+    offsets = column["chunk_offsets"]
+    starts = column["chunk_starts"]
+    first_chunk = max(0, int(np.searchsorted(starts, start, side="right")) - 1)
+    stop_chunk = min(
+        int(np.searchsorted(starts, stop, side="left")), len(offsets) - 1
+    )
+    chunks = []
+    with (path / column["file"]).open(mode="rb") as f:
+        for chunk in range(first_chunk, stop_chunk):
+            f.seek(offsets[chunk])
+            chunks.append(
+                np.frombuffer(
+                    decompress(f.read(offsets[chunk + 1] - offsets[chunk])),
+                    dtype=column["dtype"],
+                )
+            )
+    data = np.concatenate(chunks) if chunks else np.empty(0, column["dtype"])
+    first = starts[first_chunk]
+    return data[max(start - first, 0) : max(stop - first, 0)]
@@ -0,0 +1,325 @@
+"""Time catalog of corrected TDMS files.
+
+While fix.export_to_tmds writes a corrected file, each written segment is
+recorded in an SQLite database with its file, channel, position in the file,
+its first corrected value and the wall clock time of its values. The time is
+given by the `wf_start_time` and `wf_increment` properties of the source
+channel, channels without them are not recorded. Many corrected files share
+one catalog, so find returns the files, channels, values and segments of a
+time range without opening any TDMS file.
+
+Times are seconds since the epoch or datetimes, naive datetimes are UTC like
+the timestamps of nptdms.
+"""
+import datetime
+import math
+import pathlib
+import sqlite3
+from typing import (
+    Any,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from fixitfelix import listeners, manifest
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    file TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    increment REAL NOT NULL,
+    first_sample INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_start_time ON segments (start_time);
+CREATE INDEX IF NOT EXISTS segments_duration
+    ON segments (end_time - start_time);
+CREATE INDEX IF NOT EXISTS segments_file ON segments (file);
+"""
+
+Time = Union[float, int, str, datetime.datetime, np.datetime64]
+
+
+class CatalogEntry(NamedTuple):
+    file: str
+    group: str
+    channel: str
+    # Number of the first corrected value of the channel within the range
+    first_sample: int
+    samples: int
+    # Positions of the segments in the file that contain the values
+    segment_positions: List[int]
+
+
+def to_nanoseconds(time: Time) -> int:
+    """Returns the nanoseconds since the epoch of a time. Times are stored as
+    integers, as float seconds since the epoch are only precise to about a
+    microsecond.
+    """
+    if isinstance(time, (int, float)):
+        return round(time * 1_000_000_000)
+    if isinstance(time, datetime.datetime) and time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return int(
+        (np.datetime64(time, "ns") - np.datetime64(0, "ns"))
+        // np.timedelta64(1, "ns")
+    )
+
+
+def get_timing(channel) -> Optional[Tuple[int, float]]:
+    """Returns the time of the first value of channel in nanoseconds since the
+    epoch and the seconds between two values, or None if they are unknown.
+    """
+    properties = channel.properties
+    if "wf_start_time" not in properties or "wf_increment" not in properties:
+        return None
+    increment = float(properties["wf_increment"])
+    if increment <= 0:
+        return None
+    return to_nanoseconds(properties["wf_start_time"]), increment
+
+
+def connect(catalog_path: pathlib.Path) -> sqlite3.Connection:
+    connection = sqlite3.connect(str(catalog_path))
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def execute(
+    catalog_path: pathlib.Path, statements: List[Tuple[str, List[tuple]]]
+) -> None:
+    """Executes each statement for its parameters in one transaction"""
+    connection = connect(catalog_path)
+    try:
+        with connection:
+            for statement, parameters in statements:
+                connection.executemany(statement, parameters)
+    finally:
+        connection.close()
+
+
+def describe_file(export_path: pathlib.Path) -> str:
+    """Returns the name of a corrected file in the catalog"""
+    return str(pathlib.Path(export_path).resolve())
+
+
+INSERT_SEGMENTS = "INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+class CatalogWriter(listeners.ExportListener):
+    """Records the segments written by fix.export_to_tmds in the catalog.
+    Earlier records of the corrected file are replaced. The records of each
+    channel are stored when the channel is finished, so the catalog is not
+    locked while the data is written.
+
+    Arguments:
+    catalog_path: Path of the SQLite catalog, which is created if needed
+    export_path: File path of the corrected TDMS file
+    f: Opened corrected file
+    channels: Groups and channels that are exported
+    first_sample: Number of the first written value within the corrected
+        values of the whole source file, e.g. the start of a window
+    size: Size of the corrected file an interrupted export continues at
+    """
+
+    def __init__(
+        self,
+        catalog_path: pathlib.Path,
+        export_path: pathlib.Path,
+        f,
+        channels: List[Tuple[Any, Any]],
+        first_sample: int = 0,
+        size: int = 0,
+    ):
+        self.catalog_path = catalog_path
+        self.file = describe_file(export_path)
+        self.f = f
+        self.first_sample = first_sample
+        self.channels: Dict[str, Tuple[str, str, Tuple[int, float]]] = {}
+        for group, channel in channels:
+            timing = get_timing(channel)
+            if timing is not None:
+                path = manifest.object_path(group.name, channel.name)
+                self.channels[path] = (group.name, channel.name, timing)
+        self.written: Dict[str, int] = {}
+        self.rows: List[tuple] = []
+        self.current: Optional[str] = None
+        self.position = 0
+        if size > 0:
+            # Segments written before the export was interrupted
+            segments = manifest.read_channel_segments(export_path, size)
+            for path, channel_segments in segments.items():
+                self.current = path
+                for segment in channel_segments:
+                    manifest.check_segment_layout(segment)
+                    (data_object,) = segment.data_objects
+                    self.record(
+                        segment.position,
+                        segment.end,
+                        segment.number_of_chunks
+                        * data_object.raw_data_index.number_of_values,
+                    )
+        execute(
+            catalog_path,
+            [
+                ("DELETE FROM segments WHERE file = ?", [(self.file,)]),
+                (INSERT_SEGMENTS, self.rows),
+            ],
+        )
+        self.rows = []
+
+    def record(self, position: int, end: int, samples: int) -> None:
+        """Records a segment of the current channel"""
+        first = self.written.get(self.current, 0)
+        self.written[self.current] = first + samples
+        if self.current not in self.channels:
+            return
+        group, channel, (start_time, increment) = self.channels[self.current]
+        nanoseconds = increment * 1_000_000_000
+        segment_start = start_time + round(
+            (self.first_sample + first) * nanoseconds
+        )
+        self.rows.append(
+            (
+                self.file,
+                group,
+                channel,
+                segment_start,
+                segment_start + round(samples * nanoseconds),
+                increment,
+                first,
+                samples,
+                position,
+                end - position,
+            )
+        )
+
+    def channel_started(self, group, channel) -> None:
+        self.current = manifest.object_path(group.name, channel.name)
+        self.position = self.f.tell()
+
+    def segment_written(self, data: np.ndarray, ranges_done: int) -> None:
+        end = self.f.tell()
+        self.record(self.position, end, len(data))
+        self.position = end
+
+    def channel_finished(self) -> None:
+        execute(self.catalog_path, [(INSERT_SEGMENTS, self.rows)])
+        self.rows = []
+
+
+def rename_files(
+    catalog_path: pathlib.Path,
+    renamed: Sequence[Tuple[pathlib.Path, pathlib.Path]],
+) -> None:
+    """Updates the records of files that were renamed from the first to the
+    second path of each pair, e.g. partial files of a folder.
+    """
+    names = [(describe_file(new), describe_file(old)) for old, new in renamed]
+    execute(
+        catalog_path,
+        [
+            # Records of earlier files at the new paths are outdated
+            (
+                "DELETE FROM segments WHERE file = ?",
+                [(new,) for new, _ in names],
+            ),
+            ("UPDATE segments SET file = ? WHERE file = ?", names),
+        ],
+    )
+
+
+def remove_files(
+    catalog_path: pathlib.Path, paths: Sequence[pathlib.Path]
+) -> None:
+    """Removes the records of files from the catalog"""
+    execute(
+        catalog_path,
+        [
+            (
+                "DELETE FROM segments WHERE file = ?",
+                [(describe_file(path),) for path in paths],
+            )
+        ],
+    )
+
+
+def count_values_before(time: int, start_time: int, increment: float) -> int:
+    """Returns the number of values of a segment before time. Values within
+    a nanosecond of time, which is the precision of the catalog, are not
+    counted.
+    """
+    return math.ceil((time - start_time - 1) / (increment * 1_000_000_000))
+
+
+def find(
+    catalog_path: pathlib.Path,
+    start: Time,
+    stop: Time,
+    channels: Sequence[str] = (),
+) -> List[CatalogEntry]:
+    """Returns the values of all recorded channels from start to stop.
+
+    Arguments:
+    catalog_path: Path of the SQLite catalog
+    start: Time of the first value
+    stop: Time after the last value
+    channels: Names of the channels, given by name or as `group/channel`,
+        all channels if empty
+
+    Returns:
+    One entry per file and channel with values in the range, sorted by file,
+    group and channel
+    """
+    start, stop = to_nanoseconds(start), to_nanoseconds(stop)
+    connection = connect(catalog_path)
+    try:
+        (longest,) = connection.execute(
+            "SELECT MAX(end_time - start_time) FROM segments"
+        ).fetchone()
+        # Segments that start before start - longest end before start, so
+        # only a range of the start_time index is read
+        rows = connection.execute(
+            "SELECT file, group_name, channel, start_time, increment,"
+            " first_sample, samples, position FROM segments"
+            " WHERE start_time >= ? AND start_time < ? AND end_time > ?"
+            " ORDER BY file, group_name, channel, first_sample",
+            (start - (longest or 0), stop, start),
+        ).fetchall()
+    finally:
+        connection.close()
+
+    entries: Dict[Tuple[str, str, str], CatalogEntry] = {}
+    for row in rows:
+        (file, group, channel, start_time, increment, first, samples) = row[:7]
+        if channels and not (
+            channel in channels or f"{group}/{channel}" in channels
+        ):
+            continue
+        begin = max(count_values_before(start, start_time, increment), 0)
+        end = min(count_values_before(stop, start_time, increment), samples)
+        if begin >= end:
+            continue
+        key = (file, group, channel)
+        if key not in entries:
+            entries[key] = CatalogEntry(
+                file, group, channel, first + begin, 0, []
+            )
+        entry = entries[key]
+        entries[key] = entry._replace(
+            samples=first + end - entry.first_sample,
+            segment_positions=entry.segment_positions + [row[7]],
+        )
+    return list(entries.values())
@@ -0,0 +1,166 @@
+"""Checkpoints of fix.export_to_tmds, so an interrupted export can resume.
+
+A checkpoint file next to the corrected file records the channel and the
+number of its index ranges that are durably written, together with the size
+of the corrected file at that point. It is created before the corrected file
+and removed once the export is finished, so a corrected file without a
+checkpoint is complete.
+"""
+import json
+import pathlib
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fixitfelix import file_helpers, listeners, source, tdms_segments
+
+CHECKPOINT_SUFFIX = ".fixit_checkpoint"
+
+# Minimal number of seconds between two checkpoints, so exports with many
+# small segments do not wait for the disk after each of them
+CHECKPOINT_INTERVAL = 5.0
+
+
+def checkpoint_path(export_path: pathlib.Path) -> pathlib.Path:
+    return export_path.parent / (export_path.name + CHECKPOINT_SUFFIX)
+
+
+def is_finished(export_path: pathlib.Path) -> bool:
+    """Whether a complete corrected file exists at export_path"""
+    return export_path.exists() and not checkpoint_path(export_path).exists()
+
+
+def describe_export(
+    meta: source.MetaData,
+    channels: List[Tuple[Any, Any]],
+    index_ranges: List[Tuple[int, int]],
+    preserve_raw: bool,
+) -> Dict[str, Any]:
+    """Returns what identifies an export, so a checkpoint is only used to
+    resume the very same export.
+    """
+    return {
+        "meta": meta._asdict(),
+        "channels": [[group.name, channel.name] for group, channel in channels],
+        "number_of_ranges": len(index_ranges),
+        "first_range": [int(value) for value in index_ranges[0]]
+        if index_ranges
+        else [],
+        "preserve_raw": preserve_raw,
+    }
+
+
+def estimate_size(description: Dict[str, Any], size: int) -> int:
+    """Returns the size in bytes of the last checkpoint of the export
+    described by description, whose corrected file has size bytes
+    """
+    return len(
+        json.dumps(
+            {
+                **description,
+                "channel": len(description["channels"]),
+                "ranges_done": description["number_of_ranges"],
+                "size": size,
+            }
+        ).encode()
+    )
+
+
+def save(
+    export_path: pathlib.Path,
+    description: Dict[str, Any],
+    channel_number: int,
+    ranges_done: int,
+    size: int,
+) -> None:
+    file_helpers.write_json(
+        checkpoint_path(export_path),
+        {
+            **description,
+            "channel": channel_number,
+            "ranges_done": ranges_done,
+            "size": size,
+        },
+    )
+
+
+def check_tail(export_path: pathlib.Path, size: int) -> bool:
+    """Checks whether the segments of the file at export_path end at size"""
+    if size == 0:
+        return True
+    if export_path.stat().st_size < size:
+        return False
+    try:
+        with export_path.open(mode="rb") as f:
+            for segment in tdms_segments.read_segments(f):
+                if segment.end >= size:
+                    return segment.end == size
+    except (ValueError, KeyError):
+        pass
+    return False
+
+
+def load(
+    export_path: pathlib.Path, description: Dict[str, Any]
+) -> Optional[Tuple[int, int, int]]:
+    """Returns channel number, written index ranges of that channel and size
+    of the corrected file of the last checkpoint of the export, or None if
+    the export has to start from the beginning.
+    """
+    try:
+        with checkpoint_path(export_path).open() as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not export_path.exists():
+        return None
+    if {key: state.get(key) for key in description} != json.loads(
+        json.dumps(description)
+    ):
+        return None
+    if not check_tail(export_path, state["size"]):
+        return None
+    return state["channel"], state["ranges_done"], state["size"]
+
+
+class Checkpointer(listeners.ExportListener):
+    """Stores a checkpoint after written segments, at most every
+    CHECKPOINT_INTERVAL seconds, and after each channel.
+    """
+
+    def __init__(
+        self,
+        f,
+        export_path: pathlib.Path,
+        description: Dict[str, Any],
+        first_channel: int,
+    ):
+        self.f = f
+        self.export_path = export_path
+        self.description = description
+        self.channel_number = first_channel - 1
+        self.last_save = time.monotonic()
+
+    def save(self, channel_number: int, ranges_done: int) -> None:
+        file_helpers.sync(self.f)
+        save(
+            self.export_path,
+            self.description,
+            channel_number,
+            ranges_done,
+            self.f.tell(),
+        )
+        self.last_save = time.monotonic()
+
+    def channel_started(self, group, channel) -> None:
+        self.channel_number += 1
+
+    def segment_written(self, data, ranges_done: int) -> None:
+        if time.monotonic() - self.last_save >= CHECKPOINT_INTERVAL:
+            self.save(self.channel_number, ranges_done)
+
+    def channel_finished(self) -> None:
+        self.save(self.channel_number + 1, 0)
+
+    def export_finished(self) -> None:
+        file_helpers.sync(self.f)
+        checkpoint_path(self.export_path).unlink()
@@ -2,16 +2,70 @@ import click
 import pathlib
 import yaml
 
-from typing import Optional
+from typing import Optional, Tuple
 
-from fixitfelix import config, fix, source
+from fixitfelix import (
+    archive,
+    catalog,
+    config,
+    fix,
+    incremental,
+    inplace,
+    manifest,
+    merge,
+    plan,
+    selection,
+    shared,
+    source,
+    tdms_index,
+    tuning,
+)
 
 
 PATH_TO_CONFIG = pathlib.Path.home().joinpath(".fixitfelix_config.yaml")
 CLI_CONFIG = config.CliConfig.from_yaml(PATH_TO_CONFIG)
 
 
-@click.command()
+class DefaultCommandGroup(click.Group):
+    """Group of commands that runs the command default_command if the first
+    argument is no command, so `fixit FILENAME` corrects FILENAME.
+    """
+
+    def __init__(self, *args, default_command: str = "fix", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if not args or args[0] not in self.commands:
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup)
+def main():
+    """Corrects TDMS files, see `fixit fix --help`"""
+
+
+def split_names(names: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Splits names given as several options or separated by commas"""
+    return tuple(
+        name.strip()
+        for value in names
+        for name in value.split(",")
+        if name.strip()
+    )
+
+
+def parse_range(ctx, param, value: Optional[str]):
+    if value is None:
+        return None
+    try:
+        return selection.parse_range(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@main.command(name="fix")
 @click.argument(
     "filename", type=click.Path(file_okay=True, dir_okay=True, exists=True)
 )
@@ -50,18 +104,131 @@ CLI_CONFIG = config.CliConfig.from_yaml(PATH_TO_CONFIG)
     "--segment_size",
     prompt=True,
     default=CLI_CONFIG.segment_size,
-    type=int,
-    help="Size of segments written to output file in GB. Use 0 to write each chunk as one segment",
+    type=float,
+    help="Size of segments written to output file in GB, e.g. 0.25. Use 0 to write each chunk as one segment. `fixit tune` finds a size for your disks",
+)
+@click.option(
+    "--dry_run",
+    is_flag=True,
+    help="Only report output size, segments, peak memory and runtime of the correction",
+)
+@click.option(
+    "--ignore_free_space",
+    is_flag=True,
+    help="Warn instead of refusing to start if the corrected files do not fit onto the disk",
+)
+@click.option(
+    "--in_place",
+    is_flag=True,
+    help="Remove the duplicates from the input file itself instead of writing a corrected copy. Interrupted corrections are resumed, or restored by `fixit rollback`",
+)
+@click.option(
+    "--preserve_raw",
+    is_flag=True,
+    help="Write raw, unscaled values with the scaling properties of each channel instead of scaled values",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue interrupted corrections from their checkpoint and skip files that are already corrected",
 )
-def main(
+@click.option(
+    "--incremental",
+    "incremental_mode",
+    is_flag=True,
+    help="Only correct the values appended to growing files since the last call and append them to the corrected files",
+)
+@click.option(
+    "--archive",
+    "archive_codec",
+    type=click.Choice(archive.CODECS),
+    help="Write a chunked columnar archive with the given codec instead of a TDMS file",
+)
+@click.option(
+    "--scan_drift",
+    is_flag=True,
+    help="Scan the whole files for shifts of the pattern, e.g. after restarts of the acquisition, and correct each part with its own phase",
+)
+@click.option(
+    "--groups",
+    multiple=True,
+    help="Only correct the channels of these groups, separated by commas",
+)
+@click.option(
+    "--channels",
+    multiple=True,
+    help="Only correct these channels, given by name or as group/channel and separated by commas",
+)
+@click.option(
+    "--range",
+    "sample_range",
+    callback=parse_range,
+    help="Only correct the window START:END of the corrected samples, or of the seconds since the first sample like 600s:1200s",
+)
+@click.option(
+    "--overview",
+    "with_overview",
+    is_flag=True,
+    help="Store min/max overview pyramids next to each corrected file for fast plotting",
+)
+@click.option(
+    "--merge",
+    "merge_mode",
+    is_flag=True,
+    help="Correct the files of the folder FILENAME as one recording, whose pattern continues across the files, and merge them into one file",
+)
+@click.option(
+    "--catalog",
+    "catalog_path",
+    type=click.Path(file_okay=True, dir_okay=False),
+    help="Record the times of the corrected segments in this SQLite catalog, see `fixit find`",
+)
+@click.option(
+    "--drop_cache",
+    is_flag=True,
+    help="Drop read and written pages from the page cache and write the corrected files in batches, for files much larger than the memory",
+)
+@click.option(
+    "--shared",
+    "shared_mode",
+    is_flag=True,
+    help="Correct the folder FILENAME together with other fixit processes, e.g. on other machines, that are started with the same folder and output folder",
+)
+@click.option(
+    "--lease_timeout",
+    default=shared.LEASE_TIMEOUT,
+    type=float,
+    help="Seconds after which the files of a crashed process are taken over in the --shared mode",
+)
+def correct(
     recurrence_size: int,
     recurrence_distance: int,
     chunk_size: int,
     consistency_sample_size: int,
     output_file: str,
     filename: str,
-    segment_size: int,
+    segment_size: float,
+    dry_run: bool,
+    ignore_free_space: bool,
+    in_place: bool,
+    preserve_raw: bool,
+    resume: bool,
+    incremental_mode: bool,
+    archive_codec: Optional[str],
+    groups: Tuple[str, ...],
+    channels: Tuple[str, ...],
+    sample_range: Optional[Tuple[Optional[float], Optional[float], bool]],
+    scan_drift: bool,
+    with_overview: bool,
+    merge_mode: bool,
+    catalog_path: Optional[str],
+    drop_cache: bool,
+    shared_mode: bool,
+    lease_timeout: float,
 ):
+    """Corrects the TDMS file or folder FILENAME. Corrected files can be
+    checked later by `fixit verify`.
+    """
     meta = source.MetaData(
         recurrence_distance=recurrence_distance,
         recurrence_size=recurrence_size,
@@ -69,10 +236,160 @@ def main(
         consistency_sample_size=consistency_sample_size,
         segment_size=segment_size,
     )
-
-    fix.export_correct_data(
-        filename=filename, meta=meta, output_file=output_file
+    start, stop, in_seconds = sample_range or (None, None, False)
+    file_selection = source.Selection(
+        groups=split_names(groups),
+        channels=split_names(channels),
+        start=start,
+        stop=stop,
+        in_seconds=in_seconds,
     )
+    if (file_selection != source.Selection() or scan_drift) and (
+        in_place or incremental_mode
+    ):
+        raise click.UsageError(
+            "--groups, --channels, --range and --scan_drift can not be"
+            " combined with --in_place or --incremental"
+        )
+    if (with_overview or catalog_path or drop_cache) and (
+        in_place or incremental_mode or archive_codec
+    ):
+        raise click.UsageError(
+            "--overview, --catalog and --drop_cache can not be combined with"
+            " --in_place, --incremental or --archive"
+        )
+    if merge_mode and (
+        in_place
+        or incremental_mode
+        or archive_codec
+        or resume
+        or scan_drift
+        or catalog_path
+        or drop_cache
+        or file_selection != source.Selection()
+    ):
+        raise click.UsageError(
+            "--merge can not be combined with --in_place, --incremental,"
+            " --archive, --resume, --scan_drift, --catalog, --drop_cache or"
+            " a selection"
+        )
+    if merge_mode and not pathlib.Path(filename).is_dir():
+        raise click.UsageError("--merge needs a folder as FILENAME")
+    if shared_mode and (
+        in_place
+        or incremental_mode
+        or archive_codec
+        or merge_mode
+        or resume
+        or catalog_path
+    ):
+        raise click.UsageError(
+            "--shared can not be combined with --in_place, --incremental,"
+            " --archive, --merge, --resume or --catalog"
+        )
+    if shared_mode and not pathlib.Path(filename).is_dir():
+        raise click.UsageError("--shared needs a folder as FILENAME")
+    if dry_run and (in_place or incremental_mode or archive_codec):
+        raise click.UsageError(
+            "--dry_run can not be combined with --in_place, --incremental or"
+            " --archive"
+        )
+
+    if dry_run:
+        run_plan = plan.plan_run(
+            filename=filename,
+            meta=meta,
+            output_file=output_file,
+            with_calibration=True,
+            preserve_raw=preserve_raw,
+            file_selection=file_selection,
+            with_overview=with_overview,
+            merged=merge_mode,
+        )
+        print(plan.format_plan(run_plan))
+        return
+
+    if in_place:
+        inplace.correct_path_in_place(
+            filename=filename, meta=meta, ignore_free_space=ignore_free_space
+        )
+    elif incremental_mode:
+        # Only the values appended since the last call are written. A plan of
+        # the whole corrected files would overestimate the needed space by
+        # far, so the free space is not checked
+        incremental.correct_incrementally(
+            filename=filename,
+            meta=meta,
+            output_file=output_file,
+            preserve_raw=preserve_raw,
+        )
+    elif shared_mode:
+        # Other processes write into the output folder at the same time, so
+        # the free space is not checked
+        shared.export_correct_data(
+            filename=filename,
+            meta=meta,
+            output_file=output_file,
+            preserve_raw=preserve_raw,
+            file_selection=file_selection,
+            scan_drift=scan_drift,
+            with_overview=with_overview,
+            drop_cache=drop_cache,
+            lease_timeout=lease_timeout,
+        )
+    elif archive_codec is not None:
+        # The columns of an archive are at most as large as the values of the
+        # corrected TDMS files, even uncompressed, so the plan of these files
+        # is an upper bound of the needed space
+        run_plan = plan.plan_run(
+            filename=filename,
+            meta=meta,
+            output_file=output_file,
+            file_selection=file_selection,
+        )
+        plan.check_free_space(run_plan, warn_only=ignore_free_space)
+        archive.export_correct_data(
+            filename=filename,
+            meta=meta,
+            output_file=output_file,
+            codec=archive_codec,
+            file_selection=file_selection,
+            scan_drift=scan_drift,
+        )
+    else:
+        run_plan = plan.plan_run(
+            filename=filename,
+            meta=meta,
+            output_file=output_file,
+            preserve_raw=preserve_raw,
+            file_selection=file_selection,
+            with_overview=with_overview,
+            merged=merge_mode,
+        )
+        plan.check_free_space(run_plan, warn_only=ignore_free_space)
+        if merge_mode:
+            merge.export_correct_data(
+                filename=filename,
+                meta=meta,
+                output_file=output_file,
+                preserve_raw=preserve_raw,
+                with_overview=with_overview,
+            )
+        else:
+            fix.export_correct_data(
+                filename=filename,
+                meta=meta,
+                output_file=output_file,
+                preserve_raw=preserve_raw,
+                resume=resume,
+                file_selection=file_selection,
+                scan_drift=scan_drift,
+                with_overview=with_overview,
+                catalog_path=(
+                    pathlib.Path(catalog_path) if catalog_path else None
+                ),
+                drop_cache=drop_cache,
+            )
 
     CLI_CONFIG.update_config(
         recurrence_distance=recurrence_distance,
@@ -82,3 +399,134 @@ def main(
         segment_size=segment_size,
     )
     CLI_CONFIG.to_yaml(PATH_TO_CONFIG)
+
+
+@main.command()
+@click.argument(
+    "filenames",
+    nargs=-1,
+    required=True,
+    type=click.Path(file_okay=True, dir_okay=False, exists=True),
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=CLI_CONFIG.workers,
+    help="Number of channels read at the same time, all cores by default",
+)
+@click.option(
+    "--block_size",
+    type=int,
+    default=CLI_CONFIG.read_block_size,
+    help="Number of bytes read at once",
+)
+def verify(
+    filenames: Tuple[str, ...],
+    workers: Optional[int],
+    block_size: Optional[int],
+):
+    """Checks corrected files against their manifests"""
+    failed = False
+    for filename in filenames:
+        problems = manifest.verify(pathlib.Path(filename), workers, block_size)
+        for problem in problems:
+            print(f"{filename}: {problem}")
+        if not problems:
+            print(f"{filename}: OK")
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit(1)
+
+
+@main.command()
+@click.argument(
+    "filename", type=click.Path(file_okay=True, dir_okay=True, exists=True)
+)
+def rollback(filename: str):
+    """Restores the original TDMS file FILENAME, or the files of the folder
+    FILENAME, whose in-place correction was interrupted.
+    """
+    inplace.rollback_path_in_place(filename)
+
+
+@main.command()
+@click.argument(
+    "filename", type=click.Path(file_okay=True, dir_okay=True, exists=True)
+)
+def index(filename: str):
+    """Writes index files of a TDMS file or the TDMS files of a folder, so
+    they are opened faster by fixitfelix and other tools.
+    """
+    for tdms_file in tdms_index.index_files(filename):
+        print(f"Indexed {tdms_file}")
+
+
+def parse_time(text: str) -> catalog.Time:
+    """Returns seconds since the epoch or an ISO 8601 time as given"""
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+@main.command()
+@click.argument(
+    "catalog_path",
+    type=click.Path(file_okay=True, dir_okay=False, exists=True),
+)
+@click.argument("start")
+@click.argument("stop")
+@click.option(
+    "--channels",
+    multiple=True,
+    help="Only find these channels, given by name or as group/channel and separated by commas",
+)
+def find(catalog_path: str, start: str, stop: str, channels: Tuple[str, ...]):
+    """Lists the corrected values from START to STOP recorded in the catalog
+    CATALOG_PATH. Times are ISO 8601 times like 2024-05-14T14:02 in UTC or
+    seconds since the epoch.
+    """
+    for entry in catalog.find(
+        pathlib.Path(catalog_path),
+        parse_time(start),
+        parse_time(stop),
+        split_names(channels),
+    ):
+        print(
+            f"{entry.file} {entry.group}/{entry.channel}:"
+            f" {entry.samples} values from {entry.first_sample} in"
+            f" {len(entry.segment_positions)} segments"
+        )
+
+
+@main.command()
+@click.argument(
+    "filename", type=click.Path(file_okay=True, dir_okay=True, exists=True)
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    type=click.Path(file_okay=False, dir_okay=True, exists=True),
+    help="Folder the corrected files are written to, the folder of FILENAME by default",
+)
+@click.option(
+    "--calibration_bytes",
+    default=tuning.CALIBRATION_BYTES,
+    type=int,
+    help="Number of bytes read or written per measurement",
+)
+def tune(filename: str, output_dir: Optional[str], calibration_bytes: int):
+    """Measures how fast the TDMS file or folder FILENAME is read and the
+    corrected files are written, and stores the best segment size, read
+    block size and number of workers as defaults of later calls.
+    """
+    path = pathlib.Path(filename)
+    export_dir = pathlib.Path(output_dir) if output_dir else path.parent
+    result = tuning.tune(path, export_dir, calibration_bytes)
+    print(tuning.format_tuning(result))
+    CLI_CONFIG.update_tuning(
+        segment_size=result.segment_size,
+        read_block_size=result.read_block_size,
+        workers=result.workers,
+    )
+    CLI_CONFIG.to_yaml(PATH_TO_CONFIG)
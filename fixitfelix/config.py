@@ -11,7 +11,9 @@ class CliConfig:
     recurrence_size: Optional[int]
     chunk_size: Optional[int]
     consistency_sample_size: Optional[int]
-    segment_size: Optional[int]
+    segment_size: Optional[float]
+    read_block_size: Optional[int]
+    workers: Optional[int]
 
     def to_yaml(self, file_path: pathlib.Path) -> None:
         """Stores data from fields into yaml file at file_path"""
@@ -48,7 +50,7 @@ class CliConfig:
         recurrence_distance: int,
         chunk_size: int,
         consistency_sample_size: int,
-        segment_size: int,
+        segment_size: float,
     ) -> None:
         """Updates fields."""
         self.recurrence_size = recurrence_size
@@ -56,3 +58,11 @@ class CliConfig:
         self.chunk_size = chunk_size
         self.consistency_sample_size = consistency_sample_size
         self.segment_size = segment_size
+
+    def update_tuning(
+        self, segment_size: float, read_block_size: int, workers: int
+    ) -> None:
+        """Updates the fields found by a calibration of the disks."""
+        self.segment_size = segment_size
+        self.read_block_size = read_block_size
+        self.workers = workers
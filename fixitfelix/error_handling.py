@@ -1,5 +1,4 @@
 import enum
-import itertools
 import pathlib
 import tempfile
 from typing import List, Tuple
@@ -8,7 +7,7 @@ import nptdms
 import numpy as np
 import pandas as pd
 
-from fixitfelix import either, source, tdms_helpers
+from fixitfelix import either, selection, source, tdms_helpers, tdms_index
 
 
 class ErrorCode(enum.Enum):
@@ -24,6 +23,18 @@ class ErrorCode(enum.Enum):
     DIRPATH_EMPTY = enum.auto()
     PATH_NONEXISTENT = enum.auto()
     PATH_NOT_TDMS_OR_DIR = enum.auto()
+    NOT_ENOUGH_DISKSPACE = enum.auto()
+    INPLACE_NOT_POSSIBLE = enum.auto()
+    INPLACE_JOURNAL_EXISTS = enum.auto()
+    INPLACE_ROLLBACK_STARTED = enum.auto()
+    MULTIPLE_DAQMX_SCALERS = enum.auto()
+    INCREMENTAL_STATE_MISMATCH = enum.auto()
+    SELECTION_UNKNOWN = enum.auto()
+    SELECTION_EMPTY = enum.auto()
+    SELECTION_WITHOUT_TIME = enum.auto()
+    MERGE_CHANNELS_DIFFER = enum.auto()
+    LEASE_LOST = enum.auto()
+    CORRECTION_CANCELLED = enum.auto()
 
 
 ERROR_DESCRIPTIONS = {
@@ -38,6 +49,18 @@ ERROR_DESCRIPTIONS = {
     ErrorCode.DIRPATH_EMPTY: "Folder is empty",
     ErrorCode.PATH_NONEXISTENT: "File or folder does not exist",
     ErrorCode.PATH_NOT_TDMS_OR_DIR: "Input path is not a tdms file nor a folder",
+    ErrorCode.NOT_ENOUGH_DISKSPACE: "Not enough free disk space for the corrected data",
+    ErrorCode.INPLACE_NOT_POSSIBLE: "Layout of the file does not allow an in-place correction",
+    ErrorCode.INPLACE_JOURNAL_EXISTS: "An in-place correction of the file was interrupted, resume it or roll it back by `fixit rollback`",
+    ErrorCode.INPLACE_ROLLBACK_STARTED: "Rollback of the in-place correction was interrupted, continue it by `fixit rollback`",
+    ErrorCode.MULTIPLE_DAQMX_SCALERS: "Raw data of channels with several DAQmx scalers can not be preserved",
+    ErrorCode.INCREMENTAL_STATE_MISMATCH: "Source file or correction parameters changed since the last incremental correction",
+    ErrorCode.SELECTION_UNKNOWN: "Selected groups or channels do not exist in the file",
+    ErrorCode.SELECTION_EMPTY: "Selection contains no data",
+    ErrorCode.SELECTION_WITHOUT_TIME: "Selected channels have no common sample interval to select a time range",
+    ErrorCode.MERGE_CHANNELS_DIFFER: "Files to merge do not contain the same channels with the same data types",
+    ErrorCode.LEASE_LOST: "Another process took over the lease of the file",
+    ErrorCode.CORRECTION_CANCELLED: "Correction was cancelled",
 }
 
 # Check MetaData for consistency
@@ -115,7 +138,7 @@ def check_input_path(path: pathlib.Path) -> either.Either:
     """Checks if file at given path is a tdms file or a folder
     """
     try:
-        nptdms.TdmsFile.open(file=path)
+        tdms_index.open_tdms(path).close()
         return either.Right(path)
     except (FileNotFoundError, IsADirectoryError):
         if not path.is_dir():
@@ -138,7 +161,7 @@ def calculate_drop_indices(
     source_file: source.SourceFile,
 ) -> List[Tuple[int, int]]:
     """Calculates index positions of duplicates in file and returns them in the form of tuples
-    (offset, length)
+    (offset, length). The duplicates of each region follow its phase.
 
     This function is the counter part of
     fix.calculate_index_ranges_to_preserve and is only used in error handling.
@@ -149,62 +172,49 @@ def calculate_drop_indices(
     Returns:
     List of Chunk Indices that point to invalid data slices.
     """
-    len_data = tdms_helpers.get_maximum_array_size(source_file.tdms_operator)
     chunk_size = source_file.meta.chunk_size
     recurrence_size = source_file.meta.recurrence_size
+    period = chunk_size + recurrence_size
 
-    offsets = np.arange(chunk_size, len_data, chunk_size + recurrence_size)
-    lengths = [recurrence_size] * (len(offsets) - 1)
-    lengths.append(min(recurrence_size, len_data - offsets[-1]))
+    drop_indices = []
+    for region in selection.get_regions(source_file):
+        first = (
+            region.start + (region.phase + chunk_size - region.start) % period
+        )
+        offsets = np.arange(first, region.stop, period)
+        lengths = np.minimum(recurrence_size, region.stop - offsets)
+        drop_indices.extend(zip(offsets, lengths))
+    return drop_indices
 
-    return list(zip(offsets, lengths))
 
+def check_recurrences(
+    channels: List[nptdms.TdmsChannel],
+    delete_ranges: np.ndarray,
+    recurrence_distance: int,
+) -> bool:
+    """Checks whether the values at delete_ranges are copies of the values
+    recurrence_distance before them in all channels and whether at least one
+    of them is not part of a longer duplication.
 
-def check_for_correct_repetition(
-    source_file: source.SourceFile,
-) -> either.Either:
-    """Checks whether the meta data about the occurence of repetitions is valid
-    for the Tdms file, i.e. whether repetitons really occur at the desired
-    places.
+    Arguments:
+    channels: TDMS Channels that contain data
+    delete_ranges: Ranges of duplicates in the form (offset, length)
+    recurrence_distance: Distance from the duplicates to their origin
     """
-    # generate random test samples
-    delete_ranges = np.array(calculate_drop_indices(source_file))
-    number_samples_to_test = min(
-        source_file.meta.consistency_sample_size, len(delete_ranges)
-    )
-    # np.random.choice does only take 1d arrays, so we need this
-    # workaround by choosing 1d indices in range with len(delete_indices)
-    chosen_deletes = np.random.choice(
-        len(delete_ranges), number_samples_to_test, replace=False
-    )
-    delete_ranges = delete_ranges[chosen_deletes]
-
-    # prepare all tdms channels that contain data
-    all_channels = list(
-        itertools.chain.from_iterable(
-            [
-                [c for c in group.channels() if len(c) > 0]
-                for group in source_file.tdms_operator.groups()
-            ]
-        )
-    )
-
-    # test data of each test sample
-
     meta_data_suitable = False
 
     for (offset, length) in delete_ranges:
         # calculate indices of the duplicates origin
-        origin_offset = offset - source_file.meta.recurrence_distance
+        origin_offset = offset - recurrence_distance
 
         # extract origin and duplicate data and compare
         duplicate_data = [
             old_channel.read_data(offset=offset, length=length)
-            for old_channel in all_channels
+            for old_channel in channels
         ]
         origin_data = [
             old_channel.read_data(offset=origin_offset, length=length)
-            for old_channel in all_channels
+            for old_channel in channels
         ]
         if not np.array_equal(duplicate_data, origin_data):
             meta_data_suitable = False
@@ -213,20 +223,20 @@ def check_for_correct_repetition(
         # extract data points around the data above
         duplicate_front_values = [
             old_channel.read_data(offset=offset - 1, length=1)[0]
-            for old_channel in all_channels
+            for old_channel in channels
         ]
         duplicate_rear_values = [
             old_channel.read_data(offset=offset + length, length=1)[0]
-            for old_channel in all_channels
+            for old_channel in channels
         ]
 
         origin_front_values = [
             old_channel.read_data(offset=origin_offset - 1, length=1)[0]
-            for old_channel in all_channels
+            for old_channel in channels
         ]
         origin_rear_values = [
             old_channel.read_data(offset=origin_offset + length, length=1)[0]
-            for old_channel in all_channels
+            for old_channel in channels
         ]
         # check if they are not part of duplication
         if not (
@@ -235,7 +245,84 @@ def check_for_correct_repetition(
         ):
             meta_data_suitable = True
 
-    if not meta_data_suitable:
+    return meta_data_suitable
+
+
+def check_array_recurrences(samples: np.ndarray, meta: source.MetaData) -> bool:
+    """Checks all duplicates of samples at once like check_recurrences.
+
+    Arguments:
+    samples: Values with the samples along the first axis, e.g. one column
+        per channel
+    meta: MetaData that describes the duplicates
+    """
+    period = meta.chunk_size + meta.recurrence_size
+    offsets = np.arange(meta.chunk_size, len(samples), period)
+    # each tested duplicate needs a value before and after it
+    offsets = offsets[offsets + meta.recurrence_size < len(samples)]
+    if meta.recurrence_size == 0 or len(offsets) == 0:
+        return False
+    positions = offsets[:, np.newaxis] + np.arange(meta.recurrence_size)
+    origins = positions - meta.recurrence_distance
+    if not np.array_equal(samples[positions], samples[origins]):
+        return False
+
+    def equal_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return (a == b).reshape(len(a), -1).all(axis=1)
+
+    front_equal = equal_rows(samples[offsets - 1], samples[origins[:, 0] - 1])
+    rear_equal = equal_rows(
+        samples[offsets + meta.recurrence_size], samples[origins[:, -1] + 1],
+    )
+    # at least one duplicate is not part of a longer duplication
+    return bool(np.any(~(front_equal | rear_equal)))
+
+
+def check_for_correct_repetition(
+    source_file: source.SourceFile,
+) -> either.Either:
+    """Checks whether the meta data about the occurence of repetitions is valid
+    for the Tdms file, i.e. whether repetitons really occur at the desired
+    places.
+    """
+    # generate random test samples
+    delete_ranges = np.array(
+        calculate_drop_indices(source_file), dtype=np.int64
+    ).reshape(-1, 2)
+    # duplicates at the very end have no rear value to compare
+    len_data = tdms_helpers.get_maximum_array_size(source_file.tdms_operator)
+    delete_ranges = delete_ranges[delete_ranges.sum(axis=1) < len_data]
+    # nor do duplicates whose origin starts the data
+    delete_ranges = delete_ranges[
+        delete_ranges[:, 0] > source_file.meta.recurrence_distance
+    ]
+    # only the duplicates within and next to the selected window are tested
+    period = source_file.meta.chunk_size + source_file.meta.recurrence_size
+    raw_start, raw_stop = selection.get_raw_window(source_file)
+    delete_ranges = delete_ranges[
+        (delete_ranges[:, 0] >= raw_start - period)
+        & (delete_ranges[:, 0] < raw_stop + period)
+    ]
+    number_samples_to_test = min(
+        source_file.meta.consistency_sample_size, len(delete_ranges)
+    )
+    # np.random.choice does only take 1d arrays, so we need this
+    # workaround by choosing 1d indices in range with len(delete_indices)
+    chosen_deletes = np.random.choice(
+        len(delete_ranges), number_samples_to_test, replace=False
+    )
+    delete_ranges = delete_ranges[chosen_deletes]
+
+    # prepare all selected tdms channels that contain data
+    all_channels = [
+        channel for _, channel in selection.select_source_channels(source_file)
+    ]
+
+    # test data of each test sample
+
+    if not check_recurrences(
+        all_channels, delete_ranges, source_file.meta.recurrence_distance
+    ):
         return either.Left(ErrorCode.PARAMETERERROR)
     return either.Right(source_file)
 
@@ -248,6 +335,6 @@ def check_source_file(source_file: source.SourceFile) -> either.Either:
 def load_tdms_file(path: pathlib.Path) -> either.Either:
     """Tries to load the tdms file located at path and returns Either[ErrorCode,np.tdms.TdmsFile]"""
     try:
-        return either.Right(nptdms.TdmsFile.open(file=path))
+        return either.Right(tdms_index.open_tdms(path))
     except FileNotFoundError:
         return either.Left(ErrorCode.TDMSPATH_NONEXISTENT)
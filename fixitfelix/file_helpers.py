@@ -0,0 +1,28 @@
+import json
+import os
+import pathlib
+from typing import Any, Dict
+
+
+def write_json(path: pathlib.Path, content: Dict[str, Any]) -> None:
+    """Replaces the file at path atomically and durably by content"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open(mode="w") as f:
+        json.dump(content, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_durably(path: pathlib.Path, content: bytes) -> None:
+    """Writes content to the file at path and waits until it is on disk"""
+    with path.open(mode="wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def sync(f) -> None:
+    """Waits until everything written to the opened file f is on disk"""
+    f.flush()
+    os.fsync(f.fileno())
@@ -1,11 +1,40 @@
+import os
 import pathlib
-from typing import Any, Callable, List, Tuple
+import queue
+import shutil
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
 
 import nptdms
 import numpy as np
+import pandas as pd
 import tqdm
 
-from fixitfelix import either, error_handling, source, tdms_helpers
+from fixitfelix import (
+    catalog,
+    checkpoint,
+    either,
+    error_handling,
+    listeners,
+    manifest,
+    mapped_reader,
+    overview,
+    page_cache,
+    scanner,
+    segment_writer,
+    selection,
+    source,
+    tdms_helpers,
+    tdms_index,
+)
+
+# Number of checked files that wait for their export at most, which bounds
+# the number of open files in the directory mode
+MAX_PENDING_FILES = 4
+
+PARTIAL_SUFFIX = ".partial"
+
+PARTS_SUFFIX = ".fixit_parts"
 
 
 def calculate_index_ranges_to_preserve(
@@ -35,6 +64,135 @@ def calculate_index_ranges_to_preserve(
     return list(zip(offsets, lengths))
 
 
+def calculate_region_ranges(
+    chunk_size: int, recurrence_size: int, regions: List[source.Region]
+) -> List[Tuple[int, int]]:
+    """Calculates the index ranges of valid data of regions with different
+    phases, like calculate_index_ranges_to_preserve does for a single phase.
+
+    Returns:
+    List with array ranges in the form (offset, length)
+    """
+    period = chunk_size + recurrence_size
+    index_ranges = []
+    for region in regions:
+        first_chunk = region.start - (region.start - region.phase) % period
+        chunk_starts = np.arange(first_chunk, region.stop, period)
+        offsets = np.maximum(chunk_starts, region.start)
+        ends = np.minimum(chunk_starts + chunk_size, region.stop)
+        index_ranges.extend(
+            (int(offset), int(end - offset))
+            for offset, end in zip(offsets, ends)
+            if end > offset
+        )
+    return index_ranges
+
+
+def count_preserved_values(
+    chunk_size: int, recurrence_size: int, raw_position: int
+) -> int:
+    """Returns the number of valid values before raw_position, i.e. the
+    position in the corrected data that raw_position is mapped to.
+
+    Arguments:
+    chunk_size: Length of the valid data slices
+    recurrence_size: Length of the duplicated data slice
+    raw_position: Position in the initial data array
+    """
+    periods, phase = divmod(raw_position, chunk_size + recurrence_size)
+    return periods * chunk_size + min(phase, chunk_size)
+
+
+def calculate_preserve_mask(
+    chunk_size: int, recurrence_size: int, offset: int, length: int
+) -> np.ndarray:
+    """Returns a boolean mask of the valid values in the initial data slice
+    of the given offset and length.
+    """
+    positions = np.arange(offset, offset + length, dtype=np.int64)
+    return positions % (chunk_size + recurrence_size) < chunk_size
+
+
+def check_array(
+    samples: Callable[[], np.ndarray], meta: source.MetaData, check: bool
+) -> None:
+    """Raises an exception if meta is not consistent or, if check is set, if
+    the values returned by samples do not repeat as described by meta.
+    """
+    res = either.Right(meta) | error_handling.check_meta
+    if isinstance(res, either.Left):
+        raise Exception(error_handling.ERROR_DESCRIPTIONS.get(res._value))
+    if check and not error_handling.check_array_recurrences(samples(), meta):
+        raise Exception(
+            error_handling.ERROR_DESCRIPTIONS.get(
+                error_handling.ErrorCode.PARAMETERERROR
+            )
+        )
+
+
+def correct_array(
+    data: np.ndarray, meta: source.MetaData, axis: int = 0, check: bool = False
+) -> np.ndarray:
+    """Removes the duplicates from data that is already in memory.
+
+    The complete periods of chunk and recurrence are cut by a reshaped view
+    of data, so no index array is created and no Python loop runs over the
+    chunks.
+
+    Arguments:
+    data: Values of one channel or of many channels in a 2-D array
+    meta: MetaData dict that contains all information needed for correction.
+        consistency_sample_size and segment_size are not used.
+    axis: Axis of data along which the samples are ordered
+    check: Whether all duplicates are checked to be where meta expects them
+
+    Returns:
+    New array of the corrected values
+    """
+    samples = np.moveaxis(np.asarray(data), axis, 0)
+    check_array(lambda: samples, meta, check)
+    period = meta.chunk_size + meta.recurrence_size
+    periods = len(samples) // period
+    channel_shape = samples.shape[1:]
+    chunks = samples[: periods * period].reshape(
+        periods, period, *channel_shape
+    )[:, : meta.chunk_size]
+    corrected = np.concatenate(
+        [
+            chunks.reshape(periods * meta.chunk_size, *channel_shape),
+            samples[periods * period :][: meta.chunk_size],
+        ]
+    )
+    return np.moveaxis(corrected, 0, axis)
+
+
+def correct_dataframe(
+    df: pd.DataFrame, meta: source.MetaData, check: bool = False
+) -> pd.DataFrame:
+    """Removes the duplicates from the rows of a DataFrame, e.g. one returned
+    by nptdms.TdmsFile.as_dataframe.
+
+    The corrected rows get the first labels of the index, so a time index
+    keeps the time of each sample.
+
+    Arguments:
+    df: DataFrame with one row per sample and one column per channel
+    meta: MetaData dict that contains all information needed for correction.
+    check: Whether all duplicates are checked to be where meta expects them
+
+    Returns:
+    New DataFrame of the corrected rows
+    """
+    check_array(df.to_numpy, meta, check)
+    corrected = df.iloc[
+        calculate_preserve_mask(
+            meta.chunk_size, meta.recurrence_size, 0, len(df)
+        )
+    ]
+    corrected.index = df.index[: len(corrected)]
+    return corrected
+
+
 def prepare_data_correction(
     source_file: source.SourceFile,
 ) -> List[Tuple[int, int]]:
@@ -46,19 +204,36 @@ def prepare_data_correction(
     Returns:
     List of Chunk Indices that point to valid data slices.
     """
-    maximum_size = tdms_helpers.get_maximum_array_size(
-        source_file.tdms_operator
-    )
-    index_ranges = calculate_index_ranges_to_preserve(
-        source_file.meta.chunk_size,
-        source_file.meta.recurrence_size,
-        maximum_size,
+    if source_file.regions is not None:
+        index_ranges = calculate_region_ranges(
+            source_file.meta.chunk_size,
+            source_file.meta.recurrence_size,
+            source_file.regions,
+        )
+    else:
+        maximum_size = tdms_helpers.get_maximum_array_size(
+            source_file.tdms_operator
+        )
+        index_ranges = calculate_index_ranges_to_preserve(
+            source_file.meta.chunk_size,
+            source_file.meta.recurrence_size,
+            maximum_size,
+        )
+    file_selection = source_file.selection
+    if file_selection.start is None and file_selection.stop is None:
+        return index_ranges
+    return selection.restrict_index_ranges(
+        index_ranges, *selection.get_corrected_window(source_file)
     )
-    return index_ranges
+
+
+def select_channels(source_file: source.SourceFile) -> List[Tuple[Any, Any]]:
+    """Returns the selected channels with data together with their groups"""
+    return selection.select_source_channels(source_file)
 
 
 def combine_with_tdms(
-    tdms_path: pathlib.Path,
+    tdms_path: pathlib.Path, file_selection: Optional[source.Selection] = None
 ) -> Callable[[source.MetaData], either.Either]:
     """Returns a function which combines given MetaData with the TdmsFile located at tdms_path to
     a SourceFile object after
@@ -76,12 +251,48 @@ def combine_with_tdms(
 
     def _f(meta: source.MetaData) -> either.Either:
         return either.Right(
-            source.SourceFile(tdms_operator=tdms_operator._value, meta=meta)
+            source.SourceFile(
+                tdms_operator=tdms_operator._value,
+                meta=meta,
+                selection=file_selection,
+                mapped_file=mapped_reader.MappedFile(tdms_path),
+            )
         )
 
     return _f
 
 
+def select_groups(source_file: source.SourceFile) -> List[Any]:
+    """Returns the selected groups, whose properties are written"""
+    return [
+        group
+        for group in source_file.tdms_operator.groups()
+        if not source_file.selection.groups
+        or group.name in source_file.selection.groups
+    ]
+
+
+def check_selection(source_file: source.SourceFile) -> either.Either:
+    """Checks whether the selected groups and channels exist and whether the
+    selection contains data.
+    Return type is Either[error_handling.ErrorCode, source.SourceFile]"""
+    file_selection = source_file.selection
+    if selection.find_unknown_names(source_file.tdms_operator, file_selection):
+        return either.Left(error_handling.ErrorCode.SELECTION_UNKNOWN)
+    channels = select_channels(source_file)
+    if not channels:
+        return either.Left(error_handling.ErrorCode.SELECTION_EMPTY)
+    if (
+        file_selection.in_seconds
+        and selection.get_sample_interval([c for _, c in channels]) is None
+    ):
+        return either.Left(error_handling.ErrorCode.SELECTION_WITHOUT_TIME)
+    start, stop = selection.get_corrected_window(source_file)
+    if start == stop:
+        return either.Left(error_handling.ErrorCode.SELECTION_EMPTY)
+    return either.Right(source_file)
+
+
 def check_export_path(path: pathlib.Path,) -> either.Either:
     """It should not be possible to choose a nonexistent folder in the export
     path. This function checks if this is satisfied.
@@ -92,60 +303,271 @@ def check_export_path(path: pathlib.Path,) -> either.Either:
     return either.Right(path)
 
 
-def write_chunks_to_file(
-    tdms_writer: nptdms.TdmsWriter,
-    index_ranges: List[Tuple[int, int]],
+def calculate_segment_lengths(
+    index_ranges: List[Tuple[int, int]], itemsize: int, segment_size: float
+) -> List[int]:
+    """Calculates the number of values in each segment write_chunks_to_file
+    writes for one channel.
+
+    Arguments:
+    index_ranges: Chunk Indices that point to valid data slices
+    itemsize: Size of a single value of the channel in bytes
+    segment_size: Sets size of each segment written to a TDMS file
+
+    Returns:
+    List with the number of values per segment
+    """
+    lengths = np.array([length for (_, length) in index_ranges], dtype=np.int64)
+    # A segment is flushed as soon as its size exceeds segment_size
+    if np.all(lengths * itemsize > segment_size * 1_000_000_000):
+        return lengths.tolist()
+    ends = np.cumsum(lengths * itemsize)
+    segment_lengths = []
+    first = 0
+    while first < len(lengths):
+        before = ends[first - 1] if first > 0 else 0
+        last = int(
+            np.searchsorted(
+                ends, before + segment_size * 1_000_000_000, side="right"
+            )
+        )
+        last = min(last, len(lengths) - 1)
+        segment_lengths.append(int(lengths[first : last + 1].sum()))
+        first = last + 1
+    return segment_lengths
+
+
+def create_channel_object(
+    group, channel, data: np.ndarray, preserve_raw: bool = False
+) -> nptdms.ChannelObject:
+    """Creates the object written to the new file for data of channel.
+
+    Raw data keeps the properties of the channel, so readers still apply its
+    scaling.
+
+    Arguments:
+    group: TDMS Group inside the old tdms file
+    channel: TDMS Channel inside group
+    data: Corrected data to write
+    preserve_raw: Whether data is raw, unscaled data
+    """
+    if not preserve_raw:
+        return nptdms.ChannelObject(group.name, channel.name, data)
+    properties = dict(channel.properties)
+    for scale_id in channel.scaler_data_types or {}:
+        # Values of the DAQmx scaler are written as plain raw data, so the
+        # scale reading them has to pass the raw data through.
+        properties[f"NI_Scale[{scale_id}]_Scale_Type"] = "AdvancedAPI"
+    return nptdms.ChannelObject(group.name, channel.name, data, properties)
+
+
+def get_written_dtype(channel, preserve_raw: bool = False) -> np.dtype:
+    """Returns the type of the values written to the new file for channel"""
+    if not preserve_raw:
+        return channel.dtype
+    if channel.scaler_data_types:
+        check_single_scaler(channel)
+        (data_type,) = channel.scaler_data_types.values()
+        return np.dtype(data_type.nptype)
+    return channel.read_data(offset=0, length=0, scaled=False).dtype
+
+
+def check_single_scaler(channel) -> None:
+    """Raw DAQmx data can only be written for channels with one scaler"""
+    if channel.scaler_data_types and len(channel.scaler_data_types) > 1:
+        raise Exception(
+            error_handling.ERROR_DESCRIPTIONS.get(
+                error_handling.ErrorCode.MULTIPLE_DAQMX_SCALERS
+            )
+        )
+
+
+def read_chunk(
+    channel, offset: int, length: int, preserve_raw: bool = False
+) -> np.ndarray:
+    """Reads a data slice of channel, either scaled or as raw data.
+
+    Arguments:
+    channel: TDMS Channel to read from
+    offset: Position of the first value
+    length: Number of values
+    preserve_raw: Whether raw, unscaled data is read
+    """
+    if not preserve_raw:
+        return channel.read_data(offset=offset, length=length)
+    data = channel.read_data(offset=offset, length=length, scaled=False)
+    if isinstance(data, dict):
+        # DAQmx data is returned per scaler
+        check_single_scaler(channel)
+        (data,) = data.values()
+    return data
+
+
+def write_properties(
+    tdms_writer: segment_writer.IncrementalTdmsWriter,
+    tdms_operator,
+    groups: Optional[List[Any]] = None,
+) -> None:
+    """Writes the properties of the file and its groups, all groups if groups
+    is None, to the new file. Scalings of raw data may be defined there.
+    """
+    if groups is None:
+        groups = tdms_operator.groups()
+    tdms_writer.write_segment(
+        [nptdms.RootObject(dict(tdms_operator.properties))]
+        + [
+            nptdms.GroupObject(group.name, dict(group.properties))
+            for group in groups
+        ]
+    )
+
+
+def write_segment(
+    tdms_writer: segment_writer.IncrementalTdmsWriter,
     group,
     channel,
-    segment_size: int,
-):
-    """Writes correct data slice per slice to disk.
+    clean_data: List[np.ndarray],
+    ranges_done: int,
+    preserve_raw: bool = False,
+    export_listeners: Sequence[listeners.ExportListener] = (),
+) -> None:
+    """Writes data slices of channel as one segment and informs
+    export_listeners, that ranges_done index ranges of channel are written.
+    """
+    # A single slice is written without copying it
+    data = clean_data[0] if len(clean_data) == 1 else np.concatenate(clean_data)
+    for listener in export_listeners:
+        listener.segment_started(data)
+    new_channel = create_channel_object(group, channel, data, preserve_raw)
+    tdms_writer.write_segment([new_channel])
+    for listener in export_listeners:
+        listener.segment_written(data, ranges_done)
+
+
+def write_segments(
+    tdms_writer: segment_writer.IncrementalTdmsWriter,
+    chunks: Iterable[Tuple[int, np.ndarray]],
+    group,
+    channel,
+    segment_size: float,
+    preserve_raw: bool = False,
+    export_listeners: Sequence[listeners.ExportListener] = (),
+) -> None:
+    """Collects data slices of channel into segments of segment_size and
+    writes them to disk.
 
     Arguments:
     tdms_writer: Tdms handle for the new file
-    index_ranges: Chunk Indices that point to valid data slices
+    chunks: Data slices, each with the number of index ranges of the channel
+        that are written once the slice is written
     group: TDMS Group inside the old tdms file
     channel: TDMS Channel inside group
     segment_size: Sets size of each segment written to a TDMS file
+    preserve_raw: Whether raw, unscaled data is written
+    export_listeners: Are informed about each written segment
     """
-
     clean_data = []
     clean_data_nbytes = 0
-    for (offset, length) in tqdm.tqdm(index_ranges):
-        data = channel.read_data(offset=offset, length=length)
+    for ranges_done, data in chunks:
         clean_data.append(data)
         clean_data_nbytes += data.nbytes
         # When segment_size is reached, a new segment is written to file
         if clean_data_nbytes > segment_size * 1_000_000_000:
-            new_channel = nptdms.ChannelObject(
-                group.name, channel.name, np.concatenate(clean_data)
+            write_segment(
+                tdms_writer,
+                group,
+                channel,
+                clean_data,
+                ranges_done,
+                preserve_raw,
+                export_listeners,
             )
-            tdms_writer.write_segment([new_channel])
             clean_data = []
             clean_data_nbytes = 0
 
     # The remaining chunks are written to file as a last smaller segment
     if clean_data:
-        new_channel = nptdms.ChannelObject(
-            group.name, channel.name, np.concatenate(clean_data)
+        write_segment(
+            tdms_writer,
+            group,
+            channel,
+            clean_data,
+            ranges_done,
+            preserve_raw,
+            export_listeners,
+        )
+
+
+def write_chunks_to_file(
+    tdms_writer: segment_writer.IncrementalTdmsWriter,
+    index_ranges: List[Tuple[int, int]],
+    group,
+    channel,
+    segment_size: float,
+    preserve_raw: bool = False,
+    export_listeners: Sequence[listeners.ExportListener] = (),
+    start: int = 0,
+):
+    """Writes correct data slice per slice to disk.
+
+    Arguments:
+    tdms_writer: Tdms handle for the new file
+    index_ranges: Chunk Indices that point to valid data slices
+    group: TDMS Group inside the old tdms file
+    channel: TDMS Channel inside group
+    segment_size: Sets size of each segment written to a TDMS file
+    preserve_raw: Whether raw, unscaled data is written
+    export_listeners: Are informed about each written segment
+    start: Number of index ranges that are already written
+    """
+    chunks = (
+        (ranges_done, read_chunk(channel, offset, length, preserve_raw))
+        for ranges_done, (offset, length) in enumerate(
+            tqdm.tqdm(
+                index_ranges[start:], initial=start, total=len(index_ranges)
+            ),
+            start + 1,
         )
-        tdms_writer.write_segment([new_channel])
+    )
+    write_segments(
+        tdms_writer,
+        chunks,
+        group,
+        channel,
+        segment_size,
+        preserve_raw,
+        export_listeners,
+    )
 
 
-def preprocess(meta: source.MetaData, path: pathlib.Path) -> source.SourceFile:
+def preprocess(
+    meta: source.MetaData,
+    path: pathlib.Path,
+    file_selection: Optional[source.Selection] = None,
+    scan_drift: bool = False,
+) -> source.SourceFile:
 
     """Runs all consistency checks on given tdms file and meta data. All input parameters are checked for consistency.
     Moreover, the function raises an execption if MetaData and TdmsFile do not match.
+    Only the selected part of the file is checked.
 
     Arguments:
     meta: MetaData dict that contains all information needed for correction.
     path: Path to tdms file to check
+    file_selection: Part of the file to correct, the whole file if None
+    scan_drift: Whether the whole file is scanned for shifts of the phase of
+        the pattern instead of checking some samples of a single phase
     """
     res = (
         either.Right(meta)
         | error_handling.check_meta
-        | combine_with_tdms(path)
-        | error_handling.check_source_file
+        | combine_with_tdms(path, file_selection)
+        | check_selection
+        | (
+            scanner.scan_source_file
+            if scan_drift
+            else error_handling.check_source_file
+        )
     )
 
     if isinstance(res, either.Left):
@@ -154,55 +576,136 @@ def preprocess(meta: source.MetaData, path: pathlib.Path) -> source.SourceFile:
 
 
 def export_to_tmds(
-    meta: source.MetaData, source_file: Any, export_path: pathlib.Path
+    meta: source.MetaData,
+    source_file: Any,
+    export_path: pathlib.Path,
+    preserve_raw: bool = False,
+    resume: bool = False,
+    export_listeners: Sequence[listeners.ExportListener] = (),
+    with_overview: bool = False,
+    catalog_path: Optional[pathlib.Path] = None,
+    drop_cache: bool = False,
 ) -> None:
     """Exports the valid data slices into a new TDMS file on disk.
 
     Don't mind the nested for loops, the sizes of the iterators of the first
     and second stage are very small.
 
+    Progress is recorded in a checkpoint next to the new file, so an
+    interrupted export can be resumed. The checksums of the written data are
+    stored in a manifest and the meta data of all segments in an index file
+    next to the new file.
+
     Arguments:
     meta: meta data of source file
     source_file: Tdms file, that passed all consistency checks
     export_path: File path for the corrected TDMS file.
+    preserve_raw: Whether raw, unscaled data is written instead of scaled
+        data, keeping the data type and size of the source file.
+    resume: Whether to continue from the checkpoint of an interrupted export
+    export_listeners: Are informed about the written data
+    with_overview: Whether min/max overview pyramids of the written data are
+        stored next to the new file, see overview.read_overview
+    catalog_path: SQLite catalog the times of the written segments are
+        recorded in, see catalog.find
+    drop_cache: Whether the pages of the source and the corrected file are
+        dropped from the page cache once they are read or written, see
+        page_cache.CacheDropper
     """
 
     index_ranges = prepare_data_correction(source_file)
+    channels = select_channels(source_file)
+    description = checkpoint.describe_export(
+        meta, channels, index_ranges, preserve_raw
+    )
+    state = checkpoint.load(export_path, description) if resume else None
+    if state is None:
+        checkpoint.save(export_path, description, 0, 0, 0)
+        (first_channel, first_range, size) = (0, 0, 0)
+    else:
+        (first_channel, first_range, size) = state
 
-    with nptdms.TdmsWriter(export_path) as tdms_writer:
-        for group in source_file.tdms_operator.groups():
-            for channel in group.channels():
-                if len(channel) > 0:
-                    write_chunks_to_file(
-                        tdms_writer,
-                        index_ranges,
-                        group,
-                        channel,
-                        meta.segment_size,
+    with export_path.open(mode="r+b" if state else "wb") as f:
+        f.truncate(size)
+        f.seek(size)
+        # Sidecar files are complete before the checkpoint is removed
+        sidecar_writers: List[listeners.ExportListener] = [
+            manifest.ManifestWriter(
+                export_path,
+                f,
+                channels,
+                sum(length for (_, length) in index_ranges),
+                size,
+            ),
+            tdms_index.IndexWriter(f, export_path),
+        ]
+        if with_overview:
+            sidecar_writers.append(
+                overview.OverviewWriter(export_path, channels, size)
+            )
+        if catalog_path is not None:
+            sidecar_writers.append(
+                catalog.CatalogWriter(
+                    catalog_path,
+                    export_path,
+                    f,
+                    channels,
+                    selection.get_corrected_window(source_file)[0],
+                    size,
+                )
+            )
+        export_listeners = [
+            *sidecar_writers,
+            checkpoint.Checkpointer(f, export_path, description, first_channel),
+            *(
+                [
+                    page_cache.CacheDropper(
+                        f, source_file.mapped_file, index_ranges, size
                     )
+                ]
+                if drop_cache
+                else []
+            ),
+            *export_listeners,
+        ]
+        with segment_writer.IncrementalTdmsWriter(f) as tdms_writer:
+            if preserve_raw and size == 0:
+                write_properties(
+                    tdms_writer,
+                    source_file.tdms_operator,
+                    select_groups(source_file),
+                )
+            for number, (group, channel) in enumerate(channels):
+                if number < first_channel:
+                    continue
+                for listener in export_listeners:
+                    listener.channel_started(group, channel)
+                write_chunks_to_file(
+                    tdms_writer,
+                    index_ranges,
+                    group,
+                    channel,
+                    meta.segment_size,
+                    preserve_raw,
+                    export_listeners,
+                    start=first_range if number == first_channel else 0,
+                )
+                for listener in export_listeners:
+                    listener.channel_finished()
+        for listener in export_listeners:
+            listener.export_finished()
 
 
-def export_correct_data(
-    filename: str, meta: source.MetaData, output_file: str
-) -> None:
-    """Accepts either a path to a tdms file or to a folder with just tdms files to correct.
-    The name of the resulting folder or file is defined by output_file.
-    If output_file is empty, the name of the resulting file or folder is the previous name with '_corrected' as suffix.
-    All files in a folder will retain their previous name with '_corrected' suffix.
-    In case of a folder as input all tdms files are first checked for consistency so no file is corrected before each file is checked.
-    Afterwards all files are corrected and exported. This prevents cases where a later file is not valid for correction.
-    If a single file is given, the file is checked and corrected immediately.
+def determine_export_path(path: pathlib.Path, output_file: str) -> pathlib.Path:
+    """Checks the input path and returns the generalized export path, i.e. the
+    folder for a folder as input and the file name without suffix otherwise.
+    If output_file is empty, the name is the previous name with '_corrected'
+    as suffix.
 
     Arguments:
-    filename: Path to the tdms file or folder with tdms files to correct.
-    meta: MetaData dict that contains all information needed for correction.
+    path: Path to the tdms file or folder with tdms files to correct.
     output_file: File path for the corrected TDMS file or folder.
     """
-
-    # Determines generalized export path
-
-    path = pathlib.Path(filename)
-
     p = either.Right(path) | error_handling.check_input_path
     if isinstance(p, either.Left):
         raise Exception(error_handling.ERROR_DESCRIPTIONS.get(p._value))
@@ -217,41 +720,322 @@ def export_correct_data(
     if isinstance(p, either.Left):
         raise Exception(error_handling.ERROR_DESCRIPTIONS.get(p._value))
 
-    # Directory and single file are handled seperately
-
     if path.is_dir():
         p = either.Right(path) | error_handling.check_dir_empty
         if isinstance(p, either.Left):
             raise Exception(error_handling.ERROR_DESCRIPTIONS.get(p._value))
+    return export_path
 
-        if not export_path.exists():
-            export_path.mkdir()
 
-        # Checks each file in folder for consistency
+def list_export_paths(
+    path: pathlib.Path, export_path: pathlib.Path
+) -> List[Tuple[pathlib.Path, pathlib.Path]]:
+    """Returns pairs of each tdms file to correct and the path of its corrected
+    file. All files in a folder will retain their previous name with
+    '_corrected' suffix and are returned in the order of their paths.
+
+    Arguments:
+    path: Path to the tdms file or folder with tdms files to correct.
+    export_path: Generalized export path from determine_export_path
+    """
+    if path.is_dir():
+        return [
+            (
+                tdms_file,
+                export_path.joinpath(
+                    tdms_file.with_suffix("").name + "_corrected.tdms"
+                ),
+            )
+            for tdms_file in sorted(path.iterdir())
+            if not tdms_index.is_index_path(tdms_file)
+        ]
+    name = export_path.name + ".tdms"
+    return [(path, export_path.parent.joinpath(name))]
+
+
+def partial_path(export_path: pathlib.Path) -> pathlib.Path:
+    """Returns the path a corrected file is written to until all files of
+    its folder passed the consistency checks.
+    """
+    return export_path.with_name(export_path.name + PARTIAL_SUFFIX)
+
+
+def parts_path(export_path: pathlib.Path) -> pathlib.Path:
+    """Returns the path of the table of the files merged into the corrected
+    file at export_path, see merge.describe_parts
+    """
+    return export_path.parent / (export_path.name + PARTS_SUFFIX)
+
+
+def sidecar_paths(path: pathlib.Path) -> List[pathlib.Path]:
+    """Returns the paths of the files written next to a corrected file"""
+    return [
+        manifest.manifest_path(path),
+        tdms_index.index_path(path),
+        overview.overview_path(path),
+        parts_path(path),
+    ]
+
+
+def publish_partial(export_path: pathlib.Path) -> None:
+    """Renames the finished partial file of export_path and its sidecar files
+    to their final names. A folder at export_path, like an archive of an
+    earlier run, is replaced as a whole.
+    """
+    if export_path.is_dir():
+        shutil.rmtree(export_path)
+    os.replace(partial_path(export_path), export_path)
+    for partial_sidecar, sidecar in zip(
+        sidecar_paths(partial_path(export_path)), sidecar_paths(export_path)
+    ):
+        if partial_sidecar.exists():
+            os.replace(partial_sidecar, sidecar)
+
+
+def remove_partial(path: pathlib.Path) -> None:
+    """Removes a partial file or folder together with its sidecar files"""
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+    for sidecar_path in sidecar_paths(path):
+        if sidecar_path.exists():
+            sidecar_path.unlink()
+
+
+def check_files(
+    meta: source.MetaData,
+    export_paths: List[Tuple[pathlib.Path, pathlib.Path]],
+    pending: queue.Queue,
+    cancelled: threading.Event,
+    file_selection: Optional[source.Selection] = None,
+    scan_drift: bool = False,
+) -> None:
+    """Runs preprocess on each file and puts the SourceFile together with its
+    export path into pending. The end is marked by None, a failed check by
+    its exception.
+    """
+    try:
+        for i, (tdms_file, file_export_path) in enumerate(export_paths):
+            if cancelled.is_set():
+                break
+            print(
+                f"Preprocess file {i+1} of {len(export_paths)} at {tdms_file}"
+            )
+            source_file = preprocess(
+                meta=meta,
+                path=tdms_file,
+                file_selection=file_selection,
+                scan_drift=scan_drift,
+            )
+            pending.put((source_file, file_export_path))
+    except Exception as e:
+        pending.put(e)
+        return
+    pending.put(None)
+
+
+def close_pending(pending: queue.Queue) -> None:
+    """Closes the SourceFiles put into pending until its end"""
+    while True:
+        item = pending.get()
+        if item is None or isinstance(item, Exception):
+            return
+        item[0].tdms_operator.close()
+
+
+def export_directory(
+    meta: source.MetaData,
+    export_paths: List[Tuple[pathlib.Path, pathlib.Path]],
+    export_file: Callable[[source.SourceFile, pathlib.Path], None],
+    resume: bool = False,
+    file_selection: Optional[source.Selection] = None,
+    scan_drift: bool = False,
+) -> None:
+    """Checks and exports the files of a folder in a pipeline: While a file is
+    exported, the following files are checked in a second thread. The files
+    are exported to partial files, which are renamed to their export paths
+    only after every file passed the checks, so no corrected file appears
+    if any check fails.
+
+    Arguments:
+    meta: MetaData dict that contains all information needed for correction.
+    export_paths: Pairs of each tdms file to correct and its export path
+    export_file: Exports a checked file to the given path
+    resume: Whether finished partial files of an interrupted run are kept
+    file_selection: Part of each file to correct, the whole file if None
+    scan_drift: Whether the files are scanned for shifts of the pattern
+    """
+    pending: queue.Queue = queue.Queue(maxsize=MAX_PENDING_FILES)
+    cancelled = threading.Event()
+    checker = threading.Thread(
+        target=check_files,
+        args=(
+            meta,
+            export_paths,
+            pending,
+            cancelled,
+            file_selection,
+            scan_drift,
+        ),
+        daemon=True,
+    )
+    checker.start()
+
+    staged = []
+    checker_finished = False
+    try:
+        while True:
+            item = pending.get()
+            checker_finished = item is None or isinstance(item, Exception)
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                # The corrected files of a folder are only usable together
+                for file_export_path in staged:
+                    remove_partial(partial_path(file_export_path))
+                raise item
+            source_file, file_export_path = item
+            print(
+                f"Fix file {len(staged)+1} of {len(export_paths)}"
+                f" at {file_export_path}"
+            )
+            try:
+                if not (
+                    resume
+                    and checkpoint.is_finished(partial_path(file_export_path))
+                ):
+                    export_file(source_file, partial_path(file_export_path))
+            finally:
+                source_file.tdms_operator.close()
+            staged.append(file_export_path)
+    except BaseException:
+        cancelled.set()
+        if not checker_finished:
+            close_pending(pending)
+        raise
+    finally:
+        checker.join()
 
-        files_in_dir = len(list(path.iterdir()))
-        source_files = []
-        for i, tdms_file in enumerate(path.iterdir()):
-            print(f"Preprocess file {i+1} of {files_in_dir} at {tdms_file}")
-            source_files.append(preprocess(meta=meta, path=tdms_file))
+    for file_export_path in staged:
+        publish_partial(file_export_path)
 
-        # Corrects and exports each file in folder
 
-        for i, tdms_file in enumerate(path.iterdir()):
-            print(f"Fix file {i+1} of {files_in_dir} at {tdms_file}")
-            name = tdms_file.with_suffix("").name + "_corrected.tdms"
+def export_correct_data(
+    filename: str,
+    meta: source.MetaData,
+    output_file: str,
+    preserve_raw: bool = False,
+    resume: bool = False,
+    file_selection: Optional[source.Selection] = None,
+    scan_drift: bool = False,
+    with_overview: bool = False,
+    catalog_path: Optional[pathlib.Path] = None,
+    drop_cache: bool = False,
+) -> None:
+    """Accepts either a path to a tdms file or to a folder with just tdms files to correct.
+    The name of the resulting folder or file is defined by output_file.
+    If output_file is empty, the name of the resulting file or folder is the previous name with '_corrected' as suffix.
+    All files in a folder will retain their previous name with '_corrected' suffix.
+    In case of a folder as input the files are exported while the following files are checked for consistency, see export_directory.
+    No corrected file appears before each file is checked. This prevents cases where a later file is not valid for correction.
+    If a single file is given, the file is checked and corrected immediately.
+
+    Arguments:
+    filename: Path to the tdms file or folder with tdms files to correct.
+    meta: MetaData dict that contains all information needed for correction.
+    output_file: File path for the corrected TDMS file or folder.
+    preserve_raw: Whether raw, unscaled data is written instead of scaled data
+    resume: Whether interrupted exports are continued and finished corrected
+        files are skipped
+    file_selection: Groups, channels and window of each file to correct, the
+        whole file if None
+    scan_drift: Whether the files are scanned for shifts of the phase of the
+        pattern, e.g. after restarts of the acquisition
+    with_overview: Whether min/max overview pyramids are stored next to each
+        corrected file
+    catalog_path: SQLite catalog the times of the corrected files are
+        recorded in
+    drop_cache: Whether read and written pages are dropped from the page
+        cache, e.g. for files much larger than the memory
+    """
+
+    path = pathlib.Path(filename)
+    export_path = determine_export_path(path, output_file)
+
+    # Directory and single file are handled seperately
+
+    if path.is_dir():
+        if not export_path.exists():
+            export_path.mkdir()
+
+        export_paths = list_export_paths(path, export_path)
+        if resume:
+            export_paths = [
+                (tdms_file, file_export_path)
+                for (tdms_file, file_export_path) in export_paths
+                if not checkpoint.is_finished(file_export_path)
+            ]
+
+        def export_file(
+            source_file: source.SourceFile, file_export_path: pathlib.Path
+        ) -> None:
             export_to_tmds(
                 meta=meta,
-                source_file=source_files[i],
-                export_path=export_path.joinpath(name),
+                source_file=source_file,
+                export_path=file_export_path,
+                preserve_raw=preserve_raw,
+                resume=resume,
+                with_overview=with_overview,
+                catalog_path=catalog_path,
+                drop_cache=drop_cache,
+            )
+
+        try:
+            export_directory(
+                meta,
+                export_paths,
+                export_file,
+                resume,
+                file_selection,
+                scan_drift,
+            )
+        except BaseException:
+            if catalog_path is not None:
+                # Partial files that are kept can still be resumed
+                catalog.remove_files(
+                    catalog_path,
+                    [
+                        partial_path(p)
+                        for (_, p) in export_paths
+                        if not partial_path(p).exists()
+                    ],
+                )
+            raise
+        if catalog_path is not None:
+            catalog.rename_files(
+                catalog_path, [(partial_path(p), p) for (_, p) in export_paths],
             )
 
     else:
         # Single file case
 
-        name = export_path.name + ".tdms"
-        export_path = export_path.parent.joinpath(name)
-        source_file = preprocess(meta=meta, path=path)
+        ((_, export_path),) = list_export_paths(path, export_path)
+        if resume and checkpoint.is_finished(export_path):
+            return
+        source_file = preprocess(
+            meta=meta,
+            path=path,
+            file_selection=file_selection,
+            scan_drift=scan_drift,
+        )
         export_to_tmds(
-            meta=meta, source_file=source_file, export_path=export_path
+            meta=meta,
+            source_file=source_file,
+            export_path=export_path,
+            preserve_raw=preserve_raw,
+            resume=resume,
+            with_overview=with_overview,
+            catalog_path=catalog_path,
+            drop_cache=drop_cache,
         )
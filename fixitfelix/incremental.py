@@ -0,0 +1,290 @@
+"""Incremental correction of TDMS files that are still being written.
+
+A state file next to the corrected file records how many values of the
+source channels are already corrected and the phase of the next value within
+the chunk and recurrence period. Each refresh only reads the values appended
+since and appends their corrected values as new segments to the corrected
+file and their entries to its index file, so it costs time proportional to
+the new data only.
+"""
+import json
+import pathlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import nptdms
+import numpy as np
+
+from fixitfelix import (
+    either,
+    error_handling,
+    file_helpers,
+    fix,
+    segment_writer,
+    source,
+    tdms_index,
+)
+
+STATE_SUFFIX = ".fixit_state"
+
+
+def state_path(export_path: pathlib.Path) -> pathlib.Path:
+    return export_path.parent / (export_path.name + STATE_SUFFIX)
+
+
+def describe_correction(
+    meta: source.MetaData, channels: List[Tuple[Any, Any]], preserve_raw: bool
+) -> Dict[str, Any]:
+    """Returns what has to stay the same between two refreshes of a
+    corrected file.
+    """
+    return {
+        "chunk_size": meta.chunk_size,
+        "recurrence_size": meta.recurrence_size,
+        "recurrence_distance": meta.recurrence_distance,
+        "channels": [[group.name, channel.name] for group, channel in channels],
+        "preserve_raw": preserve_raw,
+    }
+
+
+def raise_state_mismatch() -> None:
+    raise Exception(
+        error_handling.ERROR_DESCRIPTIONS.get(
+            error_handling.ErrorCode.INCREMENTAL_STATE_MISMATCH
+        )
+    )
+
+
+def load_state(
+    export_path: pathlib.Path, description: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """Returns the state of the last refresh of the corrected file at
+    export_path or None if it was never corrected incrementally.
+    """
+    try:
+        with state_path(export_path).open() as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if {key: state.get(key) for key in description} != json.loads(
+        json.dumps(description)
+    ):
+        raise_state_mismatch()
+    if not export_path.exists() or export_path.stat().st_size < state["size"]:
+        raise_state_mismatch()
+    return state
+
+
+def save_state(
+    export_path: pathlib.Path,
+    description: Dict[str, Any],
+    meta: source.MetaData,
+    processed_samples: int,
+    size: int,
+    index_size: int,
+) -> None:
+    """Stores the state after a refresh.
+
+    Arguments:
+    export_path: File path of the corrected TDMS file
+    description: Description of the correction from describe_correction
+    meta: MetaData of the correction
+    processed_samples: Number of source values per channel that are corrected
+    size: Size of the corrected file in bytes
+    index_size: Size of the index file of the corrected file in bytes
+    """
+    file_helpers.write_json(
+        state_path(export_path),
+        {
+            **description,
+            "processed_samples": processed_samples,
+            "phase": processed_samples
+            % (meta.chunk_size + meta.recurrence_size),
+            "corrected_samples": fix.count_preserved_values(
+                meta.chunk_size, meta.recurrence_size, processed_samples
+            ),
+            "size": size,
+            "index_size": index_size,
+        },
+    )
+
+
+def update_index(
+    f, export_path: pathlib.Path, size: int, index_size: int
+) -> int:
+    """Appends the entries of the segments written from position size on to
+    the index file of the corrected file. The first index_size bytes of the
+    index file describe the file up to size. The whole index is written again
+    if they are missing.
+
+    Returns:
+    New size of the index file
+    """
+    path = tdms_index.index_path(export_path)
+    if not (index_size > 0 and path.exists()):
+        size, index_size = 0, 0
+    with path.open(mode="r+b" if index_size else "wb") as index_file:
+        index_file.truncate(index_size)
+        index_file.seek(index_size)
+        tdms_index.write_index(f, index_file, size)
+        file_helpers.sync(index_file)
+        return index_file.tell()
+
+
+def calculate_index_ranges_between(
+    chunk_size: int, recurrence_size: int, start: int, stop: int
+) -> List[Tuple[int, int]]:
+    """Calculates the index ranges of valid data between the source positions
+    start and stop.
+
+    Returns:
+    List with array ranges in the form (offset, length)
+    """
+    period = chunk_size + recurrence_size
+    index_ranges = []
+    for offset in range(start - start % period, stop, period):
+        first = max(offset, start)
+        last = min(offset + chunk_size, stop)
+        if first < last:
+            index_ranges.append((first, last - first))
+    return index_ranges
+
+
+def check_new_data(
+    channels: List[nptdms.TdmsChannel],
+    meta: source.MetaData,
+    start: int,
+    stop: int,
+) -> None:
+    """Checks the recurrences of the values appended between start and stop
+    and raises an exception if they do not occur as described by meta.
+    Nothing is checked if no complete recurrence was appended.
+    """
+    period = meta.chunk_size + meta.recurrence_size
+    offsets = np.arange(start - start % period + meta.chunk_size, stop, period)
+    # each tested duplicate needs a value before and after it
+    offsets = offsets[
+        (offsets >= start) & (offsets + meta.recurrence_size < stop)
+    ]
+    if meta.recurrence_size == 0 or len(offsets) == 0:
+        return
+    chosen = np.random.choice(
+        offsets, min(meta.consistency_sample_size, len(offsets)), replace=False,
+    )
+    delete_ranges = [(offset, meta.recurrence_size) for offset in chosen]
+    if not error_handling.check_recurrences(
+        channels, delete_ranges, meta.recurrence_distance
+    ):
+        raise Exception(
+            error_handling.ERROR_DESCRIPTIONS.get(
+                error_handling.ErrorCode.PARAMETERERROR
+            )
+        )
+
+
+def refresh_file(
+    source_path: pathlib.Path,
+    export_path: pathlib.Path,
+    meta: source.MetaData,
+    preserve_raw: bool = False,
+) -> int:
+    """Appends the corrected values of the values appended to the source file
+    since the last refresh to the corrected file.
+
+    Arguments:
+    source_path: Path to the growing tdms file
+    export_path: File path for the corrected TDMS file
+    meta: MetaData dict that contains all information needed for correction.
+    preserve_raw: Whether raw, unscaled data is written
+
+    Returns:
+    Number of newly corrected source values per channel
+    """
+    res = either.Right(meta) | error_handling.check_meta
+    if isinstance(res, either.Left):
+        raise Exception(error_handling.ERROR_DESCRIPTIONS.get(res._value))
+    tdms_operator = error_handling.load_tdms_file(path=source_path)
+    if isinstance(tdms_operator, either.Left):
+        raise Exception(
+            error_handling.ERROR_DESCRIPTIONS.get(tdms_operator._value)
+        )
+
+    with tdms_operator._value as tdms_file:
+        channels = [
+            (group, channel)
+            for group in tdms_file.groups()
+            for channel in group.channels()
+            if len(channel) > 0
+        ]
+        description = describe_correction(meta, channels, preserve_raw)
+        state = load_state(export_path, description)
+        processed = state["processed_samples"] if state else 0
+        # The acquisition may not have written all channels of the last
+        # segment yet
+        available = min((len(channel) for _, channel in channels), default=0)
+        if available < processed:
+            raise_state_mismatch()
+        if state is not None and available == processed:
+            return 0
+
+        check_new_data(
+            [channel for _, channel in channels], meta, processed, available
+        )
+        index_ranges = calculate_index_ranges_between(
+            meta.chunk_size, meta.recurrence_size, processed, available
+        )
+        with export_path.open(mode="r+b" if state else "w+b") as f:
+            size = state["size"] if state else 0
+            # Drops data of a refresh that was interrupted
+            f.truncate(size)
+            f.seek(size)
+            with segment_writer.IncrementalTdmsWriter(f) as tdms_writer:
+                if preserve_raw and state is None:
+                    fix.write_properties(tdms_writer, tdms_file)
+                for group, channel in channels:
+                    fix.write_chunks_to_file(
+                        tdms_writer,
+                        index_ranges,
+                        group,
+                        channel,
+                        meta.segment_size,
+                        preserve_raw,
+                    )
+            file_helpers.sync(f)
+            new_size = f.tell()
+            index_size = update_index(
+                f,
+                export_path,
+                size,
+                state.get("index_size", 0) if state else 0,
+            )
+            save_state(
+                export_path, description, meta, available, new_size, index_size
+            )
+    return available - processed
+
+
+def correct_incrementally(
+    filename: str,
+    meta: source.MetaData,
+    output_file: str,
+    preserve_raw: bool = False,
+) -> None:
+    """Corrects the values appended to a tdms file or to the tdms files of a
+    folder since the last call. Files that are new in the folder are
+    corrected completely.
+
+    Arguments:
+    filename: Path to the tdms file or folder with tdms files to correct.
+    meta: MetaData dict that contains all information needed for correction.
+    output_file: File path for the corrected TDMS file or folder.
+    preserve_raw: Whether raw, unscaled data is written
+    """
+    path = pathlib.Path(filename)
+    export_path = fix.determine_export_path(path, output_file)
+    if path.is_dir() and not export_path.exists():
+        export_path.mkdir()
+    for tdms_file, file_export_path in fix.list_export_paths(path, export_path):
+        new_samples = refresh_file(
+            tdms_file, file_export_path, meta, preserve_raw
+        )
+        print(f"Corrected {new_samples} new values per channel of {tdms_file}")
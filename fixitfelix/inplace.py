@@ -0,0 +1,589 @@
+"""Corrects a TDMS file in place instead of writing a corrected copy.
+
+The valid values of each segment are moved towards the front of the file,
+lead in and meta data of each segment are rewritten and the file is
+truncated in the end. As every rewritten segment is at most as large as the
+original one, data is never written behind the position that is read next.
+
+A journal folder next to the file holds the plan of all segments and the
+progress. A segment whose new position overlaps its own original position
+is stored in the journal before it is written, so an interrupted correction
+can always be resumed. The journal also holds the original lead in and meta
+data and the removed duplicates of each rewritten segment, so an interrupted
+correction can be rolled back at any point: the original segments are
+restored from the last to the first one, each from its rewritten segment and
+its removed bytes.
+"""
+import itertools
+import json
+import pathlib
+import shutil
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from fixitfelix import (
+    either,
+    error_handling,
+    file_helpers,
+    fix,
+    plan,
+    source,
+    tdms_index,
+    tdms_segments,
+)
+
+JOURNAL_SUFFIX = ".fixit_journal"
+
+# File of the journal with the removed bytes of all rewritten segments
+REMOVED_FILE = "removed.bin"
+
+
+class SegmentPlan(NamedTuple):
+    read_position: int
+    data_position: int
+    # Size of the original raw data of all chunks
+    data_size: int
+    write_position: int
+    # Lead in and meta data of the rewritten segment
+    header: bytes
+    interleaved: bool
+    # Per object with raw data: position of its first value in the channel,
+    # values per chunk, size of a value
+    objects: List[Tuple[int, int, int]]
+    new_length: int
+
+
+def journal_path(path: pathlib.Path) -> pathlib.Path:
+    return path.parent / (path.name + JOURNAL_SUFFIX)
+
+
+def raise_error(code: error_handling.ErrorCode) -> None:
+    raise Exception(error_handling.ERROR_DESCRIPTIONS.get(code))
+
+
+def check_segment_supported(segment: tdms_segments.Segment) -> None:
+    """Raises if the raw data of segment can not be compacted"""
+    if segment.toc & tdms_segments.TOC_DAQMX_RAW_DATA:
+        raise_error(error_handling.ErrorCode.INPLACE_NOT_POSSIBLE)
+    for segment_object in segment.data_objects:
+        if not segment_object.raw_data_index.fixed_size:
+            raise_error(error_handling.ErrorCode.INPLACE_NOT_POSSIBLE)
+    data_size = segment.end - segment.data_position
+    if data_size != segment.number_of_chunks * segment.chunk_size:
+        raise_error(error_handling.ErrorCode.INPLACE_NOT_POSSIBLE)
+
+
+def plan_compaction(
+    path: pathlib.Path, meta: source.MetaData
+) -> List[SegmentPlan]:
+    """Plans the new layout of all segments of the file at path.
+
+    Raises an exception if the file contains data that can not be compacted
+    or if a rewritten segment would not fit in front of the next segment.
+    """
+    plans = []
+    channel_positions: Dict[str, int] = {}
+    previous_objects: Optional[List[tdms_segments.SegmentObject]] = None
+    write_position = 0
+    with path.open(mode="rb") as f:
+        for segment in tdms_segments.read_segments(f):
+            check_segment_supported(segment)
+            endianness = segment.endianness
+
+            kept_values = {}
+            plan_objects = []
+            for segment_object in segment.data_objects:
+                raw_data_index = segment_object.raw_data_index
+                start = channel_positions.get(segment_object.path, 0)
+                number_of_values = (
+                    raw_data_index.number_of_values * segment.number_of_chunks
+                )
+                channel_positions[segment_object.path] = (
+                    start + number_of_values
+                )
+                kept_values[segment_object.path] = fix.count_preserved_values(
+                    meta.chunk_size,
+                    meta.recurrence_size,
+                    start + number_of_values,
+                ) - fix.count_preserved_values(
+                    meta.chunk_size, meta.recurrence_size, start
+                )
+                plan_objects.append(
+                    (
+                        start,
+                        raw_data_index.number_of_values,
+                        tdms_segments.TYPE_SIZES[raw_data_index.data_type],
+                    )
+                )
+
+            new_objects = []
+            for segment_object in segment.objects:
+                kept = kept_values.get(segment_object.path, 0)
+                raw_data_index = None
+                if kept > 0:
+                    raw_data_index = tdms_segments.RawDataIndex(
+                        segment_object.raw_data_index.data_type, kept
+                    )
+                new_objects.append(
+                    tdms_segments.SegmentObject(
+                        segment_object.path,
+                        raw_data_index,
+                        segment_object.property_bytes
+                        if segment_object.listed
+                        else b"",
+                    )
+                )
+            data_size = sum(
+                o.raw_data_index.data_size
+                for o in new_objects
+                if o.raw_data_index is not None
+            )
+
+            toc = segment.toc & tdms_segments.TOC_BIG_ENDIAN
+            if data_size > 0:
+                toc |= tdms_segments.TOC_RAW_DATA
+            # Segments repeating the previous objects need no meta data
+            if new_objects != previous_objects or any(
+                o.property_bytes for o in new_objects
+            ):
+                toc |= (
+                    tdms_segments.TOC_META_DATA | tdms_segments.TOC_NEW_OBJ_LIST
+                )
+                meta_data = tdms_segments.encode_meta_data(
+                    new_objects, endianness
+                )
+            else:
+                meta_data = b""
+            previous_objects = [
+                o._replace(property_bytes=b"") for o in new_objects
+            ]
+
+            header = (
+                tdms_segments.encode_lead_in(
+                    toc,
+                    segment.version,
+                    len(meta_data) + data_size,
+                    len(meta_data),
+                )
+                + meta_data
+            )
+            new_length = len(header) + data_size
+            if write_position + new_length > segment.end:
+                raise_error(error_handling.ErrorCode.INPLACE_NOT_POSSIBLE)
+            plans.append(
+                SegmentPlan(
+                    read_position=segment.position,
+                    data_position=segment.data_position,
+                    data_size=segment.number_of_chunks * segment.chunk_size,
+                    write_position=write_position,
+                    header=header,
+                    interleaved=segment.interleaved,
+                    objects=plan_objects,
+                    new_length=new_length,
+                )
+            )
+            write_position += new_length
+    return plans
+
+
+def count_chunks(plan: SegmentPlan) -> int:
+    """Returns the number of chunks of the original segment of plan"""
+    return plan.data_size // sum(
+        values * size for (_, values, size) in plan.objects
+    )
+
+
+def removed_size(plan: SegmentPlan) -> int:
+    """Returns the size of the original lead in, meta data and duplicates of
+    the segment of plan, which are removed by rewriting it
+    """
+    header_size = plan.data_position - plan.read_position
+    return header_size + plan.data_size - (plan.new_length - len(plan.header))
+
+
+def removed_positions(plans: List[SegmentPlan]) -> List[int]:
+    """Returns the position of the removed bytes of each segment in the
+    removed file of the journal, followed by the size of the file
+    """
+    return list(
+        itertools.accumulate([0] + [removed_size(plan) for plan in plans])
+    )
+
+
+def compact_segment(
+    f, plan: SegmentPlan, meta: source.MetaData
+) -> Tuple[bytes, bytes]:
+    """Reads the original segment of plan and returns the rewritten one and
+    the removed bytes: the original lead in and meta data, followed by the
+    duplicates of each object
+    """
+    f.seek(plan.read_position)
+    removed = [f.read(plan.data_position - plan.read_position)]
+    data = np.frombuffer(f.read(plan.data_size), dtype=np.uint8)
+    if plan.data_size == 0:
+        return plan.header, removed[0]
+    parts = [plan.header]
+    for (start, _, _), values in zip(
+        plan.objects,
+        tdms_segments.split_raw_data(
+            data,
+            [size for (_, _, size) in plan.objects],
+            [values for (_, values, _) in plan.objects],
+            plan.interleaved,
+        ),
+    ):
+        mask = fix.calculate_preserve_mask(
+            meta.chunk_size, meta.recurrence_size, start, len(values)
+        )
+        parts.append(np.ascontiguousarray(values[mask]).tobytes())
+        removed.append(np.ascontiguousarray(values[~mask]).tobytes())
+    return b"".join(parts), b"".join(removed)
+
+
+def restore_segment(
+    new_segment: bytes, removed: bytes, plan: SegmentPlan, meta: source.MetaData
+) -> bytes:
+    """Returns the original segment of plan, the inverse of compact_segment"""
+    header_size = plan.data_position - plan.read_position
+    if plan.data_size == 0:
+        return removed
+    number_of_chunks = count_chunks(plan)
+    kept_position = len(plan.header)
+    removed_position = header_size
+    object_values = []
+    for start, values_per_chunk, size in plan.objects:
+        mask = fix.calculate_preserve_mask(
+            meta.chunk_size,
+            meta.recurrence_size,
+            start,
+            number_of_chunks * values_per_chunk,
+        )
+        values = np.empty((len(mask), size), dtype=np.uint8)
+        kept = np.count_nonzero(mask) * size
+        values[mask] = np.frombuffer(
+            new_segment, np.uint8, kept, kept_position
+        ).reshape(-1, size)
+        values[~mask] = np.frombuffer(
+            removed, np.uint8, len(mask) * size - kept, removed_position
+        ).reshape(-1, size)
+        kept_position += kept
+        removed_position += len(mask) * size - kept
+        object_values.append(values)
+    return removed[:header_size] + tdms_segments.join_raw_data(
+        object_values, number_of_chunks, plan.interleaved
+    )
+
+
+def journal_size(plans: List[SegmentPlan]) -> int:
+    """Returns an upper bound of the size of the journal while the segments
+    of plans are rewritten: the removed bytes of all segments and the largest
+    rewritten segment
+    """
+    return removed_positions(plans)[-1] + max(
+        (p.new_length for p in plans), default=0
+    )
+
+
+def save_plan(
+    journal: pathlib.Path, plans: List[SegmentPlan], meta: source.MetaData
+) -> None:
+    journal.mkdir()
+    file_helpers.write_json(
+        journal / "plan.json",
+        {
+            "meta": meta._asdict(),
+            "segments": [
+                {**plan._asdict(), "header": plan.header.hex()}
+                for plan in plans
+            ],
+        },
+    )
+    (journal / REMOVED_FILE).touch()
+    file_helpers.write_json(
+        journal / "progress.json", {"segment": 0, "redo": False}
+    )
+
+
+def load_plan(
+    journal: pathlib.Path,
+) -> Tuple[List[SegmentPlan], source.MetaData]:
+    with (journal / "plan.json").open() as f:
+        content = json.load(f)
+    plans = [
+        SegmentPlan(
+            **{
+                **segment,
+                "header": bytes.fromhex(segment["header"]),
+                "objects": [tuple(o) for o in segment["objects"]],
+            }
+        )
+        for segment in content["segments"]
+    ]
+    return plans, source.MetaData(**content["meta"])
+
+
+def run_compaction(
+    path: pathlib.Path,
+    plans: List[SegmentPlan],
+    meta: source.MetaData,
+    first_segment: int,
+) -> None:
+    """Rewrites the segments from first_segment on and truncates the file.
+
+    The progress is only stored when the next write would overwrite original
+    data that a resumed run starting at the last stored segment still needs.
+    The removed bytes of all segments in front of the stored one are on disk
+    by then, so a rollback can restore them.
+    """
+    journal = journal_path(path)
+    checkpoint = first_segment
+    positions = removed_positions(plans)
+    with path.open(mode="r+b") as f, (journal / REMOVED_FILE).open(
+        mode="r+b"
+    ) as removed_file:
+        removed_file.seek(positions[first_segment])
+        removed_file.truncate()
+        for i in range(first_segment, len(plans)):
+            plan = plans[i]
+            write_end = plan.write_position + plan.new_length
+            new_segment, removed = compact_segment(f, plan, meta)
+            removed_file.write(removed)
+            checkpoint_position = plans[checkpoint].read_position
+            if i == first_segment or write_end > checkpoint_position:
+                redo = write_end > plan.read_position
+                file_helpers.sync(removed_file)
+                file_helpers.sync(f)
+                if redo:
+                    file_helpers.write_durably(
+                        journal / "redo.bin", new_segment
+                    )
+                file_helpers.write_json(
+                    journal / "progress.json", {"segment": i, "redo": redo}
+                )
+                checkpoint = i
+            f.seek(plan.write_position)
+            f.write(new_segment)
+        # The truncation removes original segments, so a rollback has to
+        # restore every segment from its rewritten one from now on
+        file_helpers.sync(removed_file)
+        file_helpers.sync(f)
+        file_helpers.write_json(
+            journal / "progress.json", {"segment": len(plans), "redo": False}
+        )
+        f.truncate(
+            plans[-1].write_position + plans[-1].new_length if plans else 0
+        )
+        file_helpers.sync(f)
+    tdms_index.write_index_file(path)
+    shutil.rmtree(journal)
+
+
+def correct_in_place(path: pathlib.Path, meta: source.MetaData) -> None:
+    """Checks the tdms file at path and removes the duplicated values from it
+    in place, without writing a corrected copy.
+
+    Arguments:
+    path: Path to the tdms file to correct
+    meta: MetaData dict that contains all information needed for correction.
+    """
+    path = pathlib.Path(path)
+    journal = journal_path(path)
+    if journal.exists():
+        raise_error(error_handling.ErrorCode.INPLACE_JOURNAL_EXISTS)
+
+    source_file = fix.preprocess(meta=meta, path=path)
+    source_file.tdms_operator.close()
+    start_compaction(path, plan_compaction(path, meta), meta)
+
+
+def start_compaction(
+    path: pathlib.Path, plans: List[SegmentPlan], meta: source.MetaData
+) -> None:
+    """Stores the journal and rewrites all segments of the file at path"""
+    journal = journal_path(path)
+    save_plan(journal, plans, meta)
+    # An index file would not match the rewritten segments anymore
+    if tdms_index.index_path(path).exists():
+        tdms_index.index_path(path).unlink()
+    run_compaction(path, plans, meta, first_segment=0)
+
+
+def load_progress(journal: pathlib.Path) -> Dict:
+    with (journal / "progress.json").open() as f:
+        return json.load(f)
+
+
+def write_redo(
+    path: pathlib.Path, journal: pathlib.Path, position: int
+) -> None:
+    """Writes the segment stored in the journal at position of the file at
+    path, as the original data there may already be partly overwritten
+    """
+    with path.open(mode="r+b") as f:
+        f.seek(position)
+        f.write((journal / "redo.bin").read_bytes())
+        file_helpers.sync(f)
+
+
+def finish_redo(path: pathlib.Path, plans: List[SegmentPlan]) -> int:
+    """Finishes the write of the segment of an interrupted in-place
+    correction of the file at path that was stored in the journal
+
+    Returns:
+    Number of the first segment that is not rewritten yet
+    """
+    journal = journal_path(path)
+    progress = load_progress(journal)
+    if progress.get("rollback", False):
+        raise_error(error_handling.ErrorCode.INPLACE_ROLLBACK_STARTED)
+    first_segment = progress["segment"]
+    if progress["redo"]:
+        write_redo(path, journal, plans[first_segment].write_position)
+        first_segment += 1
+        file_helpers.write_json(
+            journal / "progress.json",
+            {"segment": first_segment, "redo": False},
+        )
+    return first_segment
+
+
+def resume_in_place(path: pathlib.Path) -> None:
+    """Continues an interrupted in-place correction of the file at path"""
+    path = pathlib.Path(path)
+    plans, meta = load_plan(journal_path(path))
+    run_compaction(path, plans, meta, finish_redo(path, plans))
+
+
+def rollback_in_place(path: pathlib.Path) -> None:
+    """Restores the original file of an interrupted in-place correction of
+    the file at path and removes the journal.
+
+    The segments are restored from the last rewritten one to the first one,
+    as each original segment only overlaps rewritten segments behind it.
+    While restoring, the progress stores the first restored segment. An
+    original segment that overlaps its own rewritten segment is stored in the
+    journal before it is written.
+    """
+    path = pathlib.Path(path)
+    journal = journal_path(path)
+    plans, meta = load_plan(journal)
+    progress = load_progress(journal)
+    if progress.get("rollback", False):
+        restored = progress["segment"]
+        if progress["redo"]:
+            write_redo(path, journal, plans[restored].read_position)
+    else:
+        restored = finish_redo(path, plans)
+    file_helpers.write_json(
+        journal / "progress.json",
+        {"segment": restored, "redo": False, "rollback": True},
+    )
+
+    positions = removed_positions(plans)
+    with path.open(mode="r+b") as f, (journal / REMOVED_FILE).open(
+        mode="rb"
+    ) as removed_file:
+        for i in reversed(range(restored)):
+            plan = plans[i]
+            f.seek(plan.write_position)
+            new_segment = f.read(plan.new_length)
+            removed_file.seek(positions[i])
+            original = restore_segment(
+                new_segment,
+                removed_file.read(positions[i + 1] - positions[i]),
+                plan,
+                meta,
+            )
+            redo = plan.write_position + plan.new_length > plan.read_position
+            if redo:
+                file_helpers.write_durably(journal / "redo.bin", original)
+                file_helpers.write_json(
+                    journal / "progress.json",
+                    {"segment": i, "redo": True, "rollback": True},
+                )
+            f.seek(plan.read_position)
+            f.write(original)
+            file_helpers.sync(f)
+            file_helpers.write_json(
+                journal / "progress.json",
+                {"segment": i, "redo": False, "rollback": True},
+            )
+        f.truncate(
+            plans[-1].data_position + plans[-1].data_size if plans else 0
+        )
+        file_helpers.sync(f)
+    shutil.rmtree(journal)
+
+
+def list_tdms_files(path: pathlib.Path) -> List[pathlib.Path]:
+    """Returns path or the tdms files of the folder at path"""
+    if not path.is_dir():
+        return [path]
+    return [
+        f
+        for f in sorted(path.iterdir())
+        if not f.name.endswith(JOURNAL_SUFFIX)
+        and not tdms_index.is_index_path(f)
+    ]
+
+
+def correct_path_in_place(
+    filename: str, meta: source.MetaData, ignore_free_space: bool = False
+) -> None:
+    """Corrects a tdms file or all tdms files in a folder in place.
+
+    Interrupted corrections are resumed. All other files are checked for
+    consistency and the free space for their journals is checked before the
+    first file is modified.
+
+    Arguments:
+    filename: Path to the tdms file or folder with tdms files to correct.
+    meta: MetaData dict that contains all information needed for correction.
+    ignore_free_space: Warn instead of refusing to start if the journal of a
+        file does not fit onto the disk.
+    """
+    path = pathlib.Path(filename)
+    p = either.Right(path) | error_handling.check_input_path
+    if isinstance(p, either.Left):
+        raise Exception(error_handling.ERROR_DESCRIPTIONS.get(p._value))
+    tdms_files = list_tdms_files(path)
+
+    interrupted = [f for f in tdms_files if journal_path(f).exists()]
+    for tdms_file in interrupted:
+        print(f"Resume in-place correction of {tdms_file}")
+        resume_in_place(tdms_file)
+
+    remaining = [f for f in tdms_files if f not in interrupted]
+    plans = []
+    for i, tdms_file in enumerate(remaining):
+        print(f"Preprocess file {i+1} of {len(remaining)} at {tdms_file}")
+        source_file = fix.preprocess(meta=meta, path=tdms_file)
+        source_file.tdms_operator.close()
+        plans.append(plan_compaction(tdms_file, meta))
+    # The journal of a file is removed before the next file is rewritten
+    plan.check_space(
+        needed_bytes=max(
+            (journal_size(file_plans) for file_plans in plans), default=0
+        ),
+        free_bytes=plan.free_disk_space(path),
+        warn_only=ignore_free_space,
+    )
+
+    for i, (tdms_file, file_plans) in enumerate(zip(remaining, plans)):
+        print(f"Fix file {i+1} of {len(remaining)} in place at {tdms_file}")
+        start_compaction(tdms_file, file_plans, meta)
+
+
+def rollback_path_in_place(filename: str) -> None:
+    """Restores the original files of the interrupted in-place corrections of
+    a tdms file or of the tdms files in a folder.
+
+    Arguments:
+    filename: Path to the tdms file or folder with tdms files to restore.
+    """
+    path = pathlib.Path(filename)
+    for tdms_file in list_tdms_files(path):
+        if journal_path(tdms_file).exists():
+            print(f"Roll back in-place correction of {tdms_file}")
+            rollback_in_place(tdms_file)
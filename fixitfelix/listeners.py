@@ -0,0 +1,26 @@
+import numpy as np
+
+
+class ExportListener:
+    """Base class of objects that follow fix.export_to_tmds while it writes
+    the corrected data, e.g. to process the data while it is in memory.
+
+    All methods do nothing by default.
+    """
+
+    def channel_started(self, group, channel) -> None:
+        """Called before the first segment of channel is written"""
+
+    def segment_started(self, data: np.ndarray) -> None:
+        """Called before data is written as a segment of the current channel"""
+
+    def segment_written(self, data: np.ndarray, ranges_done: int) -> None:
+        """Called after data was written as a segment of the current channel.
+        ranges_done is the number of index ranges written for the channel.
+        """
+
+    def channel_finished(self) -> None:
+        """Called after the last segment of the current channel is written"""
+
+    def export_finished(self) -> None:
+        """Called after all channels are written"""
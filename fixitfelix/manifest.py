@@ -0,0 +1,310 @@
+"""Integrity manifests of corrected TDMS files.
+
+While fix.export_to_tmds writes a corrected file, the CRC32 checksum of each
+segment and each channel is computed from the data in memory and stored in a
+manifest next to the file, together with the expected number of values of
+each channel. Values that are encoded differently in the file, like strings
+and timestamps, are checksummed from the written segment instead. verify
+checks a corrected file against its manifest without redoing the correction.
+"""
+import concurrent.futures
+import json
+import os
+import pathlib
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from fixitfelix import file_helpers, listeners, tdms_index, tdms_segments
+
+MANIFEST_SUFFIX = ".fixit_manifest"
+
+# Size of the blocks read while checksums are verified
+READ_BLOCK_SIZE = 16_000_000
+
+
+def manifest_path(export_path: pathlib.Path) -> pathlib.Path:
+    return export_path.parent / (export_path.name + MANIFEST_SUFFIX)
+
+
+def object_path(group: str, channel: str) -> str:
+    """Returns the path of a channel inside TDMS meta data"""
+    return "".join(
+        "/'" + name.replace("'", "''") + "'" for name in (group, channel)
+    )
+
+
+def checksum(data: np.ndarray, value: int = 0) -> int:
+    """Continues the CRC32 checksum value with the little endian bytes of data,
+    as they are stored in a TDMS file.
+    """
+    data = np.ascontiguousarray(data, dtype=data.dtype.newbyteorder("<"))
+    return zlib.crc32(data.view(np.uint8), value)
+
+
+def is_stored_as_is(data: np.ndarray) -> bool:
+    """Whether the bytes of data in memory are the bytes stored in a TDMS
+    file, apart from their byte order
+    """
+    return data.dtype.kind in "biufc"
+
+
+def read_raw_data(path: pathlib.Path, position: int) -> bytes:
+    """Returns the raw data of the segment at position of the file at path"""
+    with path.open(mode="rb") as f:
+        _, next_segment_offset, raw_data_offset = tdms_index.read_lead_in(
+            f, position, b"TDSm"
+        )
+        f.seek(position + tdms_segments.LEAD_IN_SIZE + raw_data_offset)
+        return f.read(next_segment_offset - raw_data_offset)
+
+
+def estimate_size(
+    channels: List[Tuple[str, str]],
+    segment_lengths: List[List[int]],
+    expected_samples: int,
+    size: int,
+) -> int:
+    """Returns an upper bound of the size of the manifest of a corrected file
+    of size bytes in bytes.
+
+    Arguments:
+    channels: Names of the group and the channel of each written channel
+    segment_lengths: Number of values of each segment of each channel
+    expected_samples: Number of values of each channel after correction
+    size: Size of the corrected file
+    """
+    # Checksums are written with at most as many digits as the largest one
+    largest_crc = 0xFFFFFFFF
+    content = {
+        "size": size,
+        "channels": [
+            {
+                "group": group,
+                "channel": channel,
+                "samples": sum(lengths),
+                "crc32": largest_crc,
+                "segments": [
+                    {"samples": length, "crc32": largest_crc}
+                    for length in lengths
+                ],
+                "expected_samples": expected_samples,
+            }
+            for (group, channel), lengths in zip(channels, segment_lengths)
+        ],
+    }
+    return len(json.dumps(content).encode())
+
+
+def read_channel_segments(
+    path: pathlib.Path, size: Optional[int] = None
+) -> Dict[str, List[tdms_segments.Segment]]:
+    """Returns the segments of a corrected file that end before size by the
+    path of the channel they contain.
+    """
+    segments: Dict[str, List[tdms_segments.Segment]] = {}
+    with path.open(mode="rb") as f:
+        for segment in tdms_segments.read_segments(f):
+            if size is not None and segment.end > size:
+                break
+            for o in segment.data_objects:
+                segments.setdefault(o.path, []).append(segment)
+    return segments
+
+
+def check_segment_layout(segment: tdms_segments.Segment) -> None:
+    if segment.interleaved or len(segment.data_objects) != 1:
+        raise ValueError(
+            f"Segment at {segment.position} does not contain exactly one"
+            " channel"
+        )
+
+
+def checksum_segments(
+    path: pathlib.Path,
+    segments: List[tdms_segments.Segment],
+    block_size: int = READ_BLOCK_SIZE,
+) -> Tuple[int, List[Dict[str, int]]]:
+    """Reads the segments of one channel in blocks of block_size bytes.
+
+    Returns:
+    CRC32 checksum of the channel and number of values and CRC32 checksum of
+    each segment
+    """
+    channel_crc = 0
+    entries = []
+    with path.open(mode="rb") as f:
+        for segment in segments:
+            check_segment_layout(segment)
+            (data_object,) = segment.data_objects
+            size = segment.number_of_chunks * segment.chunk_size
+            f.seek(segment.data_position)
+            segment_crc = 0
+            while size > 0:
+                block = f.read(min(size, block_size))
+                if not block:
+                    raise ValueError(f"Segment at {segment.position} is cut")
+                size -= len(block)
+                segment_crc = zlib.crc32(block, segment_crc)
+                channel_crc = zlib.crc32(block, channel_crc)
+            entries.append(
+                {
+                    "samples": segment.number_of_chunks
+                    * data_object.raw_data_index.number_of_values,
+                    "crc32": segment_crc,
+                }
+            )
+    return channel_crc, entries
+
+
+class ManifestWriter(listeners.ExportListener):
+    """Computes the checksums of the data written by fix.export_to_tmds and
+    writes the manifest when the export is finished.
+
+    Arguments:
+    export_path: File path of the corrected TDMS file
+    f: Opened corrected file
+    channels: Groups and channels that are exported
+    expected_samples: Number of values of each channel after correction
+    size: Size of the corrected file an interrupted export continues at
+    """
+
+    def __init__(
+        self,
+        export_path: pathlib.Path,
+        f,
+        channels: List[Tuple[Any, Any]],
+        expected_samples: int,
+        size: int = 0,
+    ):
+        self.export_path = export_path
+        self.f = f
+        self.expected_samples = expected_samples
+        self.channels = {
+            object_path(group.name, channel.name): {
+                "group": group.name,
+                "channel": channel.name,
+                "samples": 0,
+                "crc32": 0,
+                "segments": [],
+            }
+            for group, channel in channels
+        }
+        self.current: Dict[str, Any] = {}
+        # Position of the next segment
+        self.position = size
+        if size > 0:
+            # Checksums of segments written before the export was interrupted
+            segments = read_channel_segments(export_path, size)
+            for path, channel_segments in segments.items():
+                channel_crc, entries = checksum_segments(
+                    export_path, channel_segments
+                )
+                self.channels[path].update(
+                    samples=sum(e["samples"] for e in entries),
+                    crc32=channel_crc,
+                    segments=entries,
+                )
+
+    def channel_started(self, group, channel) -> None:
+        self.current = self.channels[object_path(group.name, channel.name)]
+        self.position = self.f.tell()
+
+    def segment_written(self, data: np.ndarray, ranges_done: int) -> None:
+        if is_stored_as_is(data):
+            segment_crc = checksum(data)
+            self.current["crc32"] = checksum(data, self.current["crc32"])
+        else:
+            self.f.flush()
+            raw_data = read_raw_data(self.export_path, self.position)
+            segment_crc = zlib.crc32(raw_data)
+            self.current["crc32"] = zlib.crc32(raw_data, self.current["crc32"])
+        self.current["samples"] += len(data)
+        self.current["segments"].append(
+            {"samples": len(data), "crc32": segment_crc}
+        )
+        self.position = self.f.tell()
+
+    def export_finished(self) -> None:
+        self.f.flush()
+        file_helpers.write_json(
+            manifest_path(self.export_path),
+            {
+                "size": self.f.tell(),
+                "channels": [
+                    {**c, "expected_samples": self.expected_samples}
+                    for c in self.channels.values()
+                ],
+            },
+        )
+
+
+def verify(
+    export_path: pathlib.Path,
+    workers: Optional[int] = None,
+    block_size: Optional[int] = None,
+) -> List[str]:
+    """Checks a corrected file against its manifest. The channels are read in
+    parallel, each of them block by block.
+
+    Arguments:
+    export_path: File path of the corrected TDMS file
+    workers: Number of channels read at the same time, all cores by default
+    block_size: Bytes read at once, READ_BLOCK_SIZE by default
+
+    Returns:
+    Descriptions of all differences, empty if the file is intact
+    """
+    with manifest_path(export_path).open() as f:
+        manifest = json.load(f)
+    problems = []
+    if export_path.stat().st_size != manifest["size"]:
+        problems.append(
+            f"File size is {export_path.stat().st_size} instead of"
+            f" {manifest['size']}"
+        )
+    try:
+        segments = read_channel_segments(export_path)
+    except (ValueError, KeyError) as e:
+        return problems + [f"Segments can not be read: {e}"]
+
+    channels = manifest["channels"]
+    for c in channels:
+        if c["samples"] != c["expected_samples"]:
+            problems.append(
+                f"{c['group']}/{c['channel']}: {c['samples']} values written,"
+                f" {c['expected_samples']} expected"
+            )
+    with concurrent.futures.ThreadPoolExecutor(
+        workers or os.cpu_count() or 1
+    ) as executor:
+        futures = [
+            executor.submit(
+                checksum_segments,
+                export_path,
+                segments.get(object_path(c["group"], c["channel"]), []),
+                block_size or READ_BLOCK_SIZE,
+            )
+            for c in channels
+        ]
+        for c, future in zip(channels, futures):
+            name = f"{c['group']}/{c['channel']}"
+            try:
+                channel_crc, entries = future.result()
+            except ValueError as e:
+                problems.append(f"{name}: {e}")
+                continue
+            if len(entries) != len(c["segments"]):
+                problems.append(
+                    f"{name}: {len(entries)} segments instead of"
+                    f" {len(c['segments'])}"
+                )
+            for number, (entry, expected) in enumerate(
+                zip(entries, c["segments"])
+            ):
+                if entry != expected:
+                    problems.append(f"{name}: segment {number} differs")
+            if channel_crc != c["crc32"]:
+                problems.append(f"{name}: checksum differs")
+    return problems
@@ -0,0 +1,239 @@
+"""Zero-copy reads of the raw data of TDMS files.
+
+nptdms allocates a new array and copies the values on every read_data call.
+For channels without scaling, whose values lie in segments that are not
+interleaved, the values are already stored as plain arrays in the file. The
+file is memory mapped once and each such run of values becomes a piece of
+the channel. Reads within one piece return a view of the mapped file, reads
+across pieces only concatenate the views. Channels whose layout can not be
+mapped, e.g. interleaved, DAQmx, string or scaled data, are read by nptdms.
+"""
+import mmap
+import pathlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import nptdms
+import nptdms.scaling
+import numpy as np
+
+from fixitfelix import tdms_index, tdms_segments
+
+
+class ChannelPieces(NamedTuple):
+    # Number of the first value of each piece within the channel
+    starts: np.ndarray
+    # Number of values of each piece
+    lengths: np.ndarray
+    # Position of the first value of each piece in the file
+    positions: np.ndarray
+    dtype: np.dtype
+
+
+def read_file_segments(path: pathlib.Path) -> List[tdms_segments.Segment]:
+    """Returns the segments of the TDMS file at path. Their meta data is read
+    from the index file if it describes the whole file.
+    """
+    if not tdms_index.has_valid_index(path):
+        with path.open(mode="rb") as f:
+            return list(tdms_segments.read_segments(f))
+    segments = []
+    position = 0
+    with tdms_index.index_path(path).open(mode="rb") as f:
+        for segment in tdms_segments.read_segments(f, is_index_file=True):
+            # Positions of the index file are replaced by those of the file
+            segment = segment._replace(position=position)
+            segments.append(segment)
+            position = segment.end
+    return segments
+
+
+def collect_pieces(
+    segments: List[tdms_segments.Segment],
+) -> Dict[str, Optional[ChannelPieces]]:
+    """Returns the pieces of the values of each channel in the segments,
+    None for channels with a layout that can not be mapped.
+    """
+    positions: Dict[str, List[np.ndarray]] = {}
+    lengths: Dict[str, List[np.ndarray]] = {}
+    dtypes: Dict[str, set] = {}
+    unmappable = set()
+    for segment in segments:
+        data_objects = segment.data_objects
+        object_offset = 0
+        for o in data_objects:
+            index = o.raw_data_index
+            if (
+                segment.interleaved
+                or index.data_type not in tdms_segments.NUMPY_TYPES
+            ):
+                unmappable.add(o.path)
+            elif len(data_objects) == 1:
+                # The chunks of a single channel follow each other
+                positions.setdefault(o.path, []).append(
+                    np.array([segment.data_position])
+                )
+                lengths.setdefault(o.path, []).append(
+                    np.array(
+                        [index.number_of_values * segment.number_of_chunks]
+                    )
+                )
+            else:
+                chunks = np.arange(segment.number_of_chunks, dtype=np.int64)
+                positions.setdefault(o.path, []).append(
+                    segment.data_position
+                    + object_offset
+                    + chunks * segment.chunk_size
+                )
+                lengths.setdefault(o.path, []).append(
+                    np.full(len(chunks), index.number_of_values)
+                )
+            dtypes.setdefault(o.path, set()).add(
+                np.dtype(
+                    tdms_segments.NUMPY_TYPES.get(index.data_type, "V1")
+                ).newbyteorder(segment.endianness)
+            )
+            object_offset += index.data_size
+
+    result: Dict[str, Optional[ChannelPieces]] = {}
+    for path in dtypes:
+        if path in unmappable or len(dtypes[path]) != 1:
+            result[path] = None
+            continue
+        channel_lengths = np.concatenate(lengths[path]).astype(np.int64)
+        (dtype,) = dtypes[path]
+        result[path] = ChannelPieces(
+            starts=np.cumsum(channel_lengths) - channel_lengths,
+            lengths=channel_lengths,
+            positions=np.concatenate(positions[path]).astype(np.int64),
+            dtype=dtype,
+        )
+    return result
+
+
+def is_unscaled(tdms_operator, group, channel) -> bool:
+    """Whether the values of channel are returned by nptdms as stored"""
+    return (
+        nptdms.scaling.get_scaling(
+            channel.properties, group.properties, tdms_operator.properties
+        )
+        is None
+    )
+
+
+class MappedChannel:
+    """Reads the values of a TDMS channel as views of the memory mapped file.
+    Everything else is passed to the nptdms channel.
+
+    Arguments:
+    channel: TDMS Channel that is mapped
+    data: Memory mapped bytes of the file
+    pieces: Pieces of the values of channel
+    unscaled: Whether the scaled values of channel equal its raw values
+    """
+
+    def __init__(
+        self, channel, data: np.ndarray, pieces: ChannelPieces, unscaled: bool
+    ):
+        self.channel = channel
+        self.data = data
+        self.pieces = pieces
+        self.unscaled = unscaled
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.channel, name)
+
+    def __len__(self) -> int:
+        return len(self.channel)
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.channel[index]
+
+    def read_piece(self, number: int, start: int, stop: int) -> np.ndarray:
+        """Returns a view of the values start to stop of a piece"""
+        itemsize = self.pieces.dtype.itemsize
+        position = self.pieces.positions[number] + start * itemsize
+        end = position + (stop - start) * itemsize
+        return self.data[position:end].view(self.pieces.dtype)
+
+    def read_data(
+        self,
+        offset: int = 0,
+        length: Optional[int] = None,
+        scaled: bool = True,
+    ) -> np.ndarray:
+        """Reads values like nptdms.TdmsChannel.read_data. Values within one
+        piece are not copied.
+        """
+        if scaled and not self.unscaled:
+            return self.channel.read_data(offset, length, scaled)
+        stop = len(self)
+        if length is not None:
+            stop = min(offset + length, stop)
+        offset = min(offset, stop)
+        starts = self.pieces.starts
+        first = max(int(np.searchsorted(starts, offset, side="right")) - 1, 0)
+        last = max(int(np.searchsorted(starts, stop, side="left")), first + 1)
+        views = [
+            self.read_piece(
+                number,
+                max(offset - starts[number], 0),
+                min(stop - starts[number], self.pieces.lengths[number]),
+            )
+            for number in range(first, last)
+        ]
+        if len(views) == 1:
+            return views[0]
+        return np.concatenate(views)
+
+
+class MappedFile:
+    """Memory maps a TDMS file on first use and replaces its channels by
+    MappedChannels where possible.
+
+    Arguments:
+    path: Path of the TDMS file
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.pieces: Optional[Dict[str, Optional[ChannelPieces]]] = None
+        self.mapping: Optional[mmap.mmap] = None
+        self.data: Optional[np.ndarray] = None
+        self.channels: Dict[str, Any] = {}
+
+    def map_channel(self, tdms_operator, group, channel) -> Any:
+        if self.pieces is None:
+            self.pieces = collect_pieces(read_file_segments(self.path))
+        pieces = self.pieces.get(channel.path)
+        if (
+            pieces is None
+            or int(pieces.lengths.sum()) != len(channel)
+            or pieces.dtype.newbyteorder("=")
+            != channel.read_data(offset=0, length=0, scaled=False).dtype
+        ):
+            return channel
+        if self.data is None:
+            with self.path.open(mode="rb") as f:
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = np.frombuffer(self.mapping, dtype=np.uint8)
+        return MappedChannel(
+            channel,
+            self.data,
+            pieces,
+            is_unscaled(tdms_operator, group, channel),
+        )
+
+    def map_channels(
+        self, tdms_operator, channels: List[Tuple[Any, Any]]
+    ) -> List[Tuple[Any, Any]]:
+        """Returns channels with each channel replaced by its MappedChannel if
+        its values can be mapped.
+        """
+        mapped = []
+        for group, channel in channels:
+            if channel.path not in self.channels:
+                self.channels[channel.path] = self.map_channel(
+                    tdms_operator, group, channel
+                )
+            mapped.append((group, self.channels[channel.path]))
+        return mapped
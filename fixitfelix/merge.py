@@ -0,0 +1,385 @@
+"""Correction of a folder of consecutive TDMS files into one merged file.
+
+Acquisition software often splits a recording into many consecutive files.
+Their values are treated as one recording: the chunk and recurrence pattern
+continues across the borders of the files, so each file is corrected with
+the phase of its first value within the recording. The corrected values of
+all files are written channel by channel into one TDMS file, whose segments
+span the borders of the files. A table of the files and the positions of
+their corrected values is stored in `<file>.fixit_parts` next to it. Each
+file is closed after its check and opened again while its values are
+written, so recordings of hundreds of files do not exhaust the open files.
+
+The files are merged in the natural order of their names, i.e. numbers
+within the names are compared by their value, so `part_9.tdms` comes before
+`part_10.tdms`.
+"""
+import json
+import pathlib
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from fixitfelix import (
+    either,
+    error_handling,
+    file_helpers,
+    fix,
+    listeners,
+    manifest,
+    overview,
+    segment_writer,
+    source,
+    tdms_helpers,
+    tdms_index,
+)
+
+
+class Part(NamedTuple):
+    path: pathlib.Path
+    # Position of the first value of the file within the recording
+    offset: int
+    # Number of values of the file
+    samples: int
+    index_ranges: List[Tuple[int, int]]
+
+
+def natural_key(path: pathlib.Path) -> List[Any]:
+    """Returns the sort key of path that compares the numbers within its
+    name by their value
+    """
+    return [
+        int(part) if part.isdigit() else part
+        for part in re.split(r"(\d+)", path.name)
+    ]
+
+
+def list_part_paths(path: pathlib.Path) -> List[pathlib.Path]:
+    """Returns the TDMS files of the folder in the natural order of their
+    names
+    """
+    return sorted(
+        (f for f in path.iterdir() if f.suffix == ".tdms" and f.is_file()),
+        key=natural_key,
+    )
+
+
+def continue_pattern(offset: int) -> Any:
+    """Returns a function that sets the phase of a SourceFile, whose first
+    value is at offset within the recording.
+    Return type of the function is Either[ErrorCode, source.SourceFile]"""
+
+    def _f(source_file: source.SourceFile) -> either.Either:
+        meta = source_file.meta
+        length = tdms_helpers.get_maximum_array_size(source_file.tdms_operator)
+        phase = -offset % (meta.chunk_size + meta.recurrence_size)
+        source_file.regions = [source.Region(0, length, phase)]
+        return either.Right(source_file)
+
+    return _f
+
+
+def describe_channels(source_file: source.SourceFile) -> List[Tuple[Any, ...]]:
+    return [
+        (group.name, channel.name, str(channel.dtype))
+        for group, channel in fix.select_channels(source_file)
+    ]
+
+
+def check_same_channels(channels: List[Tuple[Any, ...]]) -> Any:
+    """Returns a function that checks whether a SourceFile contains the
+    channels described by channels, see describe_channels.
+    Return type of the function is Either[ErrorCode, source.SourceFile]"""
+
+    def _f(source_file: source.SourceFile) -> either.Either:
+        if describe_channels(source_file) != channels:
+            return either.Left(error_handling.ErrorCode.MERGE_CHANNELS_DIFFER)
+        return either.Right(source_file)
+
+    return _f
+
+
+def preprocess_parts(
+    meta: source.MetaData, paths: Sequence[pathlib.Path]
+) -> List[Part]:
+    """Runs the consistency checks on each file with the phase it continues
+    the pattern of the recording with. Raises an exception if a check fails.
+    Each file is closed after its check, so any number of files can be
+    merged.
+    """
+    parts: List[Part] = []
+    offset = 0
+    channels: List[Tuple[Any, ...]] = []
+    for i, path in enumerate(paths):
+        print(f"Preprocess file {i+1} of {len(paths)} at {path}")
+        res = (
+            either.Right(meta)
+            | error_handling.check_meta
+            | fix.combine_with_tdms(path)
+            | fix.check_selection
+            | continue_pattern(offset)
+            | error_handling.check_source_file
+        )
+        if parts and isinstance(res, either.Right):
+            res = res | check_same_channels(channels)
+        if isinstance(res, either.Left):
+            raise Exception(error_handling.ERROR_DESCRIPTIONS.get(res._value))
+        source_file = res._value
+        try:
+            if not parts:
+                channels = describe_channels(source_file)
+            samples = tdms_helpers.get_maximum_array_size(
+                source_file.tdms_operator
+            )
+            parts.append(
+                Part(
+                    path,
+                    offset,
+                    samples,
+                    fix.prepare_data_correction(source_file),
+                )
+            )
+        finally:
+            source_file.tdms_operator.close()
+        offset += samples
+    return parts
+
+
+def open_part(meta: source.MetaData, part: Part) -> source.SourceFile:
+    """Opens a checked file again. It is not memory mapped, so the values
+    read from it do not keep the file open.
+    """
+    return source.SourceFile(tdms_index.open_tdms(part.path), meta)
+
+
+def write_merged_channel(
+    tdms_writer: segment_writer.IncrementalTdmsWriter,
+    meta: source.MetaData,
+    parts: List[Part],
+    group,
+    channel,
+    number: int,
+    preserve_raw: bool = False,
+    export_listeners: Sequence[listeners.ExportListener] = (),
+) -> None:
+    """Writes the corrected values of one channel of all files, like
+    fix.write_chunks_to_file for a single file. Segments are only completed
+    when they reach segment_size, so they span the borders of the files.
+    Only one file is open at a time.
+
+    Arguments:
+    tdms_writer: Tdms handle for the new file
+    meta: meta data of the source files
+    parts: Checked files in the order of the recording
+    group: TDMS Group of the channel in the first file
+    channel: TDMS Channel of the first file, whose properties are written
+    number: Number of the channel within the selected channels of each file
+    preserve_raw: Whether raw, unscaled data is written
+    export_listeners: Are informed about each written segment
+    """
+
+    def read_chunks() -> Iterator[Tuple[int, np.ndarray]]:
+        ranges_done = 0
+        for part in parts:
+            source_file = open_part(meta, part)
+            try:
+                _, part_channel = fix.select_channels(source_file)[number]
+                for (offset, length) in part.index_ranges:
+                    ranges_done += 1
+                    yield ranges_done, fix.read_chunk(
+                        part_channel, offset, length, preserve_raw
+                    )
+            finally:
+                source_file.tdms_operator.close()
+
+    fix.write_segments(
+        tdms_writer,
+        read_chunks(),
+        group,
+        channel,
+        meta.segment_size,
+        preserve_raw,
+        export_listeners,
+    )
+
+
+def describe_parts(parts: List[Part]) -> List[Dict[str, Any]]:
+    """Returns the table of the merged files with the number of their source
+    values and the position and number of their corrected values.
+    """
+    table = []
+    start = 0
+    for part in parts:
+        samples = sum(length for (_, length) in part.index_ranges)
+        table.append(
+            {
+                "file": part.path.name,
+                "source_offset": part.offset,
+                "source_samples": part.samples,
+                "start": start,
+                "samples": samples,
+            }
+        )
+        start += samples
+    return table
+
+
+def estimate_parts_size(paths: List[pathlib.Path]) -> int:
+    """Returns an upper bound of the size of the table of parts of the files
+    at paths in bytes
+    """
+    # No position or number of values is larger than the size of all files
+    largest_number = sum(path.stat().st_size for path in paths)
+    return len(
+        json.dumps(
+            {
+                "parts": [
+                    {
+                        "file": path.name,
+                        "source_offset": largest_number,
+                        "source_samples": largest_number,
+                        "start": largest_number,
+                        "samples": largest_number,
+                    }
+                    for path in paths
+                ]
+            }
+        ).encode()
+    )
+
+
+def export_merged(
+    meta: source.MetaData,
+    parts: List[Part],
+    export_path: pathlib.Path,
+    preserve_raw: bool = False,
+    with_overview: bool = False,
+) -> None:
+    """Exports the corrected values of all files into one new TDMS file with
+    its manifest, index file, table of parts and optionally its overview.
+    They are written as partial files and renamed once they are complete,
+    so an interrupted merge does not leave a merged file that looks
+    complete.
+
+    Arguments:
+    meta: meta data of the source files
+    parts: Checked files in the order of the recording
+    export_path: File path for the merged TDMS file
+    preserve_raw: Whether raw, unscaled data is written with the properties
+        of the first file
+    with_overview: Whether min/max overview pyramids are stored next to the
+        new file
+    """
+    target_path = fix.partial_path(export_path)
+    try:
+        first_file = open_part(meta, parts[0])
+        try:
+            write_merged_file(
+                meta,
+                parts,
+                first_file,
+                target_path,
+                preserve_raw,
+                with_overview,
+            )
+        finally:
+            first_file.tdms_operator.close()
+        file_helpers.write_json(
+            fix.parts_path(target_path), {"parts": describe_parts(parts)}
+        )
+    except BaseException:
+        if target_path.exists():
+            fix.remove_partial(target_path)
+        raise
+    fix.publish_partial(export_path)
+
+
+def write_merged_file(
+    meta: source.MetaData,
+    parts: List[Part],
+    first_file: source.SourceFile,
+    export_path: pathlib.Path,
+    preserve_raw: bool,
+    with_overview: bool,
+) -> None:
+    """Writes the merged TDMS file with the channels and properties of the
+    opened first file and its manifest, index file and overview
+    """
+    channels = fix.select_channels(first_file)
+    expected_samples = sum(
+        length for part in parts for (_, length) in part.index_ranges
+    )
+    with export_path.open(mode="wb") as f:
+        export_listeners: List[listeners.ExportListener] = [
+            manifest.ManifestWriter(export_path, f, channels, expected_samples),
+            tdms_index.IndexWriter(f, export_path),
+        ]
+        if with_overview:
+            export_listeners.append(
+                overview.OverviewWriter(export_path, channels)
+            )
+        with segment_writer.IncrementalTdmsWriter(f) as tdms_writer:
+            if preserve_raw:
+                fix.write_properties(
+                    tdms_writer,
+                    first_file.tdms_operator,
+                    fix.select_groups(first_file),
+                )
+            for number, (group, channel) in enumerate(channels):
+                for listener in export_listeners:
+                    listener.channel_started(group, channel)
+                write_merged_channel(
+                    tdms_writer,
+                    meta,
+                    parts,
+                    group,
+                    channel,
+                    number,
+                    preserve_raw,
+                    export_listeners,
+                )
+                for listener in export_listeners:
+                    listener.channel_finished()
+        file_helpers.sync(f)
+        for listener in export_listeners:
+            listener.export_finished()
+
+
+def export_correct_data(
+    filename: str,
+    meta: source.MetaData,
+    output_file: str,
+    preserve_raw: bool = False,
+    with_overview: bool = False,
+) -> pathlib.Path:
+    """Corrects the TDMS files of a folder as one recording and merges them
+    into one file. All files are checked before the merged file is written.
+
+    Arguments:
+    filename: Path to the folder with the consecutive tdms files
+    meta: MetaData dict that contains all information needed for correction.
+    output_file: File path for the merged TDMS file without suffix. If it is
+        empty, the name is the name of the folder with '_corrected' as suffix.
+    preserve_raw: Whether raw, unscaled data is written instead of scaled data
+    with_overview: Whether min/max overview pyramids are stored next to the
+        merged file
+
+    Returns:
+    Path of the merged file
+    """
+    path = pathlib.Path(filename)
+    paths = list_part_paths(path) if path.is_dir() else []
+    if not paths:
+        raise Exception(
+            error_handling.ERROR_DESCRIPTIONS.get(
+                error_handling.ErrorCode.DIRPATH_EMPTY
+            )
+        )
+    export_path = fix.determine_export_path(path, output_file)
+    export_path = export_path.with_name(export_path.name + ".tdms")
+
+    parts = preprocess_parts(meta, paths)
+    print(f"Merge {len(parts)} files into {export_path}")
+    export_merged(meta, parts, export_path, preserve_raw, with_overview)
+    return export_path
@@ -0,0 +1,376 @@
+"""Min/max overview pyramids of corrected TDMS files for fast plotting.
+
+While fix.export_to_tmds writes a corrected file, the minimum, maximum and
+mean of each bucket of FIRST_BUCKET_SAMPLES values are computed from the
+data in memory. Each further level combines FACTOR buckets of the level
+below. The levels of all channels are stored in an overview
+`<file>.fixit_overview` next to the corrected file, followed by a JSON
+footer with their positions and the length of the footer. read_overview
+returns the coarsest level that still has a bucket per pixel, so a plot of
+a whole recording only reads a few thousand values.
+"""
+import json
+import os
+import pathlib
+import struct
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from fixitfelix import (
+    file_helpers,
+    listeners,
+    manifest,
+    tdms_index,
+    tdms_segments,
+)
+
+OVERVIEW_SUFFIX = ".fixit_overview"
+
+# Number of values of a bucket of the finest level
+FIRST_BUCKET_SAMPLES = 1024
+
+# Number of buckets of a level that make up a bucket of the next level
+FACTOR = 16
+
+FOOTER_LENGTH_FORMAT = "<Q"
+
+
+class Overview(NamedTuple):
+    # Position of the first value of the first bucket
+    start: int
+    # Number of values per bucket, 1 for values read from the corrected file
+    bucket_samples: int
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+
+
+def overview_path(export_path: pathlib.Path) -> pathlib.Path:
+    return export_path.parent / (export_path.name + OVERVIEW_SUFFIX)
+
+
+def has_overview(data: np.ndarray) -> bool:
+    """Only numeric values have a minimum, maximum and mean"""
+    return data.dtype.kind in "biuf"
+
+
+class PyramidBuilder:
+    """Collects the buckets of the finest level from the values of a channel,
+    which arrive in parts of any length.
+    """
+
+    def __init__(self):
+        self.pending = np.empty(0)
+        self.samples = 0
+        self.mins: List[np.ndarray] = []
+        self.maxs: List[np.ndarray] = []
+        self.means: List[np.ndarray] = []
+
+    def add_buckets(self, buckets: np.ndarray) -> None:
+        self.mins.append(buckets.min(axis=1))
+        self.maxs.append(buckets.max(axis=1))
+        self.means.append(buckets.mean(axis=1, dtype=np.float64))
+
+    def add(self, data: np.ndarray) -> None:
+        self.samples += len(data)
+        if len(self.pending) > 0:
+            missing = FIRST_BUCKET_SAMPLES - len(self.pending)
+            self.pending = np.concatenate([self.pending, data[:missing]])
+            data = data[missing:]
+            if len(self.pending) < FIRST_BUCKET_SAMPLES:
+                return
+            self.add_buckets(self.pending.reshape(1, -1))
+        full = len(data) - len(data) % FIRST_BUCKET_SAMPLES
+        if full > 0:
+            self.add_buckets(data[:full].reshape(-1, FIRST_BUCKET_SAMPLES))
+        self.pending = data[full:].copy()
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Returns bucket_samples, min, max and mean of each level from the
+        finest to a level with a single bucket.
+        """
+        if len(self.pending) > 0:
+            self.add_buckets(self.pending.reshape(1, -1))
+            self.pending = self.pending[:0]
+        if not self.mins:
+            return []
+        level = {
+            "bucket_samples": FIRST_BUCKET_SAMPLES,
+            "min": np.concatenate(self.mins),
+            "max": np.concatenate(self.maxs),
+            "mean": np.concatenate(self.means),
+        }
+        levels = [level]
+        while len(level["min"]) > 1:
+            levels.append(combine_buckets(level, self.samples))
+            level = levels[-1]
+        return levels
+
+
+def combine_buckets(level: Dict[str, Any], samples: int) -> Dict[str, Any]:
+    """Returns the next coarser level of level, whose last bucket may hold
+    less values than the others.
+    """
+    bucket_samples = level["bucket_samples"]
+    counts = np.full(len(level["mean"]), bucket_samples, dtype=np.int64)
+    counts[-1] = samples - (len(counts) - 1) * bucket_samples
+    starts = np.arange(0, len(counts), FACTOR)
+    return {
+        "bucket_samples": bucket_samples * FACTOR,
+        "min": np.minimum.reduceat(level["min"], starts),
+        "max": np.maximum.reduceat(level["max"], starts),
+        "mean": np.add.reduceat(level["mean"] * counts, starts)
+        / np.add.reduceat(counts, starts),
+    }
+
+
+def estimate_size(channels: List[Tuple[str, str, np.dtype, int]]) -> int:
+    """Returns an upper bound of the size of the overview of channels, given
+    by the names of their group and channel, their data type and their number
+    of values, in bytes
+    """
+    arrays_size = 0
+    footer_channels = []
+    for group, channel, dtype, samples in channels:
+        if dtype.kind not in "biuf":
+            continue
+        levels = []
+        buckets = -(-samples // FIRST_BUCKET_SAMPLES)
+        bucket_samples = FIRST_BUCKET_SAMPLES
+        while buckets > 0:
+            arrays_size += buckets * (2 * dtype.itemsize + 8)
+            levels.append((bucket_samples, buckets))
+            if buckets == 1:
+                break
+            buckets = -(-buckets // FACTOR)
+            bucket_samples *= FACTOR
+        footer_channels.append((group, channel, dtype, samples, levels))
+    # Positions are written with at most as many digits as the largest one
+    footer = {
+        "factor": FACTOR,
+        "channels": [
+            {
+                "group": group,
+                "channel": channel,
+                "samples": samples,
+                "levels": [
+                    {
+                        "bucket_samples": bucket_samples,
+                        "buckets": buckets,
+                        **{
+                            name: {
+                                "position": arrays_size,
+                                "dtype": array_dtype.newbyteorder("<").str,
+                            }
+                            for name, array_dtype in [
+                                ("min", dtype),
+                                ("max", dtype),
+                                ("mean", np.dtype(np.float64)),
+                            ]
+                        },
+                    }
+                    for bucket_samples, buckets in levels
+                ],
+            }
+            for group, channel, dtype, samples, levels in footer_channels
+        ],
+    }
+    return (
+        arrays_size
+        + len(json.dumps(footer).encode())
+        + struct.calcsize(FOOTER_LENGTH_FORMAT)
+    )
+
+
+def write_array(f, data: np.ndarray) -> Dict[str, Any]:
+    """Appends the little endian bytes of data to f and returns their
+    position and data type.
+    """
+    data = np.ascontiguousarray(data, dtype=data.dtype.newbyteorder("<"))
+    position = f.tell()
+    f.write(data.tobytes())
+    return {"position": position, "dtype": data.dtype.str}
+
+
+class OverviewWriter(listeners.ExportListener):
+    """Builds the overview pyramids of the data written by fix.export_to_tmds.
+    The levels of each channel are written when the channel is finished, the
+    footer when the export is finished.
+
+    Arguments:
+    export_path: File path of the corrected TDMS file
+    channels: Groups and channels that are exported
+    size: Size of the corrected file an interrupted export continues at
+    """
+
+    def __init__(
+        self,
+        export_path: pathlib.Path,
+        channels: List[Tuple[Any, Any]],
+        size: int = 0,
+    ):
+        self.names = {
+            manifest.object_path(group.name, channel.name): (
+                group.name,
+                channel.name,
+            )
+            for group, channel in channels
+        }
+        self.path = overview_path(export_path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.f = self.tmp_path.open(mode="wb")
+        self.channels: List[Dict[str, Any]] = []
+        self.current: Optional[Dict[str, Any]] = None
+        # Pyramids of the channels written before the export was interrupted
+        self.resumed: Dict[str, Dict[str, Any]] = {}
+        if size > 0:
+            segments = manifest.read_channel_segments(export_path, size)
+            with export_path.open(mode="rb") as f:
+                for path, channel_segments in segments.items():
+                    entry = self.start_entry(path)
+                    for segment in channel_segments:
+                        self.add(
+                            entry,
+                            tdms_segments.read_object_values(f, segment, path),
+                        )
+                    self.resumed[path] = entry
+
+    def start_entry(self, path: str) -> Dict[str, Any]:
+        group, channel = self.names[path]
+        return {
+            "group": group,
+            "channel": channel,
+            "builder": PyramidBuilder(),
+            "numeric": True,
+        }
+
+    def add(self, entry: Dict[str, Any], data: np.ndarray) -> None:
+        if entry["numeric"] and has_overview(data):
+            entry["builder"].add(data)
+        else:
+            entry["numeric"] = False
+
+    def write_entry(self, entry: Dict[str, Any]) -> None:
+        if not entry["numeric"]:
+            return
+        builder = entry["builder"]
+        levels = [
+            {
+                "bucket_samples": level["bucket_samples"],
+                "buckets": len(level["min"]),
+                **{
+                    name: write_array(self.f, level[name])
+                    for name in ("min", "max", "mean")
+                },
+            }
+            for level in builder.finish()
+        ]
+        self.channels.append(
+            {
+                "group": entry["group"],
+                "channel": entry["channel"],
+                "samples": builder.samples,
+                "levels": levels,
+            }
+        )
+
+    def channel_started(self, group, channel) -> None:
+        path = manifest.object_path(group.name, channel.name)
+        self.current = self.resumed.pop(path, None) or self.start_entry(path)
+        # The channels left were finished before the interruption
+        self.write_resumed()
+
+    def write_resumed(self) -> None:
+        for entry in self.resumed.values():
+            self.write_entry(entry)
+        self.resumed = {}
+
+    def segment_written(self, data: np.ndarray, ranges_done: int) -> None:
+        self.add(self.current, data)
+
+    def channel_finished(self) -> None:
+        self.write_entry(self.current)
+        self.current = None
+
+    def export_finished(self) -> None:
+        self.write_resumed()
+        footer = json.dumps({"factor": FACTOR, "channels": self.channels})
+        footer = footer.encode()
+        self.f.write(footer)
+        self.f.write(struct.pack(FOOTER_LENGTH_FORMAT, len(footer)))
+        file_helpers.sync(self.f)
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def read_footer(f) -> Dict[str, Any]:
+    length_size = struct.calcsize(FOOTER_LENGTH_FORMAT)
+    f.seek(-length_size, os.SEEK_END)
+    (length,) = struct.unpack(FOOTER_LENGTH_FORMAT, f.read(length_size))
+    f.seek(-length_size - length, os.SEEK_END)
+    return json.loads(f.read(length))
+
+
+def read_level_array(f, array: Dict[str, Any], start: int, stop: int):
+    dtype = np.dtype(array["dtype"])
+    f.seek(array["position"] + start * dtype.itemsize)
+    return np.fromfile(f, dtype=dtype, count=stop - start)
+
+
+def read_overview(
+    export_path: pathlib.Path,
+    group: str,
+    channel: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+    pixels: int = 2000,
+) -> Overview:
+    """Returns minimum, maximum and mean of the values from start to stop of a
+    corrected channel at the coarsest level with at least one bucket per
+    pixel. If even the finest level is too coarse, the values themselves are
+    read from the corrected file.
+
+    Arguments:
+    export_path: File path of the corrected TDMS file
+    group: Name of the group of the channel
+    channel: Name of the channel
+    start: Position of the first value
+    stop: Position after the last value, the end of the channel if None
+    pixels: Width of the plot in pixels
+    """
+    with overview_path(export_path).open(mode="rb") as f:
+        footer = read_footer(f)
+        entries = [
+            c
+            for c in footer["channels"]
+            if c["group"] == group and c["channel"] == channel
+        ]
+        if not entries:
+            raise KeyError(f"No overview of channel {group}/{channel}")
+        (entry,) = entries
+        stop = entry["samples"] if stop is None else min(stop, entry["samples"])
+        start = max(min(start, stop), 0)
+        levels = [
+            level
+            for level in entry["levels"]
+            if (stop - start) // level["bucket_samples"] >= pixels
+        ]
+        if levels:
+            level = levels[-1]
+            bucket_samples = level["bucket_samples"]
+            first = start // bucket_samples
+            last = -(-stop // bucket_samples)
+            return Overview(
+                first * bucket_samples,
+                bucket_samples,
+                *(
+                    read_level_array(f, level[name], first, last)
+                    for name in ("min", "max", "mean")
+                ),
+            )
+    with tdms_index.open_tdms(export_path) as tdms_file:
+        values = tdms_file[group][channel].read_data(
+            offset=start, length=stop - start
+        )
+    return Overview(start, 1, values, values, values.astype(np.float64))
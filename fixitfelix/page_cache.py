@@ -0,0 +1,188 @@
+"""Page cache aware reading and writing of fix.export_to_tmds.
+
+Correcting a file that is much larger than the memory streams all of it
+through the page cache of the operating system, which evicts the pages of
+other programs, and lets dirty pages of the corrected file pile up. The
+CacheDropper hints the kernel to read the values of the current channel
+ahead, drops the pages of the source values that were read, and writes the
+corrected file to disk in batches of FLUSH_BATCH bytes, whose pages are then
+dropped as well.
+
+Read ahead and dropping of source pages needs the memory mapped channels of
+mapped_reader, other channels are only dropped when the export is finished.
+Where posix_fadvise is not available, e.g. on Windows, only the batches are
+written to disk.
+"""
+import mmap
+import os
+import pathlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from fixitfelix import listeners, mapped_reader
+
+# Bytes of the current channel that are read ahead
+READ_AHEAD = 64 * 1024 * 1024
+
+# Bytes of the corrected file that are written to disk at once
+FLUSH_BATCH = 256 * 1024 * 1024
+
+
+def page_range(position: int, end: int) -> Tuple[int, int]:
+    """Returns the whole pages within the bytes from position to end"""
+    start = -(-position // mmap.PAGESIZE) * mmap.PAGESIZE
+    stop = end // mmap.PAGESIZE * mmap.PAGESIZE
+    return start, max(start, stop)
+
+
+def piece_ranges(
+    pieces: mapped_reader.ChannelPieces, first: int, stop: int
+) -> List[Tuple[int, int]]:
+    """Returns the byte ranges in the file of the values first to stop of a
+    channel, adjacent ranges are joined.
+    """
+    itemsize = pieces.dtype.itemsize
+    ends = pieces.starts + pieces.lengths
+    first_piece = int(np.searchsorted(ends, first, side="right"))
+    last_piece = int(np.searchsorted(pieces.starts, stop, side="left"))
+    ranges: List[Tuple[int, int]] = []
+    for number in range(first_piece, last_piece):
+        start = pieces.starts[number]
+        position = int(
+            pieces.positions[number] + (max(first, start) - start) * itemsize
+        )
+        end = int(
+            pieces.positions[number]
+            + (min(stop, ends[number]) - start) * itemsize
+        )
+        if ranges and ranges[-1][1] == position:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((position, end))
+    return ranges
+
+
+def advise_file(
+    path: pathlib.Path, ranges: List[Tuple[int, int]], advice_name: str
+) -> None:
+    """Gives the kernel the posix_fadvise advice of that name, e.g.
+    `POSIX_FADV_DONTNEED`, for the byte ranges of the file at path. Only
+    whole pages are advised, as a partial page may hold other values.
+    """
+    if not hasattr(os, "posix_fadvise") or not ranges:
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for position, end in ranges:
+            start, stop = page_range(position, end)
+            if stop > start:
+                os.posix_fadvise(
+                    fd, start, stop - start, getattr(os, advice_name)
+                )
+    finally:
+        os.close(fd)
+
+
+def advise_mapping(
+    mapping: mmap.mmap, ranges: List[Tuple[int, int]], advice_name: str
+) -> None:
+    """Gives the kernel the madvise advice of that name, e.g.
+    `MADV_DONTNEED`, for the byte ranges of a memory mapped file.
+    """
+    if not hasattr(mmap, advice_name):
+        return
+    for position, end in ranges:
+        start, stop = page_range(position, min(end, len(mapping)))
+        if stop > start:
+            mapping.madvise(getattr(mmap, advice_name), start, stop - start)
+
+
+class CacheDropper(listeners.ExportListener):
+    """Keeps the page cache small while fix.export_to_tmds reads the source
+    file and writes the corrected file.
+
+    Arguments:
+    f: Opened corrected file
+    mapped_file: Memory mapped source file, None if the source file is read
+        by nptdms only
+    index_ranges: Chunk Indices that point to valid data slices
+    size: Size of the corrected file an interrupted export continues at
+    """
+
+    def __init__(
+        self,
+        f,
+        mapped_file: Optional[mapped_reader.MappedFile],
+        index_ranges: List[Tuple[int, int]],
+        size: int = 0,
+    ):
+        self.f = f
+        self.mapped_file = mapped_file
+        self.index_ranges = index_ranges
+        self.flushed = size
+        self.pieces: Optional[mapped_reader.ChannelPieces] = None
+        self.dropped = 0
+        if mapped_file is not None and mapped_file.mapping is not None:
+            advise_mapping(
+                mapped_file.mapping,
+                [(0, len(mapped_file.mapping))],
+                "MADV_SEQUENTIAL",
+            )
+
+    def read_ahead(self, first: int) -> None:
+        """Reads READ_AHEAD bytes of the current channel from value first"""
+        values = READ_AHEAD // self.pieces.dtype.itemsize
+        advise_file(
+            self.mapped_file.path,
+            piece_ranges(self.pieces, first, first + values),
+            "POSIX_FADV_WILLNEED",
+        )
+
+    def flush(self) -> None:
+        """Writes the corrected file to disk and drops its pages"""
+        end = self.f.tell()
+        self.f.flush()
+        getattr(os, "fdatasync", os.fsync)(self.f.fileno())
+        if hasattr(os, "posix_fadvise"):
+            start, stop = page_range(self.flushed, end)
+            if stop > start:
+                os.posix_fadvise(
+                    self.f.fileno(),
+                    start,
+                    stop - start,
+                    os.POSIX_FADV_DONTNEED,
+                )
+        self.flushed = end
+
+    def channel_started(self, group, channel) -> None:
+        self.pieces = None
+        self.dropped = 0
+        if isinstance(channel, mapped_reader.MappedChannel):
+            self.pieces = channel.pieces
+            if self.index_ranges:
+                self.read_ahead(self.index_ranges[0][0])
+
+    def segment_written(self, data: np.ndarray, ranges_done: int) -> None:
+        if self.pieces is not None:
+            offset, length = self.index_ranges[ranges_done - 1]
+            consumed = piece_ranges(self.pieces, self.dropped, offset + length)
+            # Mapped pages are only dropped from the cache once unmapped
+            advise_mapping(self.mapped_file.mapping, consumed, "MADV_DONTNEED")
+            advise_file(self.mapped_file.path, consumed, "POSIX_FADV_DONTNEED")
+            self.dropped = offset + length
+            self.read_ahead(self.dropped)
+        if self.f.tell() - self.flushed >= FLUSH_BATCH:
+            self.flush()
+
+    def export_finished(self) -> None:
+        self.flush()
+        if self.mapped_file is not None:
+            whole_file = [(0, self.mapped_file.path.stat().st_size)]
+            if self.mapped_file.mapping is not None:
+                advise_mapping(
+                    self.mapped_file.mapping, whole_file, "MADV_DONTNEED"
+                )
+            advise_file(
+                self.mapped_file.path, whole_file, "POSIX_FADV_DONTNEED"
+            )
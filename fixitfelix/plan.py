@@ -0,0 +1,376 @@
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from fixitfelix import (
+    checkpoint,
+    either,
+    error_handling,
+    fix,
+    manifest,
+    merge,
+    overview,
+    segment_writer,
+    source,
+    tdms_index,
+)
+
+# Data read and written per file to estimate the runtime
+CALIBRATION_BYTES = 32_000_000
+
+
+class ChannelPlan(NamedTuple):
+    group: str
+    channel: str
+    dtype: str
+    samples: int
+    segments: int
+    output_bytes: int
+
+
+class FilePlan(NamedTuple):
+    source_path: pathlib.Path
+    export_path: pathlib.Path
+    channels: List[ChannelPlan]
+    output_bytes: int
+    # Upper bound of the size of the files written next to the new file
+    sidecar_bytes: int
+    segments: int
+    peak_memory: int
+    estimated_seconds: Optional[float]
+
+
+class RunPlan(NamedTuple):
+    files: List[FilePlan]
+    output_bytes: int
+    sidecar_bytes: int
+    free_bytes: int
+    peak_memory: int
+    estimated_seconds: Optional[float]
+
+    @property
+    def needed_bytes(self) -> int:
+        return self.output_bytes + self.sidecar_bytes
+
+    @property
+    def enough_space(self) -> bool:
+        return self.needed_bytes <= self.free_bytes
+
+
+def measure_segment_overhead(
+    tdms_writer: segment_writer.IncrementalTdmsWriter,
+    buffer: io.BytesIO,
+    group,
+    channel,
+    preserve_raw: bool,
+) -> Tuple[int, int, int]:
+    """Writes three segments of channel the way fix.write_chunks_to_file
+    does and returns the size of lead in and meta data of the first segment,
+    of a following segment with as many values as the one before and of a
+    following segment with a different number of values in bytes.
+    """
+    dtype = fix.get_written_dtype(channel, preserve_raw)
+    sizes = []
+    for length in [0, 0, 1]:
+        position = buffer.tell()
+        tdms_writer.write_segment(
+            [
+                fix.create_channel_object(
+                    group, channel, np.zeros(length, dtype=dtype), preserve_raw
+                )
+            ]
+        )
+        sizes.append(buffer.tell() - position - length * dtype.itemsize)
+    return sizes[0], sizes[1], sizes[2]
+
+
+def count_length_changes(segment_lengths: List[int]) -> int:
+    """Returns the number of segments that have a different number of values
+    than the segment before.
+    """
+    return sum(
+        1
+        for previous, length in zip(segment_lengths, segment_lengths[1:])
+        if previous != length
+    )
+
+
+def calibrate(
+    channel, index_ranges: List[Tuple[int, int]], export_dir: pathlib.Path
+) -> Tuple[float, float]:
+    """Reads some chunks of channel and writes them into export_dir.
+
+    Returns:
+    Seconds per chunk read and seconds per byte written
+    """
+    chunk_nbytes = max(1, index_ranges[0][1] * channel.dtype.itemsize)
+    number_of_chunks = max(
+        1, min(len(index_ranges), CALIBRATION_BYTES // chunk_nbytes)
+    )
+    start = time.perf_counter()
+    data = [
+        channel.read_data(offset=offset, length=length)
+        for (offset, length) in index_ranges[:number_of_chunks]
+    ]
+    seconds_per_chunk = (time.perf_counter() - start) / number_of_chunks
+
+    data = np.concatenate(data)
+    with tempfile.TemporaryFile(dir=export_dir) as f:
+        start = time.perf_counter()
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        seconds_per_byte = (time.perf_counter() - start) / max(1, data.nbytes)
+    return seconds_per_chunk, seconds_per_byte
+
+
+def plan_file(
+    source_path: pathlib.Path,
+    export_path: pathlib.Path,
+    meta: source.MetaData,
+    with_calibration: bool = False,
+    preserve_raw: bool = False,
+    file_selection: Optional[source.Selection] = None,
+    with_overview: bool = False,
+) -> FilePlan:
+    """Predicts the corrected file of source_path using the file meta data
+    only, unless a calibration read is requested to estimate the runtime.
+
+    Arguments:
+    source_path: Path to tdms file to correct
+    export_path: File path for the corrected TDMS file
+    meta: MetaData dict that contains all information needed for correction.
+    with_calibration: Whether the runtime is estimated
+    preserve_raw: Whether raw, unscaled data is written
+    file_selection: Part of the file to correct, the whole file if None
+    with_overview: Whether an overview is stored next to the corrected file
+    """
+    source_file = (
+        error_handling.load_tdms_file(path=source_path)
+        | error_handling.check_tdms
+        | (
+            lambda tdms_operator: fix.check_selection(
+                source.SourceFile(tdms_operator, meta, file_selection)
+            )
+        )
+    )
+    if isinstance(source_file, either.Left):
+        raise Exception(
+            f"{source_path}: "
+            + error_handling.ERROR_DESCRIPTIONS.get(source_file._value)
+        )
+    source_file = source_file._value
+    tdms_operator = source_file.tdms_operator
+
+    index_ranges = fix.prepare_data_correction(source_file)
+    selected_channels = fix.select_channels(source_file)
+
+    buffer = io.BytesIO()
+    channels = []
+    segment_lengths_of_channels = []
+    peak_memory = 0
+    estimated_seconds = 0.0 if with_calibration else None
+    with segment_writer.IncrementalTdmsWriter(buffer) as tdms_writer:
+        if preserve_raw:
+            fix.write_properties(
+                tdms_writer, tdms_operator, fix.select_groups(source_file)
+            )
+        properties_bytes = buffer.tell()
+        for group, channel in selected_channels:
+            itemsize = fix.get_written_dtype(channel, preserve_raw).itemsize
+            segment_lengths = fix.calculate_segment_lengths(
+                index_ranges, itemsize, meta.segment_size
+            )
+            segment_lengths_of_channels.append(segment_lengths)
+            first, same, changed = measure_segment_overhead(
+                tdms_writer, buffer, group, channel, preserve_raw
+            )
+            changes = count_length_changes(segment_lengths)
+            samples = sum(segment_lengths)
+            # The chunks of one segment are kept in memory while they are
+            # concatenated into a copy of the same size
+            peak_memory = max(peak_memory, 2 * max(segment_lengths) * itemsize,)
+            channels.append(
+                ChannelPlan(
+                    group=group.name,
+                    channel=channel.name,
+                    dtype=str(fix.get_written_dtype(channel, preserve_raw)),
+                    samples=samples,
+                    segments=len(segment_lengths),
+                    output_bytes=samples * itemsize
+                    + first
+                    + same * (len(segment_lengths) - 1 - changes)
+                    + changed * changes,
+                )
+            )
+            if with_calibration:
+                seconds_per_chunk, seconds_per_byte = calibrate(
+                    channel, index_ranges, existing_parent(export_path.parent),
+                )
+                estimated_seconds += (
+                    seconds_per_chunk * len(index_ranges)
+                    + seconds_per_byte * channels[-1].output_bytes
+                )
+    tdms_operator.close()
+    output_bytes = properties_bytes + sum(c.output_bytes for c in channels)
+    # The checkpoint only exists during the export, but with the new file
+    sidecar_bytes = checkpoint.estimate_size(
+        checkpoint.describe_export(
+            meta, selected_channels, index_ranges, preserve_raw
+        ),
+        output_bytes,
+    )
+    sidecar_bytes += manifest.estimate_size(
+        [(c.group, c.channel) for c in channels],
+        segment_lengths_of_channels,
+        sum(length for (_, length) in index_ranges),
+        output_bytes,
+    )
+    sidecar_bytes += tdms_index.estimate_size(
+        output_bytes,
+        sum(c.samples * np.dtype(c.dtype).itemsize for c in channels),
+    )
+    if with_overview:
+        sidecar_bytes += overview.estimate_size(
+            [
+                (c.group, c.channel, np.dtype(c.dtype), c.samples)
+                for c in channels
+            ]
+        )
+
+    return FilePlan(
+        source_path=source_path,
+        export_path=export_path,
+        channels=channels,
+        output_bytes=output_bytes,
+        sidecar_bytes=sidecar_bytes,
+        segments=sum(c.segments for c in channels) + int(preserve_raw),
+        peak_memory=peak_memory,
+        estimated_seconds=estimated_seconds,
+    )
+
+
+def existing_parent(path: pathlib.Path) -> pathlib.Path:
+    """Returns path or its closest ancestor that exists"""
+    path = path.absolute()
+    while not path.exists():
+        path = path.parent
+    return path
+
+
+def free_disk_space(path: pathlib.Path) -> int:
+    """Returns the free bytes on the filesystem path is or will be located on"""
+    return shutil.disk_usage(existing_parent(path)).free
+
+
+def plan_run(
+    filename: str,
+    meta: source.MetaData,
+    output_file: str,
+    with_calibration: bool = False,
+    preserve_raw: bool = False,
+    file_selection: Optional[source.Selection] = None,
+    with_overview: bool = False,
+    merged: bool = False,
+) -> RunPlan:
+    """Plans the correction of a tdms file or a folder of tdms files as done
+    by fix.export_correct_data without touching any file.
+
+    Arguments:
+    filename: Path to the tdms file or folder with tdms files to correct.
+    meta: MetaData dict that contains all information needed for correction.
+    output_file: File path for the corrected TDMS file or folder.
+    with_calibration: Whether the runtime is estimated by a calibration read
+    preserve_raw: Whether raw, unscaled data is written
+    file_selection: Groups, channels and window of each file to correct, the
+        whole file if None
+    with_overview: Whether overviews are stored next to the corrected files
+    merged: Whether the files of the folder are merged into one file, whose
+        table of parts is stored next to it
+    """
+    path = pathlib.Path(filename)
+    export_path = fix.determine_export_path(path, output_file)
+    files = [
+        plan_file(
+            tdms_file,
+            file_export_path,
+            meta,
+            with_calibration,
+            preserve_raw,
+            file_selection,
+            with_overview,
+        )
+        for (tdms_file, file_export_path) in fix.list_export_paths(
+            path, export_path
+        )
+    ]
+    if with_calibration:
+        estimated_seconds = sum(f.estimated_seconds for f in files)
+    else:
+        estimated_seconds = None
+    sidecar_bytes = sum(f.sidecar_bytes for f in files)
+    if merged:
+        sidecar_bytes += merge.estimate_parts_size(merge.list_part_paths(path))
+    return RunPlan(
+        files=files,
+        output_bytes=sum(f.output_bytes for f in files),
+        sidecar_bytes=sidecar_bytes,
+        free_bytes=free_disk_space(export_path),
+        peak_memory=max((f.peak_memory for f in files), default=0),
+        estimated_seconds=estimated_seconds,
+    )
+
+
+def check_space(needed_bytes: int, free_bytes: int, warn_only: bool) -> None:
+    """Raises an exception, or prints a warning if warn_only is set, if
+    needed_bytes exceed free_bytes
+    """
+    if needed_bytes <= free_bytes:
+        return
+    message = (
+        error_handling.ERROR_DESCRIPTIONS[
+            error_handling.ErrorCode.NOT_ENOUGH_DISKSPACE
+        ]
+        + f": {needed_bytes / 1e9:.2f} GB needed,"
+        + f" {free_bytes / 1e9:.2f} GB free"
+    )
+    if not warn_only:
+        raise Exception(message)
+    print(f"Warning: {message}")
+
+
+def check_free_space(run_plan: RunPlan, warn_only: bool = False) -> None:
+    """Raises an exception, or prints a warning if warn_only is set, if the
+    corrected files do not fit onto the target filesystem.
+    """
+    check_space(run_plan.needed_bytes, run_plan.free_bytes, warn_only)
+
+
+def format_plan(run_plan: RunPlan) -> str:
+    """Returns a human readable report of run_plan"""
+    lines = []
+    for f in run_plan.files:
+        lines.append(f"{f.source_path} -> {f.export_path}")
+        lines.append(
+            f"  {f.output_bytes} bytes in {f.segments} segments, at most"
+            f" {f.sidecar_bytes} bytes in files next to it,"
+            f" peak memory {f.peak_memory / 1e9:.2f} GB"
+        )
+        if f.estimated_seconds is not None:
+            lines.append(f"  estimated runtime {f.estimated_seconds:.0f} s")
+    lines.append(
+        f"Total: {run_plan.needed_bytes / 1e9:.2f} GB of"
+        f" {run_plan.free_bytes / 1e9:.2f} GB free,"
+        f" peak memory {run_plan.peak_memory / 1e9:.2f} GB"
+    )
+    if run_plan.estimated_seconds is not None:
+        lines.append(f"Estimated runtime: {run_plan.estimated_seconds:.0f} s")
+    if not run_plan.enough_space:
+        lines.append("Not enough free disk space for the corrected files!")
+    return "\n".join(lines)
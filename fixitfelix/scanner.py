@@ -0,0 +1,181 @@
+"""Scanner for files whose recurrence pattern shifts within the file.
+
+Restarts of the acquisition begin a new chunk at an arbitrary position, which
+shifts the phase of the pattern for the rest of the file. The scanner walks
+the selected channels in large blocks and tests every duplicate of the
+current phase. At the first duplicate that does not repeat its origin, the
+phase of the following values is detected anew and a new region begins with
+the first chunk of the new phase. The resulting regions replace the sampled
+repetition check and define the index ranges of the export.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+from fixitfelix import either, error_handling, selection, source, tdms_helpers
+
+# Number of source values per channel read at once
+SCAN_BLOCK_SAMPLES = 4_000_000
+
+# Number of periods used to detect the phase of the pattern
+DETECTION_PERIODS = 64
+
+
+def read_repetitions(channels, meta: source.MetaData, start: int, stop: int):
+    """Returns for each position from start to stop whether the values of
+    all channels equal the values recurrence_distance before.
+    """
+    distance = meta.recurrence_distance
+    first = max(start - distance, 0)
+    repeated = np.ones(stop - start, dtype=bool)
+    repeated[: first + distance - start] = False
+    for channel in channels:
+        data = channel.read_data(offset=first, length=stop - first)
+        repeated[first + distance - start :] &= (
+            data[distance:] == data[:-distance]
+        )
+    return repeated
+
+
+def count_matches(
+    repeated: np.ndarray, start: int, meta: source.MetaData, phase: int
+) -> int:
+    """Returns the number of duplicates of phase from start on that repeat
+    their origin before the first one that does not.
+
+    Arguments:
+    repeated: Whether the values from position start on are repeated
+    start: Position of the first value of repeated
+    meta: MetaData that describes the pattern
+    phase: Phase of the pattern
+    """
+    period = meta.chunk_size + meta.recurrence_size
+    first_offset = (phase + meta.chunk_size - start) % period
+    positions = np.arange(
+        first_offset, len(repeated) - meta.recurrence_size + 1, period
+    )
+    matches = np.ones(len(positions), dtype=bool)
+    for step in range(meta.recurrence_size):
+        matches &= repeated[positions + step]
+    mismatches = np.flatnonzero(~matches)
+    return int(mismatches[0]) if len(mismatches) else len(matches)
+
+
+def detect_phase(
+    repeated: np.ndarray, start: int, meta: source.MetaData
+) -> Optional[int]:
+    """Returns the phase of the pattern at position start, i.e. the only
+    phase with the longest run of duplicates that repeat their origin. None
+    is returned if no or several phases have such a run, e.g. for constant
+    values.
+
+    Arguments:
+    repeated: Whether the values from position start on are repeated
+    start: Position of the first value of repeated
+    meta: MetaData that describes the pattern
+    """
+    period = meta.chunk_size + meta.recurrence_size
+    runs = np.array(
+        [count_matches(repeated, start, meta, phase) for phase in range(period)]
+    )
+    phase = int(np.argmax(runs))
+    if runs[phase] == 0 or np.count_nonzero(runs == runs[phase]) > 1:
+        return None
+    return phase
+
+
+def find_first_mismatch(
+    channels, meta: source.MetaData, phase: int, start: int, stop: int
+) -> Optional[int]:
+    """Returns the offset of the first duplicate of phase from start on whose
+    values do not repeat their origin, or None if all duplicates that end
+    before stop do.
+    """
+    period = meta.chunk_size + meta.recurrence_size
+    first_offset = start + (phase + meta.chunk_size - start) % period
+    offsets = np.arange(first_offset, stop - meta.recurrence_size + 1, period)
+    if len(offsets) == 0:
+        return None
+    repeated = read_repetitions(
+        channels, meta, offsets[0], offsets[-1] + meta.recurrence_size
+    )
+    matches = count_matches(repeated, offsets[0], meta, phase)
+    return int(offsets[matches]) if matches < len(offsets) else None
+
+
+def scan_regions(
+    channels, meta: source.MetaData, length: int
+) -> Optional[List[source.Region]]:
+    """Scans channels for the regions of the pattern given by meta.
+
+    Arguments:
+    channels: TDMS Channels that contain data
+    meta: MetaData that describes the pattern except of its phase
+    length: Number of values of the channels
+
+    Returns:
+    Regions that cover all values, or None if the values of some part do
+    not follow the pattern with any phase
+    """
+    if meta.recurrence_size == 0:
+        return [source.Region(0, length, 0)]
+    period = meta.chunk_size + meta.recurrence_size
+    detection_length = DETECTION_PERIODS * period
+
+    def detect(start: int) -> Optional[int]:
+        stop = min(start + detection_length, length)
+        return detect_phase(
+            read_repetitions(channels, meta, start, stop), start, meta
+        )
+
+    phase = detect(0)
+    if phase is None:
+        return None
+    regions = []
+    region_start = 0
+    position = 0
+    block_samples = max(SCAN_BLOCK_SAMPLES // period, 1) * period
+    while position < length:
+        stop = min(position + block_samples, length)
+        mismatch = find_first_mismatch(channels, meta, phase, position, stop)
+        if mismatch is None:
+            # Duplicates that reach into the next block are tested there
+            position = max(stop - meta.recurrence_size, position + 1)
+            if stop == length:
+                break
+            continue
+        new_phase = detect(mismatch + meta.recurrence_size)
+        if new_phase is None or new_phase == phase:
+            return None
+        # The restart lies between the end of the last duplicate that
+        # repeated its origin and the end of the first one that did not, so
+        # exactly one chunk of the new phase begins there
+        last_end = max(mismatch - period + meta.recurrence_size, region_start)
+        restart = last_end + (new_phase - last_end) % period
+        if restart <= region_start:
+            return None
+        regions.append(source.Region(region_start, restart, phase))
+        region_start = position = restart
+        phase = new_phase
+    regions.append(source.Region(region_start, length, phase))
+    return regions
+
+
+def scan_source_file(source_file: source.SourceFile) -> either.Either:
+    """Scans the selected channels of the source file for shifts of the
+    pattern and returns Either[ErrorCode,source.SourceFile] with the regions
+    found. Every duplicate is tested, so the sampled repetition check of
+    error_handling.check_source_file is not needed.
+    """
+    channels = [
+        channel for _, channel in selection.select_source_channels(source_file)
+    ]
+    regions = scan_regions(
+        channels,
+        source_file.meta,
+        tdms_helpers.get_maximum_array_size(source_file.tdms_operator),
+    )
+    if regions is None:
+        return either.Left(error_handling.ErrorCode.PARAMETERERROR)
+    source_file.regions = regions
+    return either.Right(source_file)
@@ -0,0 +1,116 @@
+"""Writer of TDMS segments that omits unchanged meta data.
+
+nptdms.TdmsWriter writes the complete object list with all properties into
+every segment. The corrected files consist of many segments with the same
+channel and mostly the same number of values, so IncrementalTdmsWriter only
+writes the full object list when the channels of a segment change. A
+segment with the same layout as the previous one consists of a lead in and
+the raw data only, a segment that only changes the number of values lists
+the changed channels without properties.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import nptdms
+import numpy as np
+
+from fixitfelix import tdms_segments
+
+# Path, TDMS data type and number of values of each object with data
+Layout = List[Tuple[str, int, int]]
+
+
+class IncrementalTdmsWriter:
+    """Writes segments to an opened file like nptdms.TdmsWriter.
+
+    Arguments:
+    f: File opened for writing at the position of the next segment
+    version: TDMS version written to the lead ins
+    """
+
+    def __init__(self, f, version: int = 4712):
+        self.f = f
+        self.version = version
+        self.tdms_writer = nptdms.TdmsWriter(f, version=version)
+        self.previous_layout: Optional[Layout] = None
+        self.written_properties: Dict[str, dict] = {}
+
+    def __enter__(self):
+        self.tdms_writer.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self.tdms_writer.__exit__(*args)
+
+    def get_layout(self, objects) -> Optional[Layout]:
+        """Returns the layout of objects, or None if the segment has to be
+        written by nptdms, because it contains objects without data, new
+        properties or values of a type that is not written as is.
+        """
+        layout = []
+        for o in objects:
+            if not o.has_data:
+                return None
+            if dict(o.properties or {}) != self.written_properties.get(o.path):
+                return None
+            data_type = o.data_type.enum_value
+            if (
+                data_type not in tdms_segments.NUMPY_TYPES
+                or o.data.dtype.byteorder == ">"
+            ):
+                return None
+            layout.append((o.path, data_type, len(o.data)))
+        return layout
+
+    def write_segment(self, objects) -> None:
+        """Writes objects as a new segment"""
+        objects = list(objects)
+        layout = self.get_layout(objects)
+        previous = self.previous_layout
+        if (
+            layout is None
+            or previous is None
+            or [p for p, _, _ in layout] != [p for p, _, _ in previous]
+        ):
+            self.tdms_writer.write_segment(objects)
+            for o in objects:
+                self.written_properties[o.path] = dict(o.properties or {})
+            # Objects without data, like the root object, do not prevent
+            # continuing the channels with shorter segments
+            layout = self.get_layout([o for o in objects if o.has_data])
+            self.previous_layout = layout if layout else None
+            return
+        if layout == previous:
+            meta_data = b""
+            toc = tdms_segments.TOC_RAW_DATA
+        else:
+            meta_data = tdms_segments.encode_meta_data(
+                [
+                    tdms_segments.SegmentObject(
+                        path, tdms_segments.RawDataIndex(data_type, values), b""
+                    )
+                    for (path, data_type, values), old in zip(layout, previous)
+                    if (path, data_type, values) != old
+                ]
+            )
+            toc = tdms_segments.TOC_META_DATA | tdms_segments.TOC_RAW_DATA
+        self.write_raw_data_segment(objects, meta_data, toc)
+        self.previous_layout = layout
+
+    def write_raw_data_segment(
+        self, objects, meta_data: bytes, toc: int
+    ) -> None:
+        """Writes a segment whose object list continues the one of the
+        previous segment.
+        """
+        data = [np.ascontiguousarray(o.data) for o in objects]
+        self.f.write(
+            tdms_segments.encode_lead_in(
+                toc,
+                self.version,
+                len(meta_data) + sum(d.nbytes for d in data),
+                len(meta_data),
+            )
+        )
+        self.f.write(meta_data)
+        for d in data:
+            self.f.write(memoryview(d).cast("B"))
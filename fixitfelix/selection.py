@@ -0,0 +1,233 @@
+"""Selection of groups, channels and a window of the corrected data.
+
+The window is given in corrected samples or in seconds and converted to the
+index ranges of the source file it covers, so only the source data of the
+selected channels within the window is checked and read.
+"""
+import math
+from typing import List, Optional, Tuple
+
+import nptdms
+import numpy as np
+
+from fixitfelix import fix, source, tdms_helpers
+
+
+def parse_range(text: str) -> Tuple[Optional[float], Optional[float], bool]:
+    """Parses a range `START:END` of corrected samples or, if both are
+    followed by `s`, of seconds. START or END may be left out.
+
+    Returns:
+    Start, end and whether they are given in seconds
+    """
+    parts = text.split(":")
+    if len(parts) != 2:
+        raise ValueError(f"Range {text!r} is not of the form START:END")
+    units = {part.strip().endswith("s") for part in parts if part.strip()}
+    if len(units) > 1:
+        raise ValueError(f"Range {text!r} mixes samples and seconds")
+    in_seconds = units == {True}
+    bounds = []
+    for part in parts:
+        part = part.strip().rstrip("s")
+        if not part:
+            bounds.append(None)
+        elif in_seconds:
+            bounds.append(float(part))
+        else:
+            bounds.append(int(part))
+    return bounds[0], bounds[1], in_seconds
+
+
+def is_selected(group, channel, selection: source.Selection) -> bool:
+    if selection.groups and group.name not in selection.groups:
+        return False
+    return not selection.channels or bool(
+        {channel.name, f"{group.name}/{channel.name}"} & set(selection.channels)
+    )
+
+
+def find_unknown_names(
+    tdms_operator: nptdms.TdmsFile, selection: source.Selection
+) -> List[str]:
+    """Returns the selected groups and channels that the file does not
+    contain.
+    """
+    groups = {group.name for group in tdms_operator.groups()}
+    channels = set()
+    for group in tdms_operator.groups():
+        for channel in group.channels():
+            channels.update({channel.name, f"{group.name}/{channel.name}"})
+    return [name for name in selection.groups if name not in groups] + [
+        name for name in selection.channels if name not in channels
+    ]
+
+
+def select_channels(
+    tdms_operator: nptdms.TdmsFile, selection: source.Selection
+) -> List[Tuple[nptdms.TdmsGroup, nptdms.TdmsChannel]]:
+    """Returns the selected channels that contain data with their groups"""
+    return [
+        (group, channel)
+        for group in tdms_operator.groups()
+        for channel in group.channels()
+        if len(channel) > 0 and is_selected(group, channel, selection)
+    ]
+
+
+def select_source_channels(
+    source_file: source.SourceFile,
+) -> List[Tuple[nptdms.TdmsGroup, nptdms.TdmsChannel]]:
+    """Returns the selected channels of the source file with their groups.
+    Channels are read from the memory mapped file where possible.
+    """
+    channels = select_channels(source_file.tdms_operator, source_file.selection)
+    if source_file.mapped_file is None:
+        return channels
+    return source_file.mapped_file.map_channels(
+        source_file.tdms_operator, channels
+    )
+
+
+def get_sample_interval(channels: List[nptdms.TdmsChannel]) -> Optional[float]:
+    """Returns the seconds between two samples of the channels, or None if
+    they do not all have the same wf_increment property.
+    """
+    increments = {
+        channel.properties.get("wf_increment") for channel in channels
+    }
+    if len(increments) != 1 or None in increments:
+        return None
+    (increment,) = increments
+    return float(increment) if increment > 0 else None
+
+
+def count_corrected_samples(meta: source.MetaData, raw_length: int) -> int:
+    """Returns the number of samples that remain of raw_length source values"""
+    return fix.count_preserved_values(
+        meta.chunk_size, meta.recurrence_size, raw_length
+    )
+
+
+def get_regions(source_file: source.SourceFile) -> List[source.Region]:
+    """Returns the regions of the source file, a single region with phase 0
+    unless the file was scanned for phase shifts.
+    """
+    if source_file.regions is not None:
+        return source_file.regions
+    return [
+        source.Region(
+            0,
+            tdms_helpers.get_maximum_array_size(source_file.tdms_operator),
+            0,
+        )
+    ]
+
+
+def count_region_samples(meta: source.MetaData, region: source.Region) -> int:
+    """Returns the number of samples that remain of the values of region"""
+    return count_corrected_samples(
+        meta, region.stop - region.phase
+    ) - count_corrected_samples(meta, region.start - region.phase)
+
+
+def to_raw_position(
+    source_file: source.SourceFile, corrected_position: int
+) -> int:
+    """Returns the position of the source value that is corrected to
+    corrected_position.
+    """
+    meta = source_file.meta
+    for region in get_regions(source_file):
+        samples = count_region_samples(meta, region)
+        if corrected_position < samples:
+            break
+        corrected_position -= samples
+    position = corrected_position + count_corrected_samples(
+        meta, region.start - region.phase
+    )
+    periods, phase = divmod(position, meta.chunk_size)
+    return (
+        region.phase
+        + periods * (meta.chunk_size + meta.recurrence_size)
+        + phase
+    )
+
+
+def get_corrected_window(source_file: source.SourceFile) -> Tuple[int, int]:
+    """Returns the selected window of the corrected data as start and stop
+    sample, limited to the corrected length. The window of a selection in
+    seconds covers the samples at or after its start and before its end.
+    """
+    selection = source_file.selection
+    length = sum(
+        count_region_samples(source_file.meta, region)
+        for region in get_regions(source_file)
+    )
+    bounds = [selection.start, selection.stop]
+    if selection.in_seconds:
+        interval = get_sample_interval(
+            [
+                channel
+                for _, channel in select_channels(
+                    source_file.tdms_operator, selection
+                )
+            ]
+        )
+        # Rounding keeps sample times like 0.1 / 0.001 from being missed
+        bounds = [
+            None if bound is None else math.ceil(round(bound / interval, 6))
+            for bound in bounds
+        ]
+    start = 0 if bounds[0] is None else min(max(bounds[0], 0), length)
+    stop = length if bounds[1] is None else min(max(bounds[1], start), length)
+    return int(start), int(stop)
+
+
+def get_raw_window(source_file: source.SourceFile) -> Tuple[int, int]:
+    """Returns the window of source values that the selected window of the
+    corrected data is taken from.
+    """
+    start, stop = get_corrected_window(source_file)
+    if start == stop:
+        return 0, 0
+    return (
+        to_raw_position(source_file, start),
+        to_raw_position(source_file, stop - 1) + 1,
+    )
+
+
+def restrict_index_ranges(
+    index_ranges: List[Tuple[int, int]], start: int, stop: int
+) -> List[Tuple[int, int]]:
+    """Cuts the index ranges to the ones that are corrected to the samples
+    from start to stop.
+
+    Arguments:
+    index_ranges: Chunk Indices that point to valid data slices
+    start: First corrected sample to keep
+    stop: Corrected sample after the last one to keep
+
+    Returns:
+    List with array ranges in the form (offset, length)
+    """
+    if not index_ranges:
+        return []
+    offsets, lengths = (np.array(column) for column in zip(*index_ranges))
+    ends = np.cumsum(lengths)
+    begins = ends - lengths
+    first = int(np.searchsorted(ends, start, side="right"))
+    last = int(np.searchsorted(begins, stop, side="left"))
+    restricted = []
+    for offset, length, begin, end in zip(
+        offsets[first:last],
+        lengths[first:last],
+        begins[first:last],
+        ends[first:last],
+    ):
+        cut_front = max(start - begin, 0)
+        cut_back = max(end - stop, 0)
+        restricted.append(
+            (int(offset + cut_front), int(length - cut_front - cut_back))
+        )
+    return restricted
@@ -0,0 +1,312 @@
+"""Correction of a folder by several processes, e.g. on several machines that
+mount the same network file system.
+
+Each process lists the files of the folder and claims a file by creating its
+lease file `<corrected file>.fixit_lease` next to the corrected file, which
+only one process can create. The process corrects the file into its partial
+file with checkpoints, renames it to the corrected file and removes the
+lease. While it holds the lease, it renews the lease by touching the lease
+file every quarter of the lease timeout.
+
+A lease whose modification time did not change for the lease timeout belongs
+to a crashed process and is taken over, the new owner resumes the partial
+file from its checkpoint. Times are only compared on the machine that
+observes the lease, so the clocks of the machines do not need to agree. A
+process reads the owner of its lease before each segment it writes, so once
+its lease is taken over it stops the export of that file before the next
+segment and does not rename it.
+
+A file is finished once its corrected file exists, so processes can be
+started at any time and each file is corrected once. Every process returns
+when all files of the folder are corrected.
+"""
+import json
+import os
+import pathlib
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from fixitfelix import checkpoint, error_handling, fix, listeners, source
+
+LEASE_SUFFIX = ".fixit_lease"
+
+# Seconds without renewal after which a lease is taken over
+LEASE_TIMEOUT = 600.0
+
+# Seconds between two rounds over the files leased by other processes
+POLL_INTERVAL = 10.0
+
+# Observed modification of each lease file, given by its inode and
+# modification time, and the time.monotonic() it was first observed
+Observations = Dict[pathlib.Path, Tuple[Tuple[int, int], float]]
+
+
+def lease_path(export_path: pathlib.Path) -> pathlib.Path:
+    return export_path.parent / (export_path.name + LEASE_SUFFIX)
+
+
+def new_owner() -> str:
+    """Returns a name of the calling process that is unique on all machines"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+
+
+def read_owner(path: pathlib.Path) -> Optional[str]:
+    """Returns the owner of the lease file at path, None if it does not exist
+    or is still being written
+    """
+    try:
+        with path.open() as f:
+            return json.load(f)["owner"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def create_lease(path: pathlib.Path, owner: str) -> bool:
+    """Creates the lease file at path for owner, returns False if it exists"""
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        json.dump({"owner": owner}, f)
+    return True
+
+
+def is_stale(
+    path: pathlib.Path, observations: Observations, timeout: float
+) -> bool:
+    """Whether the lease file at path was not modified for timeout seconds
+    since it was first observed in this modification
+    """
+    stat = os.stat(path)
+    modification = (stat.st_ino, stat.st_mtime_ns)
+    now = time.monotonic()
+    if path not in observations or observations[path][0] != modification:
+        observations[path] = (modification, now)
+    return now - observations[path][1] >= timeout
+
+
+def break_stale_lease(
+    path: pathlib.Path, observations: Observations, timeout: float
+) -> bool:
+    """Removes the lease file at path if it is stale. Returns whether no lease
+    file of another process remains.
+
+    The lease file is renamed first, which only one process can do, and is
+    put back if it was renewed or replaced in the meantime.
+    """
+    try:
+        if not is_stale(path, observations, timeout):
+            return False
+    except FileNotFoundError:
+        return True
+    modification = observations.pop(path)[0]
+    removed_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}")
+    try:
+        os.rename(path, removed_path)
+    except FileNotFoundError:
+        return True
+    stat = os.stat(removed_path)
+    if (stat.st_ino, stat.st_mtime_ns) != modification:
+        try:
+            os.link(removed_path, path)
+        except FileExistsError:
+            pass
+        os.unlink(removed_path)
+        return False
+    os.unlink(removed_path)
+    return True
+
+
+def acquire(
+    path: pathlib.Path, owner: str, observations: Observations, timeout: float
+) -> bool:
+    """Tries to create the lease file at path for owner, taking over a stale
+    lease. Returns whether owner holds the lease.
+    """
+    if create_lease(path, owner):
+        return True
+    return break_stale_lease(path, observations, timeout) and create_lease(
+        path, owner
+    )
+
+
+class Lease(listeners.ExportListener):
+    """Renews a lease in a thread while it is used as a context manager and
+    removes it at the end. As export listener, it stops the export once the
+    lease was taken over by another process.
+
+    Arguments:
+    path: Path of the acquired lease file
+    owner: Owner of the lease
+    timeout: Seconds without renewal after which the lease is taken over
+    """
+
+    def __init__(self, path: pathlib.Path, owner: str, timeout: float):
+        self.path = path
+        self.owner = owner
+        self.timeout = timeout
+        self.lost = threading.Event()
+        self.stopped = threading.Event()
+        self.renewer = threading.Thread(target=self.renew, daemon=True)
+
+    def renew(self) -> None:
+        while not self.stopped.wait(self.timeout / 4):
+            try:
+                if read_owner(self.path) != self.owner:
+                    raise FileNotFoundError(self.path)
+                os.utime(self.path)
+            except FileNotFoundError:
+                self.lost.set()
+                return
+
+    def check(self) -> None:
+        """Raises an exception if the lease was taken over"""
+        if self.lost.is_set() or read_owner(self.path) != self.owner:
+            self.lost.set()
+            raise Exception(
+                error_handling.ERROR_DESCRIPTIONS.get(
+                    error_handling.ErrorCode.LEASE_LOST
+                )
+            )
+
+    def segment_started(self, data) -> None:
+        # The renewal may not have noticed a takeover yet, and the new owner
+        # already resumes the partial file
+        self.check()
+
+    def __enter__(self) -> "Lease":
+        self.renewer.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stopped.set()
+        self.renewer.join()
+        if not self.lost.is_set() and read_owner(self.path) == self.owner:
+            self.path.unlink()
+
+
+def correct_file(
+    meta: source.MetaData,
+    tdms_file: pathlib.Path,
+    export_path: pathlib.Path,
+    lease: Lease,
+    preserve_raw: bool = False,
+    file_selection: Optional[source.Selection] = None,
+    scan_drift: bool = False,
+    with_overview: bool = False,
+    drop_cache: bool = False,
+) -> None:
+    """Corrects a leased file into its partial file, resuming the export of a
+    crashed process, and renames it to export_path.
+    """
+    partial = fix.partial_path(export_path)
+    if not checkpoint.is_finished(partial):
+        source_file = fix.preprocess(
+            meta=meta,
+            path=tdms_file,
+            file_selection=file_selection,
+            scan_drift=scan_drift,
+        )
+        try:
+            fix.export_to_tmds(
+                meta=meta,
+                source_file=source_file,
+                export_path=partial,
+                preserve_raw=preserve_raw,
+                resume=True,
+                export_listeners=[lease],
+                with_overview=with_overview,
+                drop_cache=drop_cache,
+            )
+        finally:
+            source_file.tdms_operator.close()
+    lease.check()
+    fix.publish_partial(export_path)
+
+
+def export_correct_data(
+    filename: str,
+    meta: source.MetaData,
+    output_file: str,
+    preserve_raw: bool = False,
+    file_selection: Optional[source.Selection] = None,
+    scan_drift: bool = False,
+    with_overview: bool = False,
+    drop_cache: bool = False,
+    lease_timeout: float = LEASE_TIMEOUT,
+) -> List[pathlib.Path]:
+    """Corrects the files of a folder together with other processes that are
+    called with the same folder and output folder.
+
+    Arguments:
+    filename: Path to the folder with tdms files to correct
+    meta: MetaData dict that contains all information needed for correction.
+    output_file: Path of the folder of the corrected files, the folder name
+        with '_corrected' as suffix if empty
+    preserve_raw: Whether raw, unscaled data is written instead of scaled data
+    file_selection: Groups, channels and window of each file to correct, the
+        whole file if None
+    scan_drift: Whether the files are scanned for shifts of the pattern
+    with_overview: Whether min/max overview pyramids are stored next to each
+        corrected file
+    drop_cache: Whether read and written pages are dropped from the page cache
+    lease_timeout: Seconds without renewal after which the lease of a file
+        is taken over, which has to be the same for all processes
+
+    Returns:
+    Paths of the corrected files written by this process
+    """
+    path = pathlib.Path(filename)
+    export_path = fix.determine_export_path(path, output_file)
+    export_path.mkdir(exist_ok=True)
+    export_paths = fix.list_export_paths(path, export_path)
+
+    owner = new_owner()
+    observations: Observations = {}
+    corrected = []
+    while True:
+        remaining = [
+            (tdms_file, file_export_path)
+            for (tdms_file, file_export_path) in export_paths
+            if not file_export_path.exists()
+        ]
+        if not remaining:
+            return corrected
+        claimed = False
+        for tdms_file, file_export_path in remaining:
+            if not acquire(
+                lease_path(file_export_path), owner, observations, lease_timeout
+            ):
+                continue
+            claimed = True
+            with Lease(
+                lease_path(file_export_path), owner, lease_timeout
+            ) as lease:
+                # Another process may have finished it before the lease
+                if file_export_path.exists():
+                    continue
+                print(f"Fix file {tdms_file} as {owner}")
+                try:
+                    correct_file(
+                        meta,
+                        tdms_file,
+                        file_export_path,
+                        lease,
+                        preserve_raw,
+                        file_selection,
+                        scan_drift,
+                        with_overview,
+                        drop_cache,
+                    )
+                except Exception:
+                    # The process that took over the lease finishes the file
+                    if not lease.lost.is_set():
+                        raise
+                    continue
+                corrected.append(file_export_path)
+        if not claimed:
+            time.sleep(min(POLL_INTERVAL, lease_timeout))
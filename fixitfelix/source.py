@@ -1,16 +1,42 @@
 import pathlib
 import tempfile
-from typing import Any, NamedTuple
+from typing import Any, List, NamedTuple, Optional, Tuple
 
 import nptdms
 
+from fixitfelix import mapped_reader
+
 
 class MetaData(NamedTuple):
     recurrence_size: int
     recurrence_distance: int
     chunk_size: int
     consistency_sample_size: int
-    segment_size: int
+    segment_size: float
+
+
+class Selection(NamedTuple):
+    """Part of a file to correct. Empty groups or channels select all of them.
+    Channels are given by their name or as `group/channel`. The window from
+    start to stop is given in corrected samples or, if in_seconds is set, in
+    seconds since the first sample.
+    """
+
+    groups: Tuple[str, ...] = ()
+    channels: Tuple[str, ...] = ()
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    in_seconds: bool = False
+
+
+class Region(NamedTuple):
+    """Source values from start to stop, whose chunks start at the positions
+    p with p % (chunk_size + recurrence_size) == phase.
+    """
+
+    start: int
+    stop: int
+    phase: int
 
 
 class SourceFile:
@@ -19,9 +45,21 @@ class SourceFile:
     Meta data includes arguments for file correction process.
     """
 
-    def __init__(self, tdms_operator: nptdms.TdmsFile, meta: MetaData):
+    def __init__(
+        self,
+        tdms_operator: nptdms.TdmsFile,
+        meta: MetaData,
+        selection: Optional[Selection] = None,
+        regions: Optional[List[Region]] = None,
+        mapped_file: Optional[mapped_reader.MappedFile] = None,
+    ):
         self.tdms_operator = tdms_operator
         self.meta = meta
+        self.selection = selection or Selection()
+        # Regions with their own phase, if the pattern shifts within the file
+        self.regions = regions
+        # Zero-copy reads of the channels, if the file is memory mapped
+        self.mapped_file = mapped_file
 
     @classmethod
     def read_from_path(cls, tdms_path: pathlib.Path, meta: MetaData):
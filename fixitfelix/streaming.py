@@ -0,0 +1,88 @@
+"""Streaming of corrected data in blocks of a fixed number of samples.
+
+Each block is read as one contiguous slice of the source channels, which
+includes the duplicates between its chunks, and the duplicates are removed
+by a mask. Chunks that straddle the border of two blocks are split between
+them, so the memory used only depends on the block size.
+"""
+from typing import Dict, Iterator, NamedTuple
+
+import numpy as np
+
+from fixitfelix import fix, selection, source
+
+
+class CorrectedBlock(NamedTuple):
+    # Position of the first sample of the block in the corrected data
+    start: int
+    # Values per `group/channel`, or 2-D values with one column per channel
+    # per group
+    data: Dict[str, np.ndarray]
+
+
+def calculate_mask(
+    source_file: source.SourceFile, offset: int, length: int
+) -> np.ndarray:
+    """Returns a boolean mask of the valid values in the source slice of the
+    given offset and length, following the phase of each region.
+    """
+    meta = source_file.meta
+    masks = []
+    for region in selection.get_regions(source_file):
+        start = max(region.start, offset)
+        stop = min(region.stop, offset + length)
+        if start < stop:
+            masks.append(
+                fix.calculate_preserve_mask(
+                    meta.chunk_size,
+                    meta.recurrence_size,
+                    start - region.phase,
+                    stop - start,
+                )
+            )
+    return np.concatenate(masks)
+
+
+def iter_corrected(
+    source_file: source.SourceFile,
+    block_samples: int,
+    by_group: bool = False,
+    preserve_raw: bool = False,
+) -> Iterator[CorrectedBlock]:
+    """Yields the corrected values of the selected channels block by block.
+
+    Arguments:
+    source_file: Tdms file, that passed all consistency checks
+    block_samples: Number of corrected samples per block, the last block may
+        be shorter
+    by_group: Whether the channels of a group are yielded as one 2-D array
+        with one column per channel instead of one array per channel
+    preserve_raw: Whether raw, unscaled data is yielded
+    """
+    if block_samples <= 0:
+        raise ValueError("Block samples have to be positive")
+    channels = fix.select_channels(source_file)
+    window_start, window_stop = selection.get_corrected_window(source_file)
+    for start in range(window_start, window_stop, block_samples):
+        stop = min(start + block_samples, window_stop)
+        raw_start = selection.to_raw_position(source_file, start)
+        raw_length = (
+            selection.to_raw_position(source_file, stop - 1) + 1 - raw_start
+        )
+        mask = calculate_mask(source_file, raw_start, raw_length)
+        data = {
+            f"{group.name}/{channel.name}": fix.read_chunk(
+                channel, raw_start, raw_length, preserve_raw
+            )[mask]
+            for group, channel in channels
+        }
+        if by_group:
+            groups: Dict[str, list] = {}
+            for group, channel in channels:
+                groups.setdefault(group.name, []).append(
+                    data[f"{group.name}/{channel.name}"]
+                )
+            data = {
+                name: np.column_stack(values) for name, values in groups.items()
+            }
+        yield CorrectedBlock(start, data)
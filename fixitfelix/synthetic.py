@@ -0,0 +1,109 @@
+import pathlib
+from typing import NamedTuple
+
+import nptdms
+import numpy as np
+
+
+class SyntheticSpec(NamedTuple):
+    """Description of a synthetic TDMS file with the recurrence pattern.
+
+    chunk_size, recurrence_size and recurrence_distance have the same meaning
+    as in source.MetaData. total_samples is the raw length of each channel,
+    i.e. including the duplicated values.
+    """
+
+    chunk_size: int
+    recurrence_size: int
+    recurrence_distance: int
+    total_samples: int
+    channel_count: int = 4
+    dtype: str = "int64"
+    segment_samples: int = 1_000_000
+    group_name: str = "Untitled"
+
+
+def samples_for_size(total_bytes: int, channel_count: int, dtype: str) -> int:
+    """Returns the number of raw samples per channel that make up a file of
+    roughly total_bytes bytes of raw data.
+    """
+    return total_bytes // (channel_count * np.dtype(dtype).itemsize)
+
+
+def corrected_indices(spec: SyntheticSpec, start: int, stop: int) -> np.ndarray:
+    """Maps the raw sample positions start..stop to the positions of the values
+    in the corrected data they are equal to.
+
+    Positions inside a recurrence are followed back by recurrence_distance
+    until they hit valid data, so recurrences copied from other recurrences
+    are resolved as well.
+    """
+    period = spec.chunk_size + spec.recurrence_size
+    indices = np.arange(start, stop, dtype=np.int64)
+    in_recurrence = indices % period >= spec.chunk_size
+    while in_recurrence.any():
+        indices[in_recurrence] -= spec.recurrence_distance
+        in_recurrence = indices % period >= spec.chunk_size
+    return (indices // period) * spec.chunk_size + indices % period
+
+
+def channel_values(
+    corrected: np.ndarray, channel_number: int, dtype: str
+) -> np.ndarray:
+    """Returns the values of a channel at the given corrected positions.
+
+    The first channel counts upwards from 1, so it equals the channels of
+    tests/assets/example_file.tdms. Integer types wrap around.
+    """
+    return ((corrected + 1) * (channel_number + 1)).astype(dtype)
+
+
+def check_spec(spec: SyntheticSpec) -> None:
+    """Raises a ValueError if the pattern of spec can not be generated."""
+    if spec.chunk_size <= 0:
+        raise ValueError("Chunk size has to be positive")
+    if spec.recurrence_size < 0:
+        raise ValueError("Recurrence size is negative")
+    if not 0 < spec.recurrence_distance <= spec.chunk_size:
+        raise ValueError(
+            "Recurrence distance has to be between 1 and the chunk size"
+        )
+    if spec.segment_samples <= 0:
+        raise ValueError("Segment samples have to be positive")
+
+
+def write_synthetic_tdms(path: pathlib.Path, spec: SyntheticSpec) -> None:
+    """Writes a TDMS file that contains the recurrence pattern given by spec.
+
+    The file is written segment by segment, so only segment_samples values
+    per channel are held in memory and files of tens of GB can be generated.
+
+    Arguments:
+    path: File path of the new TDMS file
+    spec: Layout and pattern of the file
+    """
+    check_spec(spec)
+    with nptdms.TdmsWriter(str(path)) as tdms_writer:
+        for start in range(0, spec.total_samples, spec.segment_samples):
+            stop = min(start + spec.segment_samples, spec.total_samples)
+            corrected = corrected_indices(spec, start, stop)
+            tdms_writer.write_segment(
+                [
+                    nptdms.ChannelObject(
+                        spec.group_name,
+                        channel_name(channel_number),
+                        channel_values(corrected, channel_number, spec.dtype),
+                    )
+                    for channel_number in range(spec.channel_count)
+                ]
+            )
+
+
+def channel_name(channel_number: int) -> str:
+    """Returns the name of a synthetic channel: A, B, ..., Z, AA, AB, ..."""
+    name = ""
+    channel_number += 1
+    while channel_number > 0:
+        channel_number, remainder = divmod(channel_number - 1, 26)
+        name = chr(ord("A") + remainder) + name
+    return name
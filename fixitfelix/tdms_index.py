@@ -0,0 +1,189 @@
+"""Index files of TDMS files.
+
+An index file `<file>.tdms_index` repeats the lead ins and meta data of all
+segments of a TDMS file without the raw data. nptdms reads the meta data
+from it when it exists, which is much faster than collecting the segments
+all over the data file.
+"""
+import os
+import pathlib
+import struct
+from typing import BinaryIO, List, Tuple
+
+import nptdms
+
+from fixitfelix import listeners, tdms_segments
+
+INDEX_SUFFIX = "_index"
+
+
+def index_path(path: pathlib.Path) -> pathlib.Path:
+    """Returns the path nptdms and NI software look for the index of path"""
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def is_index_path(path: pathlib.Path) -> bool:
+    return path.name.endswith(INDEX_SUFFIX)
+
+
+def read_lead_in(
+    f: BinaryIO, position: int, tag: bytes
+) -> Tuple[bytes, int, int]:
+    """Reads the lead in of the segment at position.
+
+    Returns:
+    Lead in, next segment offset and raw data offset
+    """
+    f.seek(position)
+    lead_in = f.read(tdms_segments.LEAD_IN_SIZE)
+    if lead_in[:4] != tag:
+        raise ValueError(f"No TDMS segment at position {position}")
+    (toc,) = struct.unpack_from("<L", lead_in, 4)
+    endianness = ">" if toc & tdms_segments.TOC_BIG_ENDIAN else "<"
+    (next_segment_offset, raw_data_offset) = struct.unpack_from(
+        endianness + "QQ", lead_in, 12
+    )
+    return lead_in, next_segment_offset, raw_data_offset
+
+
+def estimate_size(size: int, raw_data_size: int) -> int:
+    """Returns the size of the index file of a TDMS file of size bytes, of
+    which raw_data_size bytes are raw data. The index repeats everything else.
+    """
+    return size - raw_data_size
+
+
+def write_index(
+    f: BinaryIO, index_file: BinaryIO, start_position: int = 0
+) -> None:
+    """Writes the index entries of the segments of the opened TDMS file f from
+    start_position on to index_file.
+
+    Arguments:
+    f: TDMS file opened for reading
+    index_file: Index file opened for writing at the position of the entry
+        of the segment at start_position
+    start_position: Position of the first segment to index
+    """
+    f.seek(0, 2)
+    file_size = f.tell()
+    position = start_position
+    while position + tdms_segments.LEAD_IN_SIZE <= file_size:
+        lead_in, next_segment_offset, raw_data_offset = read_lead_in(
+            f, position, b"TDSm"
+        )
+        index_file.write(b"TDSh" + lead_in[4:])
+        index_file.write(f.read(raw_data_offset))
+        if next_segment_offset == tdms_segments.INCOMPLETE_SEGMENT:
+            break
+        position += tdms_segments.LEAD_IN_SIZE + next_segment_offset
+
+
+def write_index_file(path: pathlib.Path) -> None:
+    """Writes the index file of the TDMS file at path. The index file is
+    replaced atomically, so readers never see a partial index.
+    """
+    tmp_path = index_path(path).with_name(index_path(path).name + ".tmp")
+    try:
+        with path.open(mode="rb") as f, tmp_path.open(mode="wb") as index:
+            write_index(f, index)
+    except BaseException:
+        tmp_path.unlink()
+        raise
+    os.replace(tmp_path, index_path(path))
+
+
+def indexed_size(path: pathlib.Path) -> int:
+    """Returns the size of the part of a TDMS file that the index file at path
+    describes, or -1 if it ends with an incomplete segment.
+    """
+    size = 0
+    position = 0
+    with path.open(mode="rb") as index_file:
+        index_size = index_file.seek(0, 2)
+        while position < index_size:
+            _, next_segment_offset, raw_data_offset = read_lead_in(
+                index_file, position, b"TDSh"
+            )
+            if next_segment_offset == tdms_segments.INCOMPLETE_SEGMENT:
+                return -1
+            size += tdms_segments.LEAD_IN_SIZE + next_segment_offset
+            position += tdms_segments.LEAD_IN_SIZE + raw_data_offset
+    return size
+
+
+def has_valid_index(path: pathlib.Path) -> bool:
+    """Whether the index file of the TDMS file at path describes the whole
+    file, e.g. it is not outdated by segments appended later.
+    """
+    try:
+        return indexed_size(index_path(path)) == path.stat().st_size
+    except (OSError, ValueError, struct.error):
+        return False
+
+
+class UnindexedTdmsFile(nptdms.TdmsFile):
+    """TdmsFile that reads its meta data from the data file, even if an index
+    file exists next to it.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self._data_file = path.open(mode="rb")
+        try:
+            super().__init__(
+                self._data_file, read_metadata_only=True, keep_open=True
+            )
+        except BaseException:
+            self._data_file.close()
+            raise
+
+    def close(self):
+        super().close()
+        self._data_file.close()
+
+
+def open_tdms(path: pathlib.Path) -> nptdms.TdmsFile:
+    """Opens the TDMS file at path like nptdms.TdmsFile.open and uses its index
+    file for fast reading of the meta data. An outdated index, e.g. of a file
+    that is still written, is ignored.
+    """
+    path = pathlib.Path(path)
+    if has_valid_index(path):
+        return nptdms.TdmsFile.open(file=path)
+    return UnindexedTdmsFile(path)
+
+
+def index_files(filename: str) -> List[pathlib.Path]:
+    """Writes the missing or outdated index files of a TDMS file or of all
+    TDMS files in a folder.
+
+    Returns:
+    Paths of the indexed files
+    """
+    path = pathlib.Path(filename)
+    if path.is_dir():
+        tdms_files = sorted(
+            f for f in path.iterdir() if f.suffix == ".tdms" and f.is_file()
+        )
+    else:
+        tdms_files = [path]
+    indexed = []
+    for tdms_file in tdms_files:
+        if not has_valid_index(tdms_file):
+            write_index_file(tdms_file)
+            indexed.append(tdms_file)
+    return indexed
+
+
+class IndexWriter(listeners.ExportListener):
+    """Writes the index file of the corrected file when the export is
+    finished.
+    """
+
+    def __init__(self, f, export_path: pathlib.Path):
+        self.f = f
+        self.export_path = export_path
+
+    def export_finished(self) -> None:
+        self.f.flush()
+        write_index_file(self.export_path)
@@ -0,0 +1,471 @@
+"""Reads and writes the binary segment structure of TDMS files.
+
+nptdms hides the segments of a file, but compacting a file in place, index
+files and zero-copy reads need their positions and layout. Each segment
+consists of a lead in, the meta data with the list of objects and the raw
+data, see https://www.ni.com/en/support/documentation/supplemental/07/tdms-file-format-internal-structure.html
+"""
+import struct
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+LEAD_IN_SIZE = 28
+
+TOC_META_DATA = 1 << 1
+TOC_NEW_OBJ_LIST = 1 << 2
+TOC_RAW_DATA = 1 << 3
+TOC_INTERLEAVED_DATA = 1 << 5
+TOC_BIG_ENDIAN = 1 << 6
+TOC_DAQMX_RAW_DATA = 1 << 7
+
+NO_RAW_DATA = 0xFFFFFFFF
+SAME_RAW_DATA_INDEX = 0x00000000
+DAQMX_FORMAT_CHANGING_SCALER = 0x00001269
+DAQMX_DIGITAL_LINE_SCALER = 0x0000126A
+
+# Incomplete segments at the end of a file may have this next segment offset
+INCOMPLETE_SEGMENT = 0xFFFFFFFFFFFFFFFF
+
+STRING_TYPE = 0x20
+DAQMX_TYPE = 0xFFFFFFFF
+
+# Sizes in bytes of the TDMS data types with fixed size
+TYPE_SIZES = {
+    0x00: 0,
+    0x01: 1,
+    0x02: 2,
+    0x03: 4,
+    0x04: 8,
+    0x05: 1,
+    0x06: 2,
+    0x07: 4,
+    0x08: 8,
+    0x09: 4,
+    0x0A: 8,
+    0x0B: 16,
+    0x19: 4,
+    0x1A: 8,
+    0x21: 1,
+    0x44: 16,
+    0x08000C: 8,
+    0x10000D: 16,
+}
+
+# Numpy types of the TDMS data types that can be viewed directly
+NUMPY_TYPES = {
+    0x01: "i1",
+    0x02: "i2",
+    0x03: "i4",
+    0x04: "i8",
+    0x05: "u1",
+    0x06: "u2",
+    0x07: "u4",
+    0x08: "u8",
+    0x09: "f4",
+    0x0A: "f8",
+    0x19: "f4",
+    0x1A: "f8",
+    0x21: "u1",
+    0x08000C: "c8",
+    0x10000D: "c16",
+}
+
+
+class RawDataIndex(NamedTuple):
+    data_type: int
+    number_of_values: int
+    # Only set for strings and DAQmx data, whose size is not given by their
+    # type
+    total_size: Optional[int] = None
+
+    @property
+    def data_size(self) -> int:
+        """Size of the raw data of the object in one chunk in bytes"""
+        if self.total_size is not None:
+            return self.total_size
+        return TYPE_SIZES[self.data_type] * self.number_of_values
+
+    @property
+    def fixed_size(self) -> bool:
+        """Whether the values can be addressed without parsing them"""
+        return self.data_type in TYPE_SIZES and self.total_size is None
+
+
+class SegmentObject(NamedTuple):
+    path: str
+    # None if the object has no raw data in the segment
+    raw_data_index: Optional[RawDataIndex]
+    # Encoded properties including their count, as listed in the segment
+    property_bytes: bytes
+    # Whether the object was listed in the meta data of the segment
+    listed: bool = True
+
+
+class Segment(NamedTuple):
+    position: int
+    toc: int
+    version: int
+    next_segment_offset: int
+    raw_data_offset: int
+    # All objects of the segment after resolving incremental meta data
+    objects: List[SegmentObject]
+
+    @property
+    def endianness(self) -> str:
+        return ">" if self.toc & TOC_BIG_ENDIAN else "<"
+
+    @property
+    def data_position(self) -> int:
+        return self.position + LEAD_IN_SIZE + self.raw_data_offset
+
+    @property
+    def end(self) -> int:
+        return self.position + LEAD_IN_SIZE + self.next_segment_offset
+
+    @property
+    def interleaved(self) -> bool:
+        return bool(self.toc & TOC_INTERLEAVED_DATA)
+
+    @property
+    def data_objects(self) -> List[SegmentObject]:
+        if not self.toc & TOC_RAW_DATA:
+            return []
+        return [o for o in self.objects if o.raw_data_index is not None]
+
+    @property
+    def chunk_size(self) -> int:
+        """Size of the raw data of all objects in one chunk in bytes"""
+        if self.toc & TOC_DAQMX_RAW_DATA and self.data_objects:
+            # The channels of DAQmx data share the same raw data buffers
+            return self.data_objects[0].raw_data_index.data_size
+        return sum(o.raw_data_index.data_size for o in self.data_objects)
+
+    @property
+    def number_of_chunks(self) -> int:
+        """Number of repetitions of the raw data layout in the segment"""
+        if self.chunk_size == 0:
+            return 0
+        return (self.end - self.data_position) // self.chunk_size
+
+
+def _read_string(buffer: bytes, offset: int, endianness: str):
+    (length,) = struct.unpack_from(endianness + "L", buffer, offset)
+    start = offset + 4
+    return buffer[start : start + length].decode("utf-8"), start + length
+
+
+def _read_raw_data_index(buffer: bytes, offset: int, endianness: str):
+    (data_type, _, number_of_values) = struct.unpack_from(
+        endianness + "LLQ", buffer, offset
+    )
+    offset += 16
+    total_size = None
+    if data_type == STRING_TYPE:
+        (total_size,) = struct.unpack_from(endianness + "Q", buffer, offset)
+        offset += 8
+    return RawDataIndex(data_type, number_of_values, total_size), offset
+
+
+def _skip_daqmx_raw_data_index(
+    buffer: bytes, offset: int, endianness: str, digital_line_scaler: bool
+):
+    """DAQmx raw data is not supported beyond reading past its index and the
+    size of its raw data buffers
+    """
+    (data_type, _, number_of_values, number_of_scalers) = struct.unpack_from(
+        endianness + "LLQL", buffer, offset
+    )
+    # Digital line scalers store their sample format in a single byte
+    scaler_size = 17 if digital_line_scaler else 20
+    offset += 20 + scaler_size * number_of_scalers
+    (number_of_widths,) = struct.unpack_from(endianness + "L", buffer, offset)
+    widths = struct.unpack_from(
+        endianness + "L" * number_of_widths, buffer, offset + 4
+    )
+    offset += 4 + 4 * number_of_widths
+    total_size = number_of_values * sum(widths)
+    return RawDataIndex(DAQMX_TYPE, number_of_values, total_size), offset
+
+
+def _skip_properties(buffer: bytes, offset: int, endianness: str) -> int:
+    (number_of_properties,) = struct.unpack_from(
+        endianness + "L", buffer, offset
+    )
+    offset += 4
+    for _ in range(number_of_properties):
+        _, offset = _read_string(buffer, offset, endianness)
+        (data_type,) = struct.unpack_from(endianness + "L", buffer, offset)
+        offset += 4
+        if data_type == STRING_TYPE:
+            _, offset = _read_string(buffer, offset, endianness)
+        elif data_type in TYPE_SIZES:
+            offset += TYPE_SIZES[data_type]
+        else:
+            raise ValueError(f"Unsupported property data type {data_type}")
+    return offset
+
+
+def parse_meta_data(
+    buffer: bytes,
+    endianness: str,
+    previous_objects: List[SegmentObject],
+    known_indices: Dict[str, RawDataIndex],
+    new_object_list: bool,
+) -> List[SegmentObject]:
+    """Parses the meta data of a segment and resolves incremental meta data
+    against the objects of the previous segment.
+
+    Arguments:
+    buffer: Meta data of the segment
+    endianness: Byte order of the segment
+    previous_objects: Objects of the previous segment
+    known_indices: Latest raw data index of each object, updated in place
+    new_object_list: Whether the segment sets kTocNewObjList
+
+    Returns:
+    All objects of the segment in the order of their raw data
+    """
+    if new_object_list:
+        objects: List[SegmentObject] = []
+    else:
+        objects = [
+            o._replace(property_bytes=b"", listed=False)
+            for o in previous_objects
+        ]
+    (number_of_objects,) = struct.unpack_from(endianness + "L", buffer, 0)
+    offset = 4
+    for _ in range(number_of_objects):
+        path, offset = _read_string(buffer, offset, endianness)
+        (index_length,) = struct.unpack_from(endianness + "L", buffer, offset)
+        offset += 4
+        if index_length == NO_RAW_DATA:
+            raw_data_index = None
+        elif index_length == SAME_RAW_DATA_INDEX:
+            raw_data_index = known_indices[path]
+        elif index_length in (
+            DAQMX_FORMAT_CHANGING_SCALER,
+            DAQMX_DIGITAL_LINE_SCALER,
+        ):
+            raw_data_index, offset = _skip_daqmx_raw_data_index(
+                buffer,
+                offset,
+                endianness,
+                index_length == DAQMX_DIGITAL_LINE_SCALER,
+            )
+        else:
+            raw_data_index, offset = _read_raw_data_index(
+                buffer, offset, endianness
+            )
+        if raw_data_index is not None:
+            known_indices[path] = raw_data_index
+        properties_start = offset
+        offset = _skip_properties(buffer, offset, endianness)
+        segment_object = SegmentObject(
+            path, raw_data_index, buffer[properties_start:offset]
+        )
+        existing = [i for i, o in enumerate(objects) if o.path == path]
+        if existing:
+            objects[existing[0]] = segment_object
+        else:
+            objects.append(segment_object)
+    return objects
+
+
+def read_segments(
+    f: BinaryIO, is_index_file: bool = False
+) -> Iterator[Segment]:
+    """Iterates over all segments of an opened TDMS file or index file.
+
+    Only lead ins and meta data are read, the raw data is skipped.
+    """
+    expected_tag = b"TDSh" if is_index_file else b"TDSm"
+    f.seek(0, 2)
+    file_size = f.tell()
+    position = 0
+    objects: List[SegmentObject] = []
+    known_indices: Dict[str, RawDataIndex] = {}
+    while position + LEAD_IN_SIZE <= file_size:
+        f.seek(position)
+        lead_in = f.read(LEAD_IN_SIZE)
+        if lead_in[:4] != expected_tag:
+            raise ValueError(f"No TDMS segment at position {position}")
+        (toc,) = struct.unpack_from("<L", lead_in, 4)
+        endianness = ">" if toc & TOC_BIG_ENDIAN else "<"
+        (version, next_segment_offset, raw_data_offset) = struct.unpack_from(
+            endianness + "LQQ", lead_in, 8
+        )
+        if next_segment_offset == INCOMPLETE_SEGMENT:
+            next_segment_offset = file_size - position - LEAD_IN_SIZE
+        if toc & TOC_META_DATA:
+            meta_data = f.read(raw_data_offset)
+            if len(meta_data) < raw_data_offset:
+                raise ValueError(f"Meta data at position {position} is cut")
+            objects = parse_meta_data(
+                meta_data,
+                endianness,
+                objects,
+                known_indices,
+                bool(toc & TOC_NEW_OBJ_LIST),
+            )
+        else:
+            objects = [
+                o._replace(property_bytes=b"", listed=False) for o in objects
+            ]
+        segment = Segment(
+            position,
+            toc,
+            version,
+            next_segment_offset,
+            raw_data_offset,
+            objects,
+        )
+        yield segment
+        if is_index_file:
+            position += LEAD_IN_SIZE + raw_data_offset
+        else:
+            position = segment.end
+
+
+def encode_string(value: str, endianness: str = "<") -> bytes:
+    encoded = value.encode("utf-8")
+    return struct.pack(endianness + "L", len(encoded)) + encoded
+
+
+def encode_raw_data_index(
+    raw_data_index: Optional[RawDataIndex], endianness: str = "<"
+) -> bytes:
+    if raw_data_index is None:
+        return struct.pack(endianness + "L", NO_RAW_DATA)
+    if raw_data_index.total_size is not None:
+        return struct.pack(
+            endianness + "LLLQQ",
+            28,
+            raw_data_index.data_type,
+            1,
+            raw_data_index.number_of_values,
+            raw_data_index.total_size,
+        )
+    return struct.pack(
+        endianness + "LLLQ",
+        20,
+        raw_data_index.data_type,
+        1,
+        raw_data_index.number_of_values,
+    )
+
+
+def encode_meta_data(
+    objects: List[SegmentObject], endianness: str = "<"
+) -> bytes:
+    """Encodes objects as meta data of a segment with a new object list.
+    Objects without property bytes are written without properties.
+    """
+    parts = [struct.pack(endianness + "L", len(objects))]
+    for segment_object in objects:
+        parts.append(encode_string(segment_object.path, endianness))
+        parts.append(
+            encode_raw_data_index(segment_object.raw_data_index, endianness)
+        )
+        parts.append(
+            segment_object.property_bytes or struct.pack(endianness + "L", 0)
+        )
+    return b"".join(parts)
+
+
+def encode_lead_in(
+    toc: int,
+    version: int,
+    next_segment_offset: int,
+    raw_data_offset: int,
+    is_index_file: bool = False,
+) -> bytes:
+    endianness = ">" if toc & TOC_BIG_ENDIAN else "<"
+    return (
+        (b"TDSh" if is_index_file else b"TDSm")
+        + struct.pack("<L", toc)
+        + struct.pack(
+            endianness + "LQQ", version, next_segment_offset, raw_data_offset
+        )
+    )
+
+
+def split_raw_data(
+    data: np.ndarray,
+    value_sizes: List[int],
+    values_per_chunk: List[int],
+    interleaved: bool,
+) -> List[np.ndarray]:
+    """Splits the raw data of a segment into the values of its objects.
+
+    Arguments:
+    data: Raw data of all chunks of the segment as uint8 array
+    value_sizes: Size of a single value of each object in bytes
+    values_per_chunk: Number of values of each object in a chunk
+    interleaved: Whether the values of the objects are interleaved
+
+    Returns:
+    For each object a uint8 array of shape (number of values, value size)
+    """
+    if interleaved:
+        rows = data.reshape(-1, sum(value_sizes))
+        starts = np.cumsum([0] + value_sizes)
+        return [
+            rows[:, start : start + size]
+            for start, size in zip(starts, value_sizes)
+        ]
+    object_sizes = [s * n for s, n in zip(value_sizes, values_per_chunk)]
+    chunks = data.reshape(-1, sum(object_sizes))
+    starts = np.cumsum([0] + object_sizes)
+    return [
+        chunks[:, start : start + object_size].reshape(-1, size)
+        for start, object_size, size in zip(starts, object_sizes, value_sizes)
+    ]
+
+
+def join_raw_data(
+    values: List[np.ndarray], number_of_chunks: int, interleaved: bool
+) -> bytes:
+    """Joins the values of the objects of a segment to its raw data, the
+    inverse of split_raw_data.
+
+    Arguments:
+    values: For each object a uint8 array of shape (number of values, value size)
+    number_of_chunks: Number of chunks of the segment
+    interleaved: Whether the values of the objects are interleaved
+    """
+    if interleaved:
+        return np.concatenate(values, axis=1).tobytes()
+    return np.concatenate(
+        [v.reshape(number_of_chunks, -1) for v in values], axis=1
+    ).tobytes()
+
+
+def read_object_values(
+    f: BinaryIO, segment: Segment, path: str, dtype: Optional[str] = None
+) -> np.ndarray:
+    """Reads the values of one object from all chunks of a segment.
+
+    Values of types without a numpy equivalent are returned as raw bytes of
+    their size. Interleaved data is supported, strings are not.
+    """
+    data_objects = segment.data_objects
+    sizes = [TYPE_SIZES[o.raw_data_index.data_type] for o in data_objects]
+    number = [o.path for o in data_objects].index(path)
+    if dtype is None:
+        dtype = NUMPY_TYPES.get(
+            data_objects[number].raw_data_index.data_type, f"V{sizes[number]}",
+        )
+    dtype = np.dtype(dtype).newbyteorder(segment.endianness)
+
+    f.seek(segment.data_position)
+    data = np.frombuffer(
+        f.read(segment.number_of_chunks * segment.chunk_size), dtype=np.uint8
+    )
+    values = split_raw_data(
+        data,
+        sizes,
+        [o.raw_data_index.number_of_values for o in data_objects],
+        segment.interleaved,
+    )[number]
+    return np.ascontiguousarray(values).reshape(-1).view(dtype)
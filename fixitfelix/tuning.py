@@ -0,0 +1,196 @@
+"""Calibration of the disks a correction reads from and writes to.
+
+The best segment size, read block size and number of parallel reads differ
+between disks, e.g. local SSDs and network storage. tune reads the input
+file with several block sizes and numbers of threads, and writes into the
+output folder with several block sizes. For each setting, the smallest value
+that reaches TOLERANCE of the best measured bandwidth is chosen, so memory is
+only spent where the disks benefit from it:
+
+- segment_size: block size of the writes, in GB like MetaData.segment_size
+- read_block_size: block size of the reads of a single thread, used by
+  manifest.verify
+- workers: number of threads reading at the same time, used by
+  manifest.verify
+
+The pages of the input file are dropped from the page cache before each read
+where posix_fadvise is available, otherwise repeated reads of a small file
+may measure the memory instead of the disk.
+"""
+import concurrent.futures
+import os
+import pathlib
+import tempfile
+import time
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+from fixitfelix import page_cache, tdms_index
+
+BLOCK_SIZES = [1_000_000, 4_000_000, 16_000_000, 64_000_000, 256_000_000]
+
+WORKER_COUNTS = [1, 2, 4, 8, 16]
+
+# Bytes read or written per measurement
+CALIBRATION_BYTES = 256_000_000
+
+# Fraction of the best bandwidth the smallest chosen setting has to reach
+TOLERANCE = 0.9
+
+
+class Measurement(NamedTuple):
+    block_size: int
+    workers: int
+    bytes_per_second: float
+
+
+class Tuning(NamedTuple):
+    reads: List[Measurement]
+    writes: List[Measurement]
+    segment_size: float
+    read_block_size: int
+    workers: int
+
+
+def find_input_file(path: pathlib.Path) -> pathlib.Path:
+    """Returns path, or the largest TDMS file of the folder at path"""
+    if not path.is_dir():
+        return path
+    return max(
+        (
+            tdms_file
+            for tdms_file in path.iterdir()
+            if tdms_file.is_file() and not tdms_index.is_index_path(tdms_file)
+        ),
+        key=lambda tdms_file: tdms_file.stat().st_size,
+    )
+
+
+def read_stream(path: pathlib.Path, blocks: List[Tuple[int, int]]) -> int:
+    """Reads the blocks, given by position and size, of the file at path one
+    after the other and returns the number of bytes read
+    """
+    nbytes = 0
+    with path.open(mode="rb", buffering=0) as f:
+        for position, size in blocks:
+            f.seek(position)
+            nbytes += len(f.read(size))
+    return nbytes
+
+
+def measure_read(
+    path: pathlib.Path, block_size: int, workers: int, nbytes: int
+) -> Measurement:
+    """Reads the first nbytes of the file at path in blocks of block_size,
+    split into workers streams of consecutive blocks that are read at the
+    same time.
+    """
+    nbytes = min(nbytes, path.stat().st_size)
+    page_cache.advise_file(path, [(0, nbytes)], "POSIX_FADV_DONTNEED")
+    blocks = [
+        (position, min(block_size, nbytes - position))
+        for position in range(0, nbytes, block_size)
+    ]
+    streams = [
+        [blocks[number] for number in numbers]
+        for numbers in np.array_split(np.arange(len(blocks)), workers)
+    ]
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        read = sum(
+            executor.map(lambda stream: read_stream(path, stream), streams)
+        )
+    seconds = time.perf_counter() - start
+    return Measurement(block_size, workers, read / max(seconds, 1e-9))
+
+
+def measure_write(
+    export_dir: pathlib.Path, block_size: int, nbytes: int
+) -> Measurement:
+    """Writes nbytes in blocks of block_size into a temporary file in
+    export_dir, one after the other like the segments of fix.export_to_tmds,
+    and waits until they are on disk.
+    """
+    # Random bytes, as some file systems compress or skip zeros
+    block = np.random.default_rng(0).bytes(block_size)
+    with tempfile.TemporaryFile(dir=export_dir) as f:
+        start = time.perf_counter()
+        written = 0
+        while written < nbytes:
+            written += f.write(block[: nbytes - written])
+        f.flush()
+        os.fsync(f.fileno())
+        seconds = time.perf_counter() - start
+    return Measurement(block_size, 1, written / max(seconds, 1e-9))
+
+
+def choose_smallest(measurements: List[Measurement], field: str) -> int:
+    """Returns the smallest value of field of the measurements that reach
+    TOLERANCE of the best bandwidth
+    """
+    best = max(m.bytes_per_second for m in measurements)
+    return min(
+        getattr(m, field)
+        for m in measurements
+        if m.bytes_per_second >= TOLERANCE * best
+    )
+
+
+def tune(
+    path: pathlib.Path,
+    export_dir: pathlib.Path,
+    nbytes: int = CALIBRATION_BYTES,
+) -> Tuning:
+    """Measures the bandwidth of reads of the input and writes into the
+    output folder and chooses the settings of later corrections.
+
+    Arguments:
+    path: Path to the tdms file or folder with tdms files to correct
+    export_dir: Folder the corrected files are written to
+    nbytes: Number of bytes read or written per measurement
+
+    Returns:
+    Measurements and chosen settings
+    """
+    input_file = find_input_file(path)
+    nbytes = max(1, min(nbytes, input_file.stat().st_size))
+    # Blocks larger than a measurement only measure a single smaller block
+    block_sizes = [size for size in BLOCK_SIZES if size <= nbytes] or [
+        BLOCK_SIZES[0]
+    ]
+
+    reads = [measure_read(input_file, size, 1, nbytes) for size in block_sizes]
+    read_block_size = choose_smallest(reads, "block_size")
+    parallel_reads = [reads[block_sizes.index(read_block_size)]] + [
+        measure_read(input_file, read_block_size, workers, nbytes)
+        for workers in WORKER_COUNTS
+        if workers > 1
+    ]
+    writes = [measure_write(export_dir, size, nbytes) for size in block_sizes]
+    return Tuning(
+        reads=reads + parallel_reads[1:],
+        writes=writes,
+        segment_size=choose_smallest(writes, "block_size") / 1_000_000_000,
+        read_block_size=read_block_size,
+        workers=choose_smallest(parallel_reads, "workers"),
+    )
+
+
+def format_tuning(tuning: Tuning) -> str:
+    """Returns a human readable report of tuning"""
+    lines = []
+    for kind, measurements in [
+        ("Read", tuning.reads),
+        ("Write", tuning.writes),
+    ]:
+        for m in measurements:
+            lines.append(
+                f"{kind} {m.block_size / 1e6:g} MB blocks with {m.workers}"
+                f" threads: {m.bytes_per_second / 1e6:.0f} MB/s"
+            )
+    lines.append(
+        f"segment_size {tuning.segment_size:g} GB, read_block_size"
+        f" {tuning.read_block_size} bytes, {tuning.workers} workers"
+    )
+    return "\n".join(lines)
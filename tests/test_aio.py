@@ -0,0 +1,182 @@
+import asyncio
+import pathlib
+import time
+from concurrent import futures
+
+import nptdms
+import pytest
+
+from fixitfelix import aio, checkpoint, fix, manifest, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+    dtype="int32",
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+NAMES = ["a", "b", "c"]
+
+
+def write_folder(folder: pathlib.Path) -> None:
+    folder.mkdir()
+    for name in NAMES:
+        synthetic.write_synthetic_tdms(folder / f"{name}.tdms", SPEC)
+
+
+def test_corrects_folder_with_progress(tmpdir):
+    folder = pathlib.Path(tmpdir) / "campaign"
+    write_folder(folder)
+    export_folder = pathlib.Path(tmpdir) / "campaign_corrected"
+
+    async def correct():
+        with futures.ThreadPoolExecutor(2) as executor:
+            corrector = aio.Corrector(2, executor, executor)
+            return [
+                progress
+                async for progress in corrector.correct(str(folder), META)
+            ]
+
+    progresses = asyncio.run(correct())
+
+    finished = [p for p in progresses if p.channels_done == p.channels]
+    assert sorted(p.export_path.name for p in finished) == [
+        f"{name}_corrected.tdms" for name in NAMES
+    ]
+    assert all(p.channels == 2 and p.ranges == 101 for p in progresses)
+    samples = fix.count_preserved_values(6, 2, SPEC.total_samples)
+    for p in finished:
+        assert p.export_path.parent == export_folder
+        with nptdms.TdmsFile.open(str(p.export_path)) as tdms_file:
+            channel = tdms_file["Untitled"][synthetic.channel_name(0)]
+            assert len(channel) == samples
+        assert manifest.verify(p.export_path) == []
+    assert not list(export_folder.glob("*" + fix.PARTIAL_SUFFIX))
+
+
+def test_cancellation_removes_outputs(tmpdir, monkeypatch):
+    monkeypatch.setattr(aio, "PROGRESS_INTERVAL", 0.0)
+    read_chunk = fix.read_chunk
+
+    def slow_read_chunk(*args):
+        time.sleep(0.01)
+        return read_chunk(*args)
+
+    monkeypatch.setattr(fix, "read_chunk", slow_read_chunk)
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    export_path = pathlib.Path(tmpdir) / "source_corrected.tdms"
+
+    async def correct_until_first_progress():
+        progresses = aio.Corrector().correct(str(path), META)
+        progress = await progresses.__anext__()
+        assert progress.channels_done == 0
+        assert fix.partial_path(export_path).exists()
+        await progresses.aclose()
+
+    asyncio.run(correct_until_first_progress())
+    assert not export_path.exists()
+    assert not fix.partial_path(export_path).exists()
+    assert not checkpoint.checkpoint_path(export_path).exists()
+    assert not manifest.manifest_path(export_path).exists()
+
+
+def test_cancelled_task_removes_outputs(tmpdir, monkeypatch):
+    read_chunk = fix.read_chunk
+
+    def slow_read_chunk(*args):
+        time.sleep(0.01)
+        return read_chunk(*args)
+
+    monkeypatch.setattr(fix, "read_chunk", slow_read_chunk)
+    folder = pathlib.Path(tmpdir) / "campaign"
+    write_folder(folder)
+
+    async def cancel_correction():
+        corrector = aio.Corrector(max_corrections=2)
+        task = asyncio.ensure_future(
+            corrector.export_correct_data(str(folder), META)
+        )
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_correction())
+    assert list((pathlib.Path(tmpdir) / "campaign_corrected").iterdir()) == []
+
+
+def test_failed_folder_removes_outputs(tmpdir):
+    folder = pathlib.Path(tmpdir) / "campaign"
+    write_folder(folder)
+    (folder / "d.tdms").write_bytes(b"no tdms file")
+
+    async def correct():
+        corrector = aio.Corrector(max_corrections=4)
+        return await corrector.export_correct_data(str(folder), META)
+
+    with pytest.raises(Exception):
+        asyncio.run(correct())
+    assert list((pathlib.Path(tmpdir) / "campaign_corrected").iterdir()) == []
+
+
+def test_failed_correction_keeps_earlier_file(tmpdir):
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    output_file = str(pathlib.Path(tmpdir) / "out")
+    export_path = pathlib.Path(output_file + ".tdms")
+    asyncio.run(
+        aio.Corrector().export_correct_data(
+            str(path), META, output_file, with_overview=True
+        )
+    )
+    outputs = [export_path, *fix.sidecar_paths(export_path)]
+    contents = {p: p.read_bytes() for p in outputs if p.exists()}
+
+    with pytest.raises(Exception):
+        asyncio.run(
+            aio.Corrector().export_correct_data(
+                str(path), META._replace(chunk_size=7), output_file
+            )
+        )
+
+    assert {p: p.read_bytes() for p in outputs if p.exists()} == contents
+    assert manifest.verify(export_path) == []
+
+
+def test_failed_publishing_restores_earlier_files(tmpdir, monkeypatch):
+    folder = pathlib.Path(tmpdir) / "campaign"
+    write_folder(folder)
+    export_folder = pathlib.Path(tmpdir) / "campaign_corrected"
+    asyncio.run(aio.Corrector().export_correct_data(str(folder), META))
+    contents = {p: p.read_bytes() for p in export_folder.iterdir()}
+
+    rename_output = aio.rename_output
+    calls = []
+
+    def failing_rename_output(path, new_path):
+        calls.append(path)
+        # Fails to publish the second file after the first one
+        if len(calls) == 4:
+            raise OSError("rename failed")
+        rename_output(path, new_path)
+
+    monkeypatch.setattr(aio, "rename_output", failing_rename_output)
+    with pytest.raises(OSError):
+        asyncio.run(
+            aio.Corrector().export_correct_data(
+                str(folder), META._replace(segment_size=1)
+            )
+        )
+
+    assert {p: p.read_bytes() for p in export_folder.iterdir()} == contents
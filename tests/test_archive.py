@@ -0,0 +1,154 @@
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import archive, source, synthetic
+from tests import test_scanner
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=3,
+    dtype="int32",
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def test_calculate_periods_per_chunk(monkeypatch):
+    monkeypatch.setattr(archive, "CHUNK_BYTES", 100)
+    assert archive.calculate_periods_per_chunk(6, 4) == 4
+    assert archive.calculate_periods_per_chunk(60, 4) == 1
+
+
+@pytest.mark.parametrize("codec", archive.CODECS)
+def test_exports_archive(tmpdir, monkeypatch, codec):
+    # 10 periods per chunk
+    monkeypatch.setattr(archive, "CHUNK_BYTES", 240)
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(source_path, SPEC)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    archive.export_correct_data(
+        str(source_path), META, output_file, codec=codec, workers=2
+    )
+
+    path = pathlib.Path(output_file + archive.ARCHIVE_SUFFIX)
+    index = archive.load_index(path)
+    (group,) = index["groups"]
+    if codec != "npy":
+        for column in group["columns"]:
+            assert column["chunk_starts"] == [*range(0, 603, 60), 603]
+    for channel_number in range(SPEC.channel_count):
+        expected = synthetic.channel_values(
+            np.arange(603), channel_number, SPEC.dtype
+        )
+        name = synthetic.channel_name(channel_number)
+        data = archive.read_column(path, "Untitled", name)
+        assert data.dtype == np.dtype(SPEC.dtype)
+        np.testing.assert_array_equal(data, expected)
+        for (start, stop) in [(0, 1), (59, 61), (100, 603), (590, 700)]:
+            np.testing.assert_array_equal(
+                archive.read_column(path, "Untitled", name, start, stop),
+                expected[start:stop],
+            )
+
+
+def test_exports_folder_of_archives(tmpdir):
+    folder = pathlib.Path(tmpdir) / "measurements"
+    folder.mkdir()
+    for i in range(3):
+        synthetic.write_synthetic_tdms(folder / f"file_{i}.tdms", SPEC)
+    output_folder = pathlib.Path(tmpdir) / "archives"
+
+    archive.export_correct_data(str(folder), META, str(output_folder))
+
+    assert sorted(p.name for p in output_folder.iterdir()) == [
+        f"file_{i}_corrected{archive.ARCHIVE_SUFFIX}" for i in range(3)
+    ]
+    np.testing.assert_array_equal(
+        archive.read_column(
+            output_folder / f"file_0_corrected{archive.ARCHIVE_SUFFIX}",
+            "Untitled",
+            "A",
+        ),
+        np.arange(1, 604),
+    )
+
+
+def test_replaces_folder_of_archives_of_earlier_run(tmpdir):
+    folder = pathlib.Path(tmpdir) / "measurements"
+    folder.mkdir()
+    for i in range(2):
+        synthetic.write_synthetic_tdms(folder / f"file_{i}.tdms", SPEC)
+    output_folder = pathlib.Path(tmpdir) / "archives"
+
+    archive.export_correct_data(str(folder), META, str(output_folder))
+    archive.export_correct_data(str(folder), META, str(output_folder))
+
+    assert sorted(p.name for p in output_folder.iterdir()) == [
+        f"file_{i}_corrected{archive.ARCHIVE_SUFFIX}" for i in range(2)
+    ]
+    np.testing.assert_array_equal(
+        archive.read_column(
+            output_folder / f"file_1_corrected{archive.ARCHIVE_SUFFIX}",
+            "Untitled",
+            "A",
+        ),
+        np.arange(1, 604),
+    )
+
+
+def test_reads_window_of_archive(tmpdir, monkeypatch):
+    # 10 periods per chunk, the first chunk starts within a period
+    monkeypatch.setattr(archive, "CHUNK_BYTES", 240)
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(source_path, SPEC)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    archive.export_correct_data(
+        str(source_path),
+        META,
+        output_file,
+        file_selection=source.Selection(start=25),
+    )
+
+    path = pathlib.Path(output_file + archive.ARCHIVE_SUFFIX)
+    expected = np.arange(26, 604)
+    np.testing.assert_array_equal(
+        archive.read_column(path, "Untitled", "A"), expected
+    )
+    for (start, stop) in [(0, 1), (30, 40), (34, 36), (100, 578)]:
+        np.testing.assert_array_equal(
+            archive.read_column(path, "Untitled", "A", start, stop),
+            expected[start:stop],
+        )
+
+
+def test_exports_archive_of_restarted_file(tmpdir, monkeypatch):
+    monkeypatch.setattr(archive, "CHUNK_BYTES", 240)
+    source_path = pathlib.Path(tmpdir) / "restarted.tdms"
+    expected = test_scanner.write_restarted_file(source_path)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    archive.export_correct_data(
+        str(source_path), META, output_file, scan_drift=True
+    )
+
+    path = pathlib.Path(output_file + archive.ARCHIVE_SUFFIX)
+    np.testing.assert_array_equal(
+        archive.read_column(path, "Untitled", "A"), expected
+    )
+    for start in range(0, len(expected), 7):
+        np.testing.assert_array_equal(
+            archive.read_column(path, "Untitled", "A", start, start + 13),
+            expected[start : start + 13],
+        )
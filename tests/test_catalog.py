@@ -0,0 +1,167 @@
+import datetime
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import catalog, checkpoint, fix, manifest, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+    dtype="int32",
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+START_TIME = np.datetime64("2024-05-14T14:00:00")
+
+
+def write_source(path: pathlib.Path, start_time=START_TIME) -> None:
+    corrected = synthetic.corrected_indices(SPEC, 0, SPEC.total_samples)
+    with nptdms.TdmsWriter(str(path)) as tdms_writer:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject(
+                    "Untitled",
+                    name,
+                    synthetic.channel_values(
+                        corrected, channel_number, SPEC.dtype
+                    ),
+                    {"wf_start_time": start_time, "wf_increment": 0.001},
+                )
+                for channel_number, name in enumerate(["A", "B"])
+            ]
+        )
+
+
+def expected_positions(export_path: pathlib.Path, first: int, stop: int):
+    """Positions of the segments of channel A with values from first to stop"""
+    segments = manifest.read_channel_segments(export_path)["/'Untitled'/'A'"]
+    positions = []
+    start = 0
+    for segment in segments:
+        (data_object,) = segment.data_objects
+        samples = (
+            segment.number_of_chunks
+            * data_object.raw_data_index.number_of_values
+        )
+        if start < stop and start + samples > first:
+            positions.append(segment.position)
+        start += samples
+    return positions
+
+
+def test_finds_time_range(tmpdir):
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    write_source(source_path)
+    catalog_path = pathlib.Path(tmpdir) / "catalog.sqlite"
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    fix.export_correct_data(
+        str(source_path), META, output_file, catalog_path=catalog_path
+    )
+    export_path = pathlib.Path(output_file + ".tdms")
+
+    entries = catalog.find(
+        catalog_path,
+        datetime.datetime(2024, 5, 14, 14, 0, 0, 100000),
+        "2024-05-14T14:00:00.200",
+    )
+    assert [(e.group, e.channel) for e in entries] == [
+        ("Untitled", "A"),
+        ("Untitled", "B"),
+    ]
+    entry = entries[0]
+    assert entry.file == str(export_path.resolve())
+    assert (entry.first_sample, entry.samples) == (100, 100)
+    assert entry.segment_positions == expected_positions(export_path, 100, 200)
+
+    seconds = catalog.to_nanoseconds(START_TIME) / 1e9
+    (entry,) = catalog.find(
+        catalog_path, seconds + 0.5, seconds + 10, channels=["Untitled/B"]
+    )
+    assert (entry.channel, entry.first_sample, entry.samples) == ("B", 500, 103)
+    assert catalog.find(catalog_path, "2024-05-14T13:00", START_TIME) == []
+
+
+def test_resumed_export_is_recorded_once(tmpdir, monkeypatch):
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_INTERVAL", 0)
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    write_source(source_path)
+    catalog_path = pathlib.Path(tmpdir) / "catalog.sqlite"
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    read_chunk = fix.read_chunk
+    calls = []
+
+    def failing_read_chunk(*args):
+        calls.append(None)
+        if len(calls) > 150:
+            raise KeyboardInterrupt
+        return read_chunk(*args)
+
+    with monkeypatch.context() as m:
+        m.setattr(fix, "read_chunk", failing_read_chunk)
+        with pytest.raises(KeyboardInterrupt):
+            fix.export_correct_data(
+                str(source_path), META, output_file, catalog_path=catalog_path
+            )
+    fix.export_correct_data(
+        str(source_path),
+        META,
+        output_file,
+        resume=True,
+        catalog_path=catalog_path,
+    )
+
+    entries = catalog.find(catalog_path, 0, "2024-05-14T14:00:01")
+    assert [(e.first_sample, e.samples) for e in entries] == [(0, 603)] * 2
+    assert entries[0].segment_positions == expected_positions(
+        pathlib.Path(output_file + ".tdms"), 0, 603
+    )
+
+
+def test_records_final_names_of_folder(tmpdir):
+    folder = pathlib.Path(tmpdir) / "campaign"
+    folder.mkdir()
+    write_source(folder / "first.tdms")
+    write_source(folder / "second.tdms", START_TIME + np.timedelta64(1, "s"))
+    catalog_path = pathlib.Path(tmpdir) / "catalog.sqlite"
+    fix.export_correct_data(str(folder), META, "", catalog_path=catalog_path)
+
+    entries = catalog.find(
+        catalog_path,
+        "2024-05-14T14:00:00.500",
+        "2024-05-14T14:00:01.100",
+        ["A"],
+    )
+    assert [
+        (pathlib.Path(e.file).name, e.first_sample, e.samples) for e in entries
+    ] == [
+        ("first_corrected.tdms", 500, 103),
+        ("second_corrected.tdms", 0, 100),
+    ]
+
+
+def test_failed_folder_leaves_no_records(tmpdir):
+    folder = pathlib.Path(tmpdir) / "campaign"
+    folder.mkdir()
+    write_source(folder / "first.tdms")
+    (folder / "second.tdms").write_bytes(b"no tdms file")
+    catalog_path = pathlib.Path(tmpdir) / "catalog.sqlite"
+
+    with pytest.raises(Exception):
+        fix.export_correct_data(
+            str(folder), META, "", catalog_path=catalog_path
+        )
+
+    assert not list((pathlib.Path(tmpdir) / "campaign_corrected").iterdir())
+    assert catalog.find(catalog_path, 0, "2024-05-14T15:00") == []
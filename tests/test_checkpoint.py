@@ -0,0 +1,101 @@
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import checkpoint, fix, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=3,
+    segment_samples=100,
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def write_source(tmpdir) -> pathlib.Path:
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(source_path, SPEC)
+    return source_path
+
+
+def fail_after(monkeypatch, number_of_reads: int) -> None:
+    read_chunk = fix.read_chunk
+    calls = []
+
+    def failing_read_chunk(*args):
+        calls.append(None)
+        if len(calls) > number_of_reads:
+            raise KeyboardInterrupt
+        return read_chunk(*args)
+
+    monkeypatch.setattr(fix, "read_chunk", failing_read_chunk)
+
+
+def check_corrected(export_path: pathlib.Path) -> None:
+    samples = 100 * SPEC.chunk_size + 3
+    with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+        channels = tdms_file["Untitled"].channels()
+        assert len(channels) == SPEC.channel_count
+        for channel_number, channel in enumerate(channels):
+            np.testing.assert_array_equal(
+                channel[:],
+                synthetic.channel_values(
+                    np.arange(samples), channel_number, SPEC.dtype
+                ),
+            )
+
+
+@pytest.mark.parametrize("number_of_reads", [0, 30, 100, 150, 299])
+def test_resumes_interrupted_export(tmpdir, monkeypatch, number_of_reads):
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_INTERVAL", 0)
+    source_path = write_source(tmpdir)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    export_path = pathlib.Path(output_file + ".tdms")
+
+    with monkeypatch.context() as m:
+        fail_after(m, number_of_reads)
+        with pytest.raises(KeyboardInterrupt):
+            fix.export_correct_data(str(source_path), META, output_file)
+    assert checkpoint.checkpoint_path(export_path).exists()
+    assert not checkpoint.is_finished(export_path)
+
+    fix.export_correct_data(str(source_path), META, output_file, resume=True)
+    assert checkpoint.is_finished(export_path)
+    check_corrected(export_path)
+
+
+def test_resume_skips_finished_export(tmpdir, monkeypatch):
+    source_path = write_source(tmpdir)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    fix.export_correct_data(str(source_path), META, output_file)
+
+    fail_after(monkeypatch, 0)
+    fix.export_correct_data(str(source_path), META, output_file, resume=True)
+    check_corrected(pathlib.Path(output_file + ".tdms"))
+
+
+def test_checkpoint_of_other_export_is_ignored(tmpdir, monkeypatch):
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_INTERVAL", 0)
+    source_path = write_source(tmpdir)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    with monkeypatch.context() as m:
+        fail_after(m, 150)
+        with pytest.raises(KeyboardInterrupt):
+            fix.export_correct_data(
+                str(source_path), META, output_file, preserve_raw=True
+            )
+
+    fix.export_correct_data(str(source_path), META, output_file, resume=True)
+    check_corrected(pathlib.Path(output_file + ".tdms"))
@@ -0,0 +1,64 @@
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import fix, manifest, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=403,
+    channel_count=2,
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def write_folder(tmpdir, number_of_files: int) -> pathlib.Path:
+    folder = pathlib.Path(tmpdir) / "measurements"
+    folder.mkdir()
+    for i in range(number_of_files):
+        synthetic.write_synthetic_tdms(folder / f"file_{i}.tdms", SPEC)
+    return folder
+
+
+def test_exports_folder(tmpdir, monkeypatch):
+    monkeypatch.setattr(fix, "MAX_PENDING_FILES", 1)
+    folder = write_folder(tmpdir, 5)
+    output_folder = pathlib.Path(tmpdir) / "corrected"
+
+    fix.export_correct_data(str(folder), META, str(output_folder))
+
+    export_paths = sorted(output_folder.glob("*.tdms"))
+    assert [p.name for p in export_paths] == [
+        f"file_{i}_corrected.tdms" for i in range(5)
+    ]
+    for export_path in export_paths:
+        with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+            np.testing.assert_array_equal(
+                tdms_file["Untitled"]["A"][:], np.arange(1, 304)
+            )
+        assert manifest.verify(export_path) == []
+
+
+def test_writes_no_file_if_a_check_fails(tmpdir, monkeypatch):
+    monkeypatch.setattr(fix, "MAX_PENDING_FILES", 1)
+    folder = write_folder(tmpdir, 3)
+    with nptdms.TdmsWriter(str(folder / "file_3.tdms")) as tdms_writer:
+        tdms_writer.write_segment(
+            [nptdms.ChannelObject("Untitled", "A", np.arange(403))]
+        )
+    output_folder = pathlib.Path(tmpdir) / "corrected"
+
+    with pytest.raises(Exception):
+        fix.export_correct_data(str(folder), META, str(output_folder))
+
+    assert list(output_folder.iterdir()) == []
@@ -1,6 +1,10 @@
+import numpy as np
+import pandas as pd
+import pathlib
 import pytest
 
 import fixitfelix.fix as fix
+from fixitfelix import source, synthetic
 
 
 def test_works_for_examples():
@@ -29,4 +33,80 @@ def test_works_for_very_small_dataset():
     result = fix.calculate_index_ranges_to_preserve(
         chunk_size=8, recurrence_size=3, len_data=3
     )
-    assert result == [(0, 3)]
\ No newline at end of file
+    assert result == [(0, 3)]
+
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6, recurrence_size=2, recurrence_distance=3, total_samples=803
+)
+
+
+def raw_values(channel_count: int) -> np.ndarray:
+    corrected = synthetic.corrected_indices(SPEC, 0, SPEC.total_samples)
+    return np.stack(
+        [
+            synthetic.channel_values(corrected, channel, "float64")
+            for channel in range(channel_count)
+        ],
+        axis=1,
+    )
+
+
+@pytest.mark.parametrize("total_samples", [803, 800, 798, 3])
+def test_correct_array(total_samples):
+    data = raw_values(3)[:total_samples]
+    expected = data[fix.calculate_preserve_mask(6, 2, 0, total_samples)]
+
+    np.testing.assert_array_equal(fix.correct_array(data, META), expected)
+    np.testing.assert_array_equal(
+        fix.correct_array(data[:, 0], META), expected[:, 0]
+    )
+    np.testing.assert_array_equal(
+        fix.correct_array(data.T, META, axis=1), expected.T
+    )
+
+
+def test_correct_array_checks_repetition():
+    data = raw_values(2)
+    assert len(fix.correct_array(data, META, check=True)) == 603
+    with pytest.raises(Exception):
+        fix.correct_array(
+            data, META._replace(recurrence_distance=2), check=True
+        )
+    with pytest.raises(Exception):
+        fix.correct_array(np.arange(803), META, check=True)
+
+
+def test_correct_dataframe():
+    df = pd.DataFrame(raw_values(2), columns=["A", "B"])
+    df.index = df.index * 0.001
+
+    corrected = fix.correct_dataframe(df, META, check=True)
+    assert list(corrected.columns) == ["A", "B"]
+    np.testing.assert_array_equal(
+        corrected.to_numpy(), fix.correct_array(df.to_numpy(), META)
+    )
+    np.testing.assert_array_equal(corrected.index, df.index[:603])
+
+
+def test_lists_export_paths_in_order_of_names(tmpdir):
+    folder = pathlib.Path(tmpdir) / "campaign"
+    folder.mkdir()
+    names = ["c", "a", "d", "b"]
+    for name in names:
+        (folder / f"{name}.tdms").touch()
+    export_folder = pathlib.Path(tmpdir) / "campaign_corrected"
+
+    export_paths = fix.list_export_paths(folder, export_folder)
+
+    assert export_paths == [
+        (folder / f"{name}.tdms", export_folder / f"{name}_corrected.tdms")
+        for name in sorted(names)
+    ]
@@ -0,0 +1,145 @@
+import json
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import fix, incremental, source, synthetic, tdms_index
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def append_samples(path: pathlib.Path, start: int, stop: int) -> None:
+    corrected = synthetic.corrected_indices(SPEC, start, stop)
+    with nptdms.TdmsWriter(str(path), mode="a") as tdms_writer:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject(
+                    "Untitled",
+                    synthetic.channel_name(channel_number),
+                    synthetic.channel_values(
+                        corrected, channel_number, SPEC.dtype
+                    ),
+                )
+                for channel_number in range(SPEC.channel_count)
+            ]
+        )
+
+
+def check_corrected(export_path: pathlib.Path, raw_samples: int) -> None:
+    samples = fix.count_preserved_values(
+        SPEC.chunk_size, SPEC.recurrence_size, raw_samples
+    )
+    with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+        for channel_number, channel in enumerate(
+            tdms_file["Untitled"].channels()
+        ):
+            np.testing.assert_array_equal(
+                channel[:],
+                synthetic.channel_values(
+                    np.arange(samples), channel_number, SPEC.dtype
+                ),
+            )
+
+
+@pytest.mark.parametrize(
+    "start,stop,expected",
+    [
+        (0, 19, [(0, 6), (8, 6), (16, 3)]),
+        (3, 15, [(3, 3), (8, 6)]),
+        (6, 8, []),
+        (7, 17, [(8, 6), (16, 1)]),
+    ],
+)
+def test_calculate_index_ranges_between(start, stop, expected):
+    assert (
+        incremental.calculate_index_ranges_between(6, 2, start, stop)
+        == expected
+    )
+
+
+def test_refreshes_growing_file(tmpdir):
+    source_path = pathlib.Path(tmpdir) / "growing.tdms"
+    export_path = pathlib.Path(tmpdir) / "growing_corrected.tdms"
+
+    append_samples(source_path, 0, 205)
+    assert incremental.refresh_file(source_path, export_path, META) == 205
+    check_corrected(export_path, 205)
+
+    for (start, stop) in [(205, 403), (403, 406), (406, 803)]:
+        append_samples(source_path, start, stop)
+        assert (
+            incremental.refresh_file(source_path, export_path, META)
+            == stop - start
+        )
+        check_corrected(export_path, stop)
+        assert tdms_index.has_valid_index(export_path)
+    assert incremental.refresh_file(source_path, export_path, META) == 0
+
+    with incremental.state_path(export_path).open() as f:
+        state = json.load(f)
+    assert state["processed_samples"] == 803
+    assert state["phase"] == 3
+    assert state["corrected_samples"] == 603
+    assert state["size"] == export_path.stat().st_size
+
+
+def test_drops_interrupted_refresh(tmpdir):
+    source_path = pathlib.Path(tmpdir) / "growing.tdms"
+    export_path = pathlib.Path(tmpdir) / "growing_corrected.tdms"
+    append_samples(source_path, 0, 403)
+    incremental.refresh_file(source_path, export_path, META)
+    with export_path.open(mode="ab") as f:
+        f.write(b"TDSm incomplete")
+
+    append_samples(source_path, 403, 803)
+    incremental.refresh_file(source_path, export_path, META)
+    check_corrected(export_path, 803)
+
+
+def test_refuses_other_parameters(tmpdir):
+    source_path = pathlib.Path(tmpdir) / "growing.tdms"
+    export_path = pathlib.Path(tmpdir) / "growing_corrected.tdms"
+    append_samples(source_path, 0, 403)
+    incremental.refresh_file(source_path, export_path, META)
+
+    append_samples(source_path, 403, 803)
+    with pytest.raises(Exception):
+        incremental.refresh_file(
+            source_path, export_path, META._replace(recurrence_distance=2)
+        )
+
+
+def test_refuses_wrong_pattern_in_new_data(tmpdir):
+    source_path = pathlib.Path(tmpdir) / "growing.tdms"
+    export_path = pathlib.Path(tmpdir) / "growing_corrected.tdms"
+    append_samples(source_path, 0, 403)
+    incremental.refresh_file(source_path, export_path, META)
+
+    with nptdms.TdmsWriter(str(source_path), mode="a") as tdms_writer:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject(
+                    "Untitled",
+                    synthetic.channel_name(channel_number),
+                    np.arange(400, dtype=SPEC.dtype),
+                )
+                for channel_number in range(SPEC.channel_count)
+            ]
+        )
+    with pytest.raises(Exception):
+        incremental.refresh_file(source_path, export_path, META)
@@ -0,0 +1,219 @@
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+from click.testing import CliRunner
+
+from fixitfelix import (
+    cli,
+    inplace,
+    plan,
+    source,
+    synthetic,
+    tdms_index,
+    tdms_segments,
+)
+
+META = source.MetaData(
+    chunk_size=50,
+    recurrence_size=7,
+    recurrence_distance=5,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=50,
+    recurrence_size=7,
+    recurrence_distance=5,
+    total_samples=2000,
+    channel_count=3,
+    dtype="int32",
+    segment_samples=64,
+)
+CORRECTED_LENGTH = 1755
+
+
+def check_corrected(path: pathlib.Path) -> None:
+    group = nptdms.TdmsFile(path)["Untitled"]
+    for number, name in enumerate(["A", "B", "C"]):
+        expected = (number + 1) * np.arange(1, CORRECTED_LENGTH + 1)
+        assert np.array_equal(group[name][:], expected)
+
+
+def test_corrects_file_in_place(tmpdir):
+    path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    size = path.stat().st_size
+
+    inplace.correct_in_place(path, META)
+
+    check_corrected(path)
+    assert path.stat().st_size < size
+    assert not inplace.journal_path(path).exists()
+    assert tdms_index.has_valid_index(path)
+
+
+def test_refuses_correction_without_space_for_journal(tmpdir, monkeypatch):
+    monkeypatch.setattr(plan, "free_disk_space", lambda path: 0)
+    path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    content = path.read_bytes()
+
+    with pytest.raises(Exception):
+        inplace.correct_path_in_place(str(path), META)
+    assert path.read_bytes() == content
+    assert not inplace.journal_path(path).exists()
+
+    inplace.correct_path_in_place(str(path), META, ignore_free_space=True)
+    check_corrected(path)
+
+
+def test_resumes_interrupted_correction(tmpdir, monkeypatch):
+    path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+
+    compact_segment = inplace.compact_segment
+    calls = []
+
+    def crashing_compact_segment(f, plan, meta):
+        calls.append(plan)
+        if len(calls) == 10:
+            raise KeyboardInterrupt()
+        return compact_segment(f, plan, meta)
+
+    monkeypatch.setattr(inplace, "compact_segment", crashing_compact_segment)
+    with pytest.raises(KeyboardInterrupt):
+        inplace.correct_in_place(path, META)
+    monkeypatch.setattr(inplace, "compact_segment", compact_segment)
+
+    with pytest.raises(Exception):
+        inplace.correct_in_place(path, META)
+    inplace.resume_in_place(path)
+    check_corrected(path)
+
+
+def interrupt_correction(path: pathlib.Path, monkeypatch, segment: int):
+    """Runs an in-place correction of the file at path that crashes before
+    segment is rewritten
+    """
+    compact_segment = inplace.compact_segment
+    calls = []
+
+    def crashing_compact_segment(f, plan, meta):
+        calls.append(plan)
+        if len(calls) == segment + 1:
+            raise KeyboardInterrupt()
+        return compact_segment(f, plan, meta)
+
+    monkeypatch.setattr(inplace, "compact_segment", crashing_compact_segment)
+    with pytest.raises(KeyboardInterrupt):
+        inplace.correct_in_place(path, META)
+    monkeypatch.setattr(inplace, "compact_segment", compact_segment)
+
+
+@pytest.mark.parametrize("segment", [0, 1, 9, 27])
+def test_rolls_back_interrupted_correction(tmpdir, monkeypatch, segment):
+    folder = pathlib.Path(tmpdir) / "recording"
+    folder.mkdir()
+    path = folder / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    original = path.read_bytes()
+    interrupt_correction(path, monkeypatch, segment)
+
+    result = CliRunner().invoke(cli.main, ["rollback", str(folder)])
+
+    assert result.exit_code == 0, result.output
+    assert path.read_bytes() == original
+    assert not inplace.journal_path(path).exists()
+
+
+def test_rolls_back_truncated_file(tmpdir, monkeypatch):
+    path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    original = path.read_bytes()
+
+    def crashing_write_index_file(path):
+        raise KeyboardInterrupt()
+
+    # Crashes after every segment is rewritten and the file is truncated
+    monkeypatch.setattr(
+        tdms_index, "write_index_file", crashing_write_index_file
+    )
+    with pytest.raises(KeyboardInterrupt):
+        inplace.correct_in_place(path, META)
+    assert path.stat().st_size < len(original)
+
+    inplace.rollback_in_place(path)
+
+    assert path.read_bytes() == original
+
+
+def test_continues_interrupted_rollback(tmpdir, monkeypatch):
+    path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    original = path.read_bytes()
+    interrupt_correction(path, monkeypatch, 20)
+
+    restore_segment = inplace.restore_segment
+    calls = []
+
+    def crashing_restore_segment(*args):
+        calls.append(args)
+        if len(calls) == 5:
+            raise KeyboardInterrupt()
+        return restore_segment(*args)
+
+    monkeypatch.setattr(inplace, "restore_segment", crashing_restore_segment)
+    with pytest.raises(KeyboardInterrupt):
+        inplace.rollback_in_place(path)
+    monkeypatch.setattr(inplace, "restore_segment", restore_segment)
+
+    # A partly restored file can not be corrected further
+    with pytest.raises(Exception):
+        inplace.resume_in_place(path)
+    inplace.rollback_in_place(path)
+    assert path.read_bytes() == original
+
+
+def test_compacts_interleaved_segments(tmpdir):
+    path = pathlib.Path(tmpdir) / "interleaved.tdms"
+    spec = synthetic.SyntheticSpec(
+        chunk_size=6, recurrence_size=2, recurrence_distance=3, total_samples=19
+    )
+    values = synthetic.channel_values(
+        synthetic.corrected_indices(spec, 0, 19), 0, "<i4"
+    )
+    objects = [
+        tdms_segments.SegmentObject(
+            f"/'Untitled'/'{name}'", tdms_segments.RawDataIndex(3, 19), b""
+        )
+        for name in ["A", "B"]
+    ]
+    meta_data = tdms_segments.encode_meta_data(objects)
+    data = np.stack([values, 2 * values], axis=1).tobytes()
+    toc = (
+        tdms_segments.TOC_META_DATA
+        | tdms_segments.TOC_NEW_OBJ_LIST
+        | tdms_segments.TOC_RAW_DATA
+        | tdms_segments.TOC_INTERLEAVED_DATA
+    )
+    path.write_bytes(
+        tdms_segments.encode_lead_in(
+            toc, 4713, len(meta_data) + len(data), len(meta_data)
+        )
+        + meta_data
+        + data
+    )
+    meta = source.MetaData(
+        chunk_size=6,
+        recurrence_size=2,
+        recurrence_distance=3,
+        consistency_sample_size=10,
+        segment_size=0,
+    )
+
+    inplace.correct_in_place(path, meta)
+
+    group = nptdms.TdmsFile(path)["Untitled"]
+    assert np.array_equal(group["A"][:], np.arange(1, 16))
+    assert np.array_equal(group["B"][:], 2 * np.arange(1, 16))
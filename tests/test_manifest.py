@@ -0,0 +1,125 @@
+import json
+import pathlib
+
+import nptdms
+import numpy as np
+import pytest
+
+from fixitfelix import checkpoint, fix, manifest, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=3,
+    dtype="int16",
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def export(tmpdir, **kwargs) -> pathlib.Path:
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    if not source_path.exists():
+        synthetic.write_synthetic_tdms(source_path, SPEC)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    fix.export_correct_data(str(source_path), META, output_file, **kwargs)
+    return pathlib.Path(output_file + ".tdms")
+
+
+def test_object_path():
+    assert manifest.object_path("Untitled", "A") == "/'Untitled'/'A'"
+    assert manifest.object_path("It's", "A") == "/'It''s'/'A'"
+
+
+@pytest.mark.parametrize("preserve_raw", [False, True])
+def test_manifest_matches_export(tmpdir, preserve_raw):
+    export_path = export(tmpdir, preserve_raw=preserve_raw)
+
+    with manifest.manifest_path(export_path).open() as f:
+        content = json.load(f)
+    assert content["size"] == export_path.stat().st_size
+    assert [c["channel"] for c in content["channels"]] == ["A", "B", "C"]
+    for c in content["channels"]:
+        assert c["samples"] == c["expected_samples"] == 603
+        assert len(c["segments"]) == 101
+    assert manifest.verify(export_path, workers=2) == []
+
+
+def test_verify_finds_changed_data(tmpdir):
+    export_path = export(tmpdir)
+    with export_path.open(mode="r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\xff")
+
+    assert manifest.verify(export_path) == [
+        "Untitled/C: segment 100 differs",
+        "Untitled/C: checksum differs",
+    ]
+
+
+def test_verify_finds_cut_file(tmpdir):
+    export_path = export(tmpdir)
+    with export_path.open(mode="r+b") as f:
+        f.truncate(export_path.stat().st_size - 10)
+
+    assert manifest.verify(export_path) != []
+
+
+def test_manifest_of_resumed_export(tmpdir, monkeypatch):
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_INTERVAL", 0)
+    read_chunk = fix.read_chunk
+    calls = []
+
+    def failing_read_chunk(*args):
+        calls.append(None)
+        if len(calls) > 150:
+            raise KeyboardInterrupt
+        return read_chunk(*args)
+
+    with monkeypatch.context() as m:
+        m.setattr(fix, "read_chunk", failing_read_chunk)
+        with pytest.raises(KeyboardInterrupt):
+            export(tmpdir)
+
+    export_path = export(tmpdir, resume=True)
+    assert manifest.verify(export_path) == []
+
+
+@pytest.mark.parametrize("kind", ["string", "timestamp"])
+def test_manifest_of_values_encoded_in_file(tmpdir, kind):
+    corrected = synthetic.corrected_indices(SPEC, 0, SPEC.total_samples)
+    if kind == "string":
+        values = np.array([f"value {i}" for i in corrected])
+    else:
+        values = np.datetime64("2024-05-14T14:02", "us") + corrected.astype(
+            "timedelta64[ms]"
+        )
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    with nptdms.TdmsWriter(str(source_path)) as tdms_writer:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject("Untitled", "A", corrected + 1),
+                nptdms.ChannelObject("Untitled", "B", values),
+            ]
+        )
+
+    export_path = export(tmpdir)
+
+    with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+        written = tdms_file["Untitled"]["B"][:]
+    assert len(written) == 603
+    assert list(written[:8]) == list(values[[0, 1, 2, 3, 4, 5, 8, 9]])
+    assert manifest.verify(export_path) == []
+
+    with export_path.open(mode="r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\xff")
+    assert "Untitled/B: segment 100 differs" in manifest.verify(export_path)
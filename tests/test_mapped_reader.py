@@ -0,0 +1,98 @@
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import mapped_reader, synthetic, tdms_index
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+    dtype="int16",
+    segment_samples=100,
+)
+
+SCALING = {
+    "NI_Number_Of_Scales": 1,
+    "NI_Scale[0]_Scale_Type": "Linear",
+    "NI_Scale[0]_Linear_Slope": 0.5,
+    "NI_Scale[0]_Linear_Y_Intercept": 1.0,
+}
+
+RANGES = [(0, 803), (0, 1), (5, 90), (95, 10), (150, 400), (800, 10), (803, 5)]
+
+
+def map_channels(path: pathlib.Path, tdms_file):
+    channels = [
+        (group, channel)
+        for group in tdms_file.groups()
+        for channel in group.channels()
+    ]
+    return mapped_reader.MappedFile(path).map_channels(tdms_file, channels)
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_reads_like_nptdms(tmpdir, indexed):
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    if indexed:
+        tdms_index.write_index_file(path)
+    with nptdms.TdmsFile.open(str(path)) as tdms_file:
+        for _, channel in map_channels(path, tdms_file):
+            assert isinstance(channel, mapped_reader.MappedChannel)
+            for offset, length in RANGES:
+                data = channel.read_data(offset=offset, length=length)
+                assert data.dtype == channel.dtype
+                np.testing.assert_array_equal(
+                    data,
+                    channel.channel.read_data(offset=offset, length=length),
+                )
+            # Values within a chunk are not copied
+            assert np.shares_memory(
+                channel.read_data(offset=5, length=90), channel.data
+            )
+
+
+def test_scaled_channel_reads_raw_values_only(tmpdir):
+    path = pathlib.Path(tmpdir) / "scaled.tdms"
+    with nptdms.TdmsWriter(str(path)) as tdms_writer:
+        for start in range(0, 300, 100):
+            tdms_writer.write_segment(
+                [
+                    nptdms.ChannelObject(
+                        "G",
+                        "A",
+                        np.arange(start, start + 100, dtype=np.int32),
+                        SCALING,
+                    )
+                ]
+            )
+    with nptdms.TdmsFile.open(str(path)) as tdms_file:
+        ((_, channel),) = map_channels(path, tdms_file)
+        assert isinstance(channel, mapped_reader.MappedChannel)
+        np.testing.assert_array_equal(
+            channel.read_data(offset=50, length=200, scaled=False),
+            np.arange(50, 250),
+        )
+        np.testing.assert_array_equal(
+            channel.read_data(offset=50, length=200),
+            np.arange(50, 250) * 0.5 + 1.0,
+        )
+
+
+def test_strings_are_not_mapped(tmpdir):
+    path = pathlib.Path(tmpdir) / "strings.tdms"
+    with nptdms.TdmsWriter(str(path)) as tdms_writer:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject("G", "A", np.array(["a", "bc"])),
+                nptdms.ChannelObject("G", "B", np.arange(2)),
+            ]
+        )
+    with nptdms.TdmsFile.open(str(path)) as tdms_file:
+        (_, strings), (_, numbers) = map_channels(path, tdms_file)
+        assert isinstance(strings, nptdms.TdmsChannel)
+        assert isinstance(numbers, mapped_reader.MappedChannel)
@@ -0,0 +1,192 @@
+import json
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import (
+    fix,
+    manifest,
+    merge,
+    overview,
+    plan,
+    source,
+    synthetic,
+)
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6, recurrence_size=2, recurrence_distance=3, total_samples=0
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=1,
+)
+
+# Raw lengths of the consecutive files of the recording, which end within
+# chunks and within recurrences
+PARTS = [43, 365, 404]
+
+
+def write_parts(
+    folder: pathlib.Path,
+    lengths=PARTS,
+    channels=("A", "B"),
+    name="part_{}.tdms",
+):
+    folder.mkdir()
+    raw = synthetic.corrected_indices(SPEC, 0, sum(lengths))
+    for number, (start, length) in enumerate(
+        zip(np.cumsum([0] + lengths), lengths)
+    ):
+        with nptdms.TdmsWriter(str(folder / name.format(number))) as writer:
+            writer.write_segment(
+                [
+                    nptdms.ChannelObject(
+                        "Untitled",
+                        name,
+                        synthetic.channel_values(
+                            raw[start : start + length], channel_number, "int32"
+                        ),
+                    )
+                    for channel_number, name in enumerate(channels)
+                ]
+            )
+
+
+def test_merges_recording(tmpdir):
+    folder = pathlib.Path(tmpdir) / "recording"
+    write_parts(folder)
+    export_path = merge.export_correct_data(
+        str(folder), META, "", with_overview=True
+    )
+
+    assert export_path == pathlib.Path(tmpdir) / "recording_corrected.tdms"
+    samples = fix.count_preserved_values(6, 2, sum(PARTS))
+    with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+        for channel_number, name in enumerate(["A", "B"]):
+            np.testing.assert_array_equal(
+                tdms_file["Untitled"][name][:],
+                synthetic.channel_values(
+                    np.arange(samples), channel_number, "int32"
+                ),
+            )
+    assert manifest.verify(export_path) == []
+    # Each channel is one segment that spans the borders of the files
+    segments = manifest.read_channel_segments(export_path)
+    assert [len(s) for s in segments.values()] == [1, 1]
+    assert overview.overview_path(export_path).exists()
+
+    with fix.parts_path(export_path).open() as f:
+        table = json.load(f)["parts"]
+    assert [part["file"] for part in table] == [
+        "part_0.tdms",
+        "part_1.tdms",
+        "part_2.tdms",
+    ]
+    assert [part["source_offset"] for part in table] == [0, 43, 408]
+    assert [part["start"] for part in table] == [0, 33, 306]
+    assert sum(part["samples"] for part in table) == samples
+
+
+def test_refuses_broken_pattern(tmpdir):
+    folder = pathlib.Path(tmpdir) / "recording"
+    write_parts(folder)
+    # The second file does not continue the pattern of the first one
+    (folder / "part_0.tdms").rename(folder / "part_3.tdms")
+    with pytest.raises(Exception):
+        merge.export_correct_data(str(folder), META, "")
+    assert not (pathlib.Path(tmpdir) / "recording_corrected.tdms").exists()
+
+
+def test_refuses_different_channels(tmpdir):
+    folder = pathlib.Path(tmpdir) / "recording"
+    write_parts(folder)
+    (folder / "part_2.tdms").unlink()
+    write_parts(pathlib.Path(tmpdir) / "other", channels=("A", "C"))
+    (pathlib.Path(tmpdir) / "other" / "part_2.tdms").rename(
+        folder / "part_2.tdms"
+    )
+    with pytest.raises(Exception):
+        merge.export_correct_data(str(folder), META, "")
+
+
+def test_sorts_numbers_in_names_by_value(tmpdir):
+    folder = pathlib.Path(tmpdir) / "recording"
+    write_parts(folder, [43] * 12, name="p{}.tdms")
+    assert [p.name for p in merge.list_part_paths(folder)] == [
+        f"p{number}.tdms" for number in range(12)
+    ]
+
+    export_path = merge.export_correct_data(str(folder), META, "")
+
+    samples = fix.count_preserved_values(6, 2, 43 * 12)
+    with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+        np.testing.assert_array_equal(
+            tdms_file["Untitled"]["A"][:],
+            synthetic.channel_values(np.arange(samples), 0, "int32"),
+        )
+
+
+def test_merges_more_files_than_can_be_open(tmpdir):
+    resource = pytest.importorskip("resource")
+    folder = pathlib.Path(tmpdir) / "recording"
+    write_parts(folder, [43] * 150, name="p{}.tdms")
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (100, hard))
+    try:
+        export_path = merge.export_correct_data(str(folder), META, "")
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    samples = fix.count_preserved_values(6, 2, 43 * 150)
+    with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+        np.testing.assert_array_equal(
+            tdms_file["Untitled"]["B"][:],
+            synthetic.channel_values(np.arange(samples), 1, "int32"),
+        )
+    assert manifest.verify(export_path) == []
+
+
+def test_failed_merge_keeps_previous_file(tmpdir, monkeypatch):
+    folder = pathlib.Path(tmpdir) / "recording"
+    write_parts(folder)
+    export_path = merge.export_correct_data(str(folder), META, "")
+    content = export_path.read_bytes()
+    read_chunk = fix.read_chunk
+    calls = []
+
+    def failing_read_chunk(*args):
+        calls.append(None)
+        if len(calls) > 50:
+            raise KeyboardInterrupt
+        return read_chunk(*args)
+
+    monkeypatch.setattr(fix, "read_chunk", failing_read_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        merge.export_correct_data(str(folder), META, "")
+
+    assert export_path.read_bytes() == content
+    assert manifest.verify(export_path) == []
+    assert sorted(p.name for p in pathlib.Path(tmpdir).iterdir()) == [
+        "recording",
+        "recording_corrected.tdms",
+        "recording_corrected.tdms.fixit_manifest",
+        "recording_corrected.tdms.fixit_parts",
+        "recording_corrected.tdms_index",
+    ]
+
+
+def test_plan_reserves_space_for_table_of_parts(tmpdir):
+    folder = pathlib.Path(tmpdir) / "recording"
+    write_parts(folder)
+    run_plan = plan.plan_run(str(folder), META, "")
+    merged_plan = plan.plan_run(str(folder), META, "", merged=True)
+
+    export_path = merge.export_correct_data(str(folder), META, "")
+
+    table_size = fix.parts_path(export_path).stat().st_size
+    assert table_size <= merged_plan.sidecar_bytes - run_plan.sidecar_bytes
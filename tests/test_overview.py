@@ -0,0 +1,131 @@
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import checkpoint, fix, overview, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+    dtype="int32",
+    segment_samples=100,
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+SAMPLES = 603
+
+
+@pytest.fixture(autouse=True)
+def small_buckets(monkeypatch):
+    monkeypatch.setattr(overview, "FIRST_BUCKET_SAMPLES", 8)
+    monkeypatch.setattr(overview, "FACTOR", 4)
+
+
+def export(tmpdir, **kwargs) -> pathlib.Path:
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    if not source_path.exists():
+        synthetic.write_synthetic_tdms(source_path, SPEC)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    fix.export_correct_data(
+        str(source_path), META, output_file, with_overview=True, **kwargs
+    )
+    return pathlib.Path(output_file + ".tdms")
+
+
+def expected_buckets(channel_number: int, bucket_samples: int):
+    values = synthetic.channel_values(
+        np.arange(SAMPLES), channel_number, SPEC.dtype
+    )
+    buckets = [
+        values[start : start + bucket_samples]
+        for start in range(0, SAMPLES, bucket_samples)
+    ]
+    return (
+        np.array([b.min() for b in buckets]),
+        np.array([b.max() for b in buckets]),
+        np.array([b.mean() for b in buckets]),
+    )
+
+
+@pytest.mark.parametrize("lengths", [[603], [5, 3, 100, 495], [1] * 603])
+def test_builds_levels_from_parts(lengths):
+    values = synthetic.channel_values(np.arange(SAMPLES), 1, SPEC.dtype)
+    builder = overview.PyramidBuilder()
+    for start, length in zip(np.cumsum([0] + lengths), lengths):
+        builder.add(values[start : start + length])
+    levels = builder.finish()
+
+    assert [level["bucket_samples"] for level in levels] == [
+        8,
+        32,
+        128,
+        512,
+        2048,
+    ]
+    assert len(levels[-1]["min"]) == 1
+    for level in levels:
+        for actual, expected in zip(
+            (level["min"], level["max"], level["mean"]),
+            expected_buckets(1, level["bucket_samples"]),
+        ):
+            np.testing.assert_allclose(actual, expected)
+
+
+@pytest.mark.parametrize(
+    "start,stop,pixels,bucket_samples",
+    [(0, None, 10, 32), (0, None, 4, 128), (100, 300, 20, 8), (50, 60, 5, 1)],
+)
+def test_reads_level_for_pixels(tmpdir, start, stop, pixels, bucket_samples):
+    export_path = export(tmpdir)
+    result = overview.read_overview(
+        export_path, "Untitled", "B", start, stop, pixels
+    )
+
+    assert result.bucket_samples == bucket_samples
+    first = start // bucket_samples
+    assert result.start == first * bucket_samples
+    expected = expected_buckets(1, bucket_samples)
+    last = first + len(result.min)
+    assert last * bucket_samples >= (stop or SAMPLES)
+    for actual, values in zip(result[2:], expected):
+        np.testing.assert_allclose(actual, values[first:last])
+
+
+def test_resumed_export_has_complete_overview(tmpdir, monkeypatch):
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_INTERVAL", 0)
+    read_chunk = fix.read_chunk
+    calls = []
+
+    def failing_read_chunk(*args):
+        calls.append(None)
+        if len(calls) > 150:
+            raise KeyboardInterrupt
+        return read_chunk(*args)
+
+    with monkeypatch.context() as m:
+        m.setattr(fix, "read_chunk", failing_read_chunk)
+        with pytest.raises(KeyboardInterrupt):
+            export(tmpdir)
+    export_path = export(tmpdir, resume=True)
+
+    for channel_number, name in enumerate(["A", "B"]):
+        result = overview.read_overview(
+            export_path, "Untitled", name, pixels=600
+        )
+        assert result.bucket_samples == 1
+        result = overview.read_overview(export_path, "Untitled", name, pixels=1)
+        assert result.bucket_samples == 512
+        for actual, expected in zip(
+            result[2:], expected_buckets(channel_number, 512)
+        ):
+            np.testing.assert_allclose(actual, expected)
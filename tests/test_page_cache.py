@@ -0,0 +1,79 @@
+import mmap
+import os
+import pathlib
+
+import numpy as np
+import pytest
+
+from fixitfelix import fix, mapped_reader, page_cache, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=20_003,
+    channel_count=2,
+    dtype="int32",
+    segment_samples=5_000,
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def test_piece_ranges_join_adjacent_pieces():
+    pieces = mapped_reader.ChannelPieces(
+        starts=np.array([0, 10, 20]),
+        lengths=np.array([10, 10, 10]),
+        positions=np.array([100, 140, 500]),
+        dtype=np.dtype("int32"),
+    )
+    assert page_cache.piece_ranges(pieces, 5, 25) == [(120, 180), (500, 520)]
+    assert page_cache.piece_ranges(pieces, 10, 20) == [(140, 180)]
+    assert page_cache.piece_ranges(pieces, 30, 40) == []
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "posix_fadvise"), reason="needs posix_fadvise"
+)
+def test_drops_pages_of_export(tmpdir, monkeypatch):
+    monkeypatch.setattr(page_cache, "FLUSH_BATCH", 20_000)
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    fix.export_correct_data(str(path), META, str(pathlib.Path(tmpdir) / "a"))
+
+    advices = []
+    posix_fadvise = os.posix_fadvise
+
+    def recording_fadvise(fd, offset, length, advice):
+        advices.append((os.readlink(f"/proc/self/fd/{fd}"), offset, advice))
+        assert offset % mmap.PAGESIZE == 0 and length % mmap.PAGESIZE == 0
+        posix_fadvise(fd, offset, length, advice)
+
+    monkeypatch.setattr(os, "posix_fadvise", recording_fadvise)
+    fix.export_correct_data(
+        str(path), META, str(pathlib.Path(tmpdir) / "b"), drop_cache=True
+    )
+
+    export_path = pathlib.Path(tmpdir) / "b.tdms"
+    assert (
+        export_path.read_bytes()
+        == (pathlib.Path(tmpdir) / "a.tdms").read_bytes()
+    )
+    dropped_output = [
+        offset
+        for (name, offset, advice) in advices
+        if name == str(export_path) and advice == os.POSIX_FADV_DONTNEED
+    ]
+    # The corrected file is written to disk in several batches
+    assert len(dropped_output) > 2
+    assert dropped_output == sorted(dropped_output)
+    assert {a for (name, _, a) in advices if name == str(path)} == {
+        os.POSIX_FADV_WILLNEED,
+        os.POSIX_FADV_DONTNEED,
+    }
@@ -0,0 +1,224 @@
+import pathlib
+import pytest
+from click.testing import CliRunner
+
+from fixitfelix import (
+    archive,
+    checkpoint,
+    cli,
+    config,
+    fix,
+    manifest,
+    overview,
+    plan,
+    source,
+    synthetic,
+    tdms_index,
+)
+
+
+def make_meta(segment_size: int) -> source.MetaData:
+    return source.MetaData(
+        chunk_size=50,
+        recurrence_size=7,
+        recurrence_distance=5,
+        consistency_sample_size=10,
+        segment_size=segment_size,
+    )
+
+
+@pytest.mark.parametrize("segment_size", [0, 1])
+def test_predicts_exact_output_size(tmpdir, segment_size):
+    spec = synthetic.SyntheticSpec(
+        chunk_size=50,
+        recurrence_size=7,
+        recurrence_distance=5,
+        total_samples=1003,
+        dtype="float32",
+        segment_samples=100,
+    )
+    tdms_path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(tdms_path, spec)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    meta = make_meta(segment_size)
+
+    run_plan = plan.plan_run(
+        str(tdms_path), meta, output_file, with_calibration=True
+    )
+    fix.export_correct_data(
+        filename=str(tdms_path), meta=meta, output_file=output_file
+    )
+
+    (file_plan,) = run_plan.files
+    assert file_plan.export_path.stat().st_size == file_plan.output_bytes
+    assert run_plan.output_bytes == file_plan.output_bytes
+    assert file_plan.channels[0].samples == 884
+    assert file_plan.segments == 4 * (18 if segment_size == 0 else 1)
+    assert run_plan.estimated_seconds > 0
+    assert run_plan.enough_space
+
+
+def test_reserves_space_for_sidecar_files(tmpdir, monkeypatch):
+    checkpoint_sizes = []
+    save = checkpoint.save
+
+    def recording_save(export_path, *args):
+        save(export_path, *args)
+        checkpoint_sizes.append(
+            checkpoint.checkpoint_path(export_path).stat().st_size
+        )
+
+    monkeypatch.setattr(checkpoint, "save", recording_save)
+    spec = synthetic.SyntheticSpec(
+        chunk_size=50,
+        recurrence_size=7,
+        recurrence_distance=5,
+        total_samples=30_003,
+        channel_count=3,
+        dtype="float32",
+    )
+    tdms_path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(tdms_path, spec)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    run_plan = plan.plan_run(
+        str(tdms_path), make_meta(0), output_file, with_overview=True
+    )
+    fix.export_correct_data(
+        filename=str(tdms_path),
+        meta=make_meta(0),
+        output_file=output_file,
+        with_overview=True,
+    )
+
+    (file_plan,) = run_plan.files
+    sidecar_sizes = [max(checkpoint_sizes)] + [
+        path.stat().st_size
+        for path in [
+            manifest.manifest_path(file_plan.export_path),
+            tdms_index.index_path(file_plan.export_path),
+            overview.overview_path(file_plan.export_path),
+        ]
+    ]
+    assert sum(sidecar_sizes) <= file_plan.sidecar_bytes
+    assert file_plan.sidecar_bytes < 1.1 * sum(sidecar_sizes)
+    assert run_plan.needed_bytes == (
+        file_plan.output_bytes + file_plan.sidecar_bytes
+    )
+
+
+def test_covers_all_files_of_folder(tmpdir):
+    folder = pathlib.Path("tests/assets/example_folder")
+    run_plan = plan.plan_run(
+        str(folder), make_meta(0), str(pathlib.Path(tmpdir) / "output")
+    )
+    assert len(run_plan.files) == 2
+    assert run_plan.estimated_seconds is None
+    assert not (pathlib.Path(tmpdir) / "output").exists()
+
+
+def test_refuses_without_free_space():
+    run_plan = plan.RunPlan(
+        files=[],
+        output_bytes=2_000,
+        sidecar_bytes=0,
+        free_bytes=1_000,
+        peak_memory=0,
+        estimated_seconds=None,
+    )
+    with pytest.raises(Exception):
+        plan.check_free_space(run_plan)
+    plan.check_free_space(run_plan, warn_only=True)
+
+
+def test_counts_sidecar_files():
+    run_plan = plan.RunPlan(
+        files=[],
+        output_bytes=900,
+        sidecar_bytes=200,
+        free_bytes=1_000,
+        peak_memory=0,
+        estimated_seconds=None,
+    )
+    assert not run_plan.enough_space
+    with pytest.raises(Exception):
+        plan.check_free_space(run_plan)
+
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=50,
+    recurrence_size=7,
+    recurrence_distance=5,
+    total_samples=1003,
+    dtype="float32",
+    segment_samples=100,
+)
+
+
+def invoke_fix(tmpdir, monkeypatch, args):
+    config_path = pathlib.Path(tmpdir) / "config.yaml"
+    monkeypatch.setattr(cli, "PATH_TO_CONFIG", config_path)
+    monkeypatch.setattr(
+        cli, "CLI_CONFIG", config.CliConfig.from_yaml(config_path)
+    )
+    return CliRunner().invoke(
+        cli.main,
+        [
+            "fix",
+            "--recurrence_size",
+            "7",
+            "--recurrence_distance",
+            "5",
+            "--chunk_size",
+            "50",
+            "-c",
+            "10",
+            "-s",
+            "0",
+        ]
+        + args,
+    )
+
+
+@pytest.mark.parametrize(
+    "mode", [["--in_place"], ["--incremental"], ["--archive", "npy"]]
+)
+def test_cli_refuses_dry_run_of_other_modes(tmpdir, monkeypatch, mode):
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    size = path.stat().st_size
+
+    result = invoke_fix(tmpdir, monkeypatch, [str(path), "--dry_run"] + mode)
+
+    assert result.exit_code == 2
+    assert "--dry_run can not be combined" in result.output
+    assert path.stat().st_size == size
+    assert not (pathlib.Path(tmpdir) / "source_corrected.tdms").exists()
+
+
+def test_cli_checks_free_space_of_archive(tmpdir, monkeypatch):
+    monkeypatch.setattr(plan, "free_disk_space", lambda path: 0)
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    result = invoke_fix(
+        tmpdir, monkeypatch, [str(path), "-o", output_file, "--archive", "npy"],
+    )
+    assert result.exit_code != 0
+    assert not pathlib.Path(output_file + archive.ARCHIVE_SUFFIX).exists()
+
+    result = invoke_fix(
+        tmpdir,
+        monkeypatch,
+        [
+            str(path),
+            "-o",
+            output_file,
+            "--archive",
+            "npy",
+            "--ignore_free_space",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert pathlib.Path(output_file + archive.ARCHIVE_SUFFIX).exists()
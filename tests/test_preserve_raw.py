@@ -0,0 +1,152 @@
+import nptdms
+import numpy as np
+import pathlib
+import struct
+
+from fixitfelix import fix, plan, source, synthetic, tdms_segments
+
+SCALING = {
+    "NI_Number_Of_Scales": 1,
+    "NI_Scale[0]_Scale_Type": "Linear",
+    "NI_Scale[0]_Linear_Slope": 0.5,
+    "NI_Scale[0]_Linear_Y_Intercept": 1.0,
+}
+
+# Scale 0 is the DAQmx scaler, which has no properties
+DAQMX_SCALING = {
+    "NI_Number_Of_Scales": 2,
+    "NI_Scale[1]_Scale_Type": "Linear",
+    "NI_Scale[1]_Linear_Slope": 0.5,
+    "NI_Scale[1]_Linear_Y_Intercept": 1.0,
+    "NI_Scale[1]_Linear_Input_Source": 0,
+}
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def source_values() -> np.ndarray:
+    spec = synthetic.SyntheticSpec(
+        chunk_size=6, recurrence_size=2, recurrence_distance=3, total_samples=19
+    )
+    return synthetic.channel_values(
+        synthetic.corrected_indices(spec, 0, 19), 0, "int16"
+    )
+
+
+def encode_property(name: str, value) -> bytes:
+    """Encodes a property of type uint32, double or string"""
+    if isinstance(value, str):
+        encoded = struct.pack("<L", 0x20) + tdms_segments.encode_string(value)
+    elif isinstance(value, float):
+        encoded = struct.pack("<Ld", 10, value)
+    else:
+        encoded = struct.pack("<LL", 7, value)
+    return tdms_segments.encode_string(name) + encoded
+
+
+def write_daqmx_file(path: pathlib.Path, values: np.ndarray) -> None:
+    """Writes values as int16 data of a single DAQmx scaler of the channel
+    /'Untitled'/'A' with DAQMX_SCALING
+    """
+    # DAQmx data type, raw buffer index, byte offset, sample format and
+    # scale id of the scaler
+    scaler = struct.pack("<LLLLL", 3, 0, 0, 0, 0)
+    # Data type, dimension, number of values and number of scalers, followed
+    # by the scalers and the widths of the raw data buffers
+    daqmx_index = (
+        struct.pack("<LLQL", 0xFFFFFFFF, 1, len(values), 1)
+        + scaler
+        + struct.pack("<LL", 1, values.itemsize)
+    )
+    properties = b"".join(
+        encode_property(name, value) for name, value in DAQMX_SCALING.items()
+    )
+    meta_data = (
+        struct.pack("<L", 2)
+        + tdms_segments.encode_string("/'Untitled'")
+        + struct.pack("<LL", tdms_segments.NO_RAW_DATA, 0)
+        + tdms_segments.encode_string("/'Untitled'/'A'")
+        + struct.pack("<L", 0x1269)
+        + daqmx_index
+        + struct.pack("<L", len(DAQMX_SCALING))
+        + properties
+    )
+    data = values.astype("<i2").tobytes()
+    toc = (
+        tdms_segments.TOC_META_DATA
+        | tdms_segments.TOC_NEW_OBJ_LIST
+        | tdms_segments.TOC_RAW_DATA
+        | tdms_segments.TOC_DAQMX_RAW_DATA
+    )
+    path.write_bytes(
+        tdms_segments.encode_lead_in(
+            toc, 4713, len(meta_data) + len(data), len(meta_data)
+        )
+        + meta_data
+        + data
+    )
+
+
+def test_preserves_raw_data_and_scaling(tmpdir):
+    values = source_values()
+    source_path = pathlib.Path(tmpdir) / "scaled.tdms"
+    with nptdms.TdmsWriter(str(source_path)) as tdms_writer:
+        tdms_writer.write_segment(
+            [nptdms.ChannelObject("Untitled", "A", values, SCALING)]
+        )
+    meta = META
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    run_plan = plan.plan_run(
+        str(source_path), meta, output_file, preserve_raw=True
+    )
+    fix.export_correct_data(
+        filename=str(source_path),
+        meta=meta,
+        output_file=output_file,
+        preserve_raw=True,
+    )
+
+    channel = nptdms.TdmsFile(output_file + ".tdms")["Untitled"]["A"]
+    raw = channel.read_data(scaled=False)
+    assert raw.dtype == np.int16
+    assert np.array_equal(raw, np.arange(1, 16))
+    assert np.array_equal(channel[:], 0.5 * np.arange(1, 16) + 1.0)
+    output_size = pathlib.Path(output_file + ".tdms").stat().st_size
+    assert run_plan.output_bytes == output_size
+
+
+def test_preserves_raw_daqmx_data_and_scaling(tmpdir):
+    source_path = pathlib.Path(tmpdir) / "daqmx.tdms"
+    write_daqmx_file(source_path, source_values())
+    source_channel = nptdms.TdmsFile(str(source_path))["Untitled"]["A"]
+    assert np.array_equal(source_channel[:], 0.5 * source_values() + 1.0)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    run_plan = plan.plan_run(
+        str(source_path), META, output_file, preserve_raw=True
+    )
+    fix.export_correct_data(
+        filename=str(source_path),
+        meta=META,
+        output_file=output_file,
+        preserve_raw=True,
+    )
+
+    channel = nptdms.TdmsFile(output_file + ".tdms")["Untitled"]["A"]
+    raw = channel.read_data(scaled=False)
+    assert raw.dtype == np.int16
+    assert np.array_equal(raw, np.arange(1, 16))
+    assert np.array_equal(channel[:], 0.5 * np.arange(1, 16) + 1.0)
+    # The DAQmx scaler is replaced by a scale passing the raw data through
+    assert channel.properties["NI_Scale[0]_Scale_Type"] == "AdvancedAPI"
+    for name, value in DAQMX_SCALING.items():
+        assert channel.properties[name] == value
+    output_size = pathlib.Path(output_file + ".tdms").stat().st_size
+    assert run_plan.output_bytes == output_size
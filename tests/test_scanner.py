@@ -0,0 +1,88 @@
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import fix, scanner, source, streaming, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6, recurrence_size=2, recurrence_distance=3, total_samples=0
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+# Raw lengths of the parts between restarts of the acquisition
+PARTS = [43, 364, 400]
+
+
+def write_restarted_file(path: pathlib.Path) -> np.ndarray:
+    """Writes a file whose pattern restarts after each part and returns the
+    corrected values of its first channel.
+    """
+    raw, corrected = [], []
+    base = 0
+    for length in PARTS:
+        raw.append(synthetic.corrected_indices(SPEC, 0, length) + base)
+        samples = fix.count_preserved_values(6, 2, length)
+        corrected.append(np.arange(base, base + samples))
+        base += samples
+    raw = np.concatenate(raw)
+    with nptdms.TdmsWriter(str(path)) as tdms_writer:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject(
+                    "Untitled",
+                    synthetic.channel_name(channel_number),
+                    synthetic.channel_values(raw, channel_number, "int32"),
+                )
+                for channel_number in range(2)
+            ]
+        )
+    return synthetic.channel_values(np.concatenate(corrected), 0, "int32")
+
+
+def test_scans_regions(tmpdir, monkeypatch):
+    monkeypatch.setattr(scanner, "SCAN_BLOCK_SAMPLES", 100)
+    path = pathlib.Path(tmpdir) / "restarted.tdms"
+    write_restarted_file(path)
+    with nptdms.TdmsFile.open(str(path)) as tdms_file:
+        regions = scanner.scan_regions(
+            tdms_file["Untitled"].channels(), META, sum(PARTS)
+        )
+    assert regions == [(0, 43, 0), (43, 407, 3), (407, 807, 7)]
+
+
+def test_corrects_restarted_file(tmpdir):
+    path = pathlib.Path(tmpdir) / "restarted.tdms"
+    expected = write_restarted_file(path)
+    with pytest.raises(Exception):
+        fix.preprocess(META, path)
+
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    fix.export_correct_data(str(path), META, output_file, scan_drift=True)
+    with nptdms.TdmsFile.open(output_file + ".tdms") as tdms_file:
+        np.testing.assert_array_equal(tdms_file["Untitled"]["A"][:], expected)
+
+    source_file = fix.preprocess(META, path, scan_drift=True)
+    blocks = list(streaming.iter_corrected(source_file, block_samples=50))
+    source_file.tdms_operator.close()
+    np.testing.assert_array_equal(
+        np.concatenate([block.data["Untitled/A"] for block in blocks]),
+        expected,
+    )
+
+
+def test_refuses_data_without_pattern(tmpdir):
+    path = pathlib.Path(tmpdir) / "noise.tdms"
+    with nptdms.TdmsWriter(str(path)) as tdms_writer:
+        tdms_writer.write_segment(
+            [nptdms.ChannelObject("Untitled", "A", np.arange(800))]
+        )
+    with pytest.raises(Exception):
+        fix.preprocess(META, path, scan_drift=True)
@@ -0,0 +1,85 @@
+import io
+import nptdms
+import numpy as np
+
+from fixitfelix import segment_writer, tdms_segments
+
+
+def write_segments(tdms_writer, lengths) -> None:
+    offset = 0
+    for length in lengths:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject(
+                    "Untitled",
+                    name,
+                    np.arange(offset, offset + length, dtype=dtype),
+                    properties={"unit": name},
+                )
+                for name, dtype in [("A", "int16"), ("B", "float64")]
+            ]
+        )
+        offset += length
+
+
+def test_writes_meta_data_once():
+    lengths = [6, 6, 6, 3, 6, 6]
+    buffer = io.BytesIO()
+    with segment_writer.IncrementalTdmsWriter(buffer) as tdms_writer:
+        write_segments(tdms_writer, lengths)
+    nptdms_buffer = io.BytesIO()
+    with nptdms.TdmsWriter(nptdms_buffer) as tdms_writer:
+        write_segments(tdms_writer, lengths)
+
+    buffer.seek(0)
+    tdms_file = nptdms.TdmsFile.read(buffer)
+    for name, dtype in [("A", "int16"), ("B", "float64")]:
+        channel = tdms_file["Untitled"][name]
+        np.testing.assert_array_equal(
+            channel[:], np.arange(sum(lengths), dtype=dtype)
+        )
+        assert channel.properties["unit"] == name
+    assert len(buffer.getvalue()) < len(nptdms_buffer.getvalue())
+
+    buffer.seek(0)
+    segments = list(tdms_segments.read_segments(buffer, False))
+    assert [
+        (
+            bool(s.toc & tdms_segments.TOC_META_DATA),
+            bool(s.toc & tdms_segments.TOC_NEW_OBJ_LIST),
+        )
+        for s in segments
+    ] == [(True, True)] + [(False, False)] * 2 + [(True, False)] * 2 + [
+        (False, False)
+    ]
+    assert [s.number_of_chunks * s.chunk_size for s in segments] == [
+        length * 10 for length in lengths
+    ]
+
+
+def test_writes_new_channels_with_meta_data():
+    buffer = io.BytesIO()
+    with segment_writer.IncrementalTdmsWriter(buffer) as tdms_writer:
+        for name in ["A", "A", "B", "B"]:
+            tdms_writer.write_segment(
+                [nptdms.ChannelObject("Untitled", name, np.arange(4))]
+            )
+        tdms_writer.write_segment(
+            [nptdms.ChannelObject("Untitled", "C", ["a", "b"])]
+        )
+
+    buffer.seek(0)
+    segments = list(tdms_segments.read_segments(buffer, False))
+    assert [bool(s.toc & tdms_segments.TOC_NEW_OBJ_LIST) for s in segments] == [
+        True,
+        False,
+        True,
+        False,
+        True,
+    ]
+    buffer.seek(0)
+    tdms_file = nptdms.TdmsFile.read(buffer)
+    np.testing.assert_array_equal(
+        tdms_file["Untitled"]["A"][:], np.tile(np.arange(4), 2)
+    )
+    assert list(tdms_file["Untitled"]["C"][:]) == ["a", "b"]
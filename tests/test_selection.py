@@ -0,0 +1,137 @@
+import nptdms
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import fix, plan, selection, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=3,
+    dtype="int32",
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def write_source(path: pathlib.Path) -> None:
+    corrected = synthetic.corrected_indices(SPEC, 0, SPEC.total_samples)
+    with nptdms.TdmsWriter(str(path)) as tdms_writer:
+        tdms_writer.write_segment(
+            [
+                nptdms.ChannelObject(
+                    group,
+                    synthetic.channel_name(channel_number),
+                    synthetic.channel_values(
+                        corrected, channel_number, SPEC.dtype
+                    ),
+                    {"wf_increment": 0.001},
+                )
+                for group in ["G1", "G2"]
+                for channel_number in range(SPEC.channel_count)
+            ]
+        )
+
+
+def export(tmpdir, file_selection: source.Selection) -> nptdms.TdmsFile:
+    source_path = pathlib.Path(tmpdir) / "source.tdms"
+    if not source_path.exists():
+        write_source(source_path)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+    run_plan = plan.plan_run(
+        str(source_path), META, output_file, file_selection=file_selection
+    )
+    fix.export_correct_data(
+        str(source_path), META, output_file, file_selection=file_selection
+    )
+    export_path = pathlib.Path(output_file + ".tdms")
+    assert run_plan.output_bytes == export_path.stat().st_size
+    return nptdms.TdmsFile.read(str(export_path))
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("100:200", (100, 200, False)),
+        (":200", (None, 200, False)),
+        ("1.5s:", (1.5, None, True)),
+        ("600s:1200s", (600.0, 1200.0, True)),
+    ],
+)
+def test_parse_range(text, expected):
+    assert selection.parse_range(text) == expected
+
+
+@pytest.mark.parametrize("text", ["100", "1s:200", "a:b"])
+def test_parse_range_refuses(text):
+    with pytest.raises(ValueError):
+        selection.parse_range(text)
+
+
+def test_restrict_index_ranges():
+    index_ranges = [(0, 6), (8, 6), (16, 3)]
+    assert selection.restrict_index_ranges(index_ranges, 0, 15) == [
+        (0, 6),
+        (8, 6),
+        (16, 3),
+    ]
+    assert selection.restrict_index_ranges(index_ranges, 4, 13) == [
+        (4, 2),
+        (8, 6),
+        (16, 1),
+    ]
+    assert selection.restrict_index_ranges(index_ranges, 7, 9) == [(9, 2)]
+    assert selection.restrict_index_ranges(index_ranges, 6, 6) == []
+
+
+def test_exports_selected_channels_and_window(tmpdir):
+    tdms_file = export(
+        tmpdir,
+        source.Selection(
+            groups=("G2",), channels=("A", "C"), start=100, stop=250
+        ),
+    )
+    assert [group.name for group in tdms_file.groups()] == ["G2"]
+    assert [channel.name for channel in tdms_file["G2"].channels()] == [
+        "A",
+        "C",
+    ]
+    np.testing.assert_array_equal(
+        tdms_file["G2"]["C"][:],
+        synthetic.channel_values(np.arange(100, 250), 2, SPEC.dtype),
+    )
+
+
+def test_exports_time_window(tmpdir):
+    tdms_file = export(
+        tmpdir,
+        source.Selection(
+            channels=("G1/B",), start=0.1, stop=1.0, in_seconds=True
+        ),
+    )
+    np.testing.assert_array_equal(
+        tdms_file["G1"]["B"][:],
+        synthetic.channel_values(np.arange(100, 603), 1, SPEC.dtype),
+    )
+
+
+@pytest.mark.parametrize(
+    "file_selection",
+    [
+        source.Selection(channels=("D",)),
+        source.Selection(start=700),
+        source.Selection(start=0, stop=0.1, in_seconds=True, groups=("G3",)),
+    ],
+)
+def test_refuses_invalid_selection(tmpdir, file_selection):
+    with pytest.raises(Exception):
+        export(tmpdir, file_selection)
@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import pathlib
+import time
+
+import nptdms
+import numpy as np
+import pytest
+
+from fixitfelix import checkpoint, fix, manifest, shared, source, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+    dtype="int32",
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+NAMES = [f"file_{number}" for number in range(6)]
+
+
+def write_folder(folder: pathlib.Path) -> None:
+    folder.mkdir()
+    for name in NAMES:
+        synthetic.write_synthetic_tdms(folder / f"{name}.tdms", SPEC)
+
+
+def check_corrected(folder: pathlib.Path) -> None:
+    samples = fix.count_preserved_values(6, 2, SPEC.total_samples)
+    for name in NAMES:
+        export_path = folder / f"{name}_corrected.tdms"
+        with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+            channel = tdms_file["Untitled"][synthetic.channel_name(0)]
+            assert len(channel) == samples
+        assert manifest.verify(export_path) == []
+    # Only the corrected files and their sidecar files remain
+    assert not [
+        p for p in folder.iterdir() if p.name.endswith(shared.LEASE_SUFFIX)
+    ]
+    assert not [p for p in folder.iterdir() if fix.PARTIAL_SUFFIX in p.name]
+
+
+def run_process(folder: str) -> list:
+    return shared.export_correct_data(folder, META, "", lease_timeout=1.0)
+
+
+def test_processes_share_folder(tmpdir):
+    folder = pathlib.Path(tmpdir) / "campaign"
+    write_folder(folder)
+    with multiprocessing.get_context("fork").Pool(3) as pool:
+        results = pool.map(run_process, [str(folder)] * 3)
+
+    corrected = [path for result in results for path in result]
+    assert sorted(p.name for p in corrected) == [
+        f"{name}_corrected.tdms" for name in NAMES
+    ]
+    check_corrected(pathlib.Path(tmpdir) / "campaign_corrected")
+
+
+def test_takes_over_stale_lease(tmpdir, monkeypatch):
+    monkeypatch.setattr(shared, "POLL_INTERVAL", 0.05)
+    folder = pathlib.Path(tmpdir) / "campaign"
+    write_folder(folder)
+    export_folder = pathlib.Path(tmpdir) / "campaign_corrected"
+    export_folder.mkdir()
+    # A crashed process left its lease and a partial file behind
+    export_path = export_folder / "file_2_corrected.tdms"
+    shared.create_lease(shared.lease_path(export_path), "crashed")
+    fix.partial_path(export_path).write_bytes(b"partial")
+    checkpoint.checkpoint_path(fix.partial_path(export_path)).write_text("{}")
+
+    corrected = shared.export_correct_data(
+        str(folder), META, "", lease_timeout=0.3
+    )
+
+    assert export_path in corrected
+    check_corrected(export_folder)
+
+
+def test_export_stops_when_lease_is_taken_over(tmpdir):
+    path = pathlib.Path(tmpdir) / "file.fixit_lease"
+    assert shared.create_lease(path, "first")
+    assert not shared.create_lease(path, "second")
+    with shared.Lease(path, "first", 0.2) as lease:
+        lease.segment_started(np.arange(2))
+        path.unlink()
+        shared.create_lease(path, "second")
+        assert lease.lost.wait(1.0)
+        with pytest.raises(Exception):
+            lease.segment_started(np.arange(2))
+    # The lease of the new owner is kept
+    assert shared.read_owner(path) == "second"
+
+
+def test_old_owner_writes_no_segment_after_takeover(tmpdir, monkeypatch):
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    export_path = pathlib.Path(tmpdir) / "source_corrected.tdms"
+    lease_file = shared.lease_path(export_path)
+    shared.create_lease(lease_file, "first")
+    read_chunk = fix.read_chunk
+    calls = []
+
+    def read_chunk_with_takeover(*args):
+        calls.append(args)
+        if len(calls) == 30:
+            # Another process takes over the lease between two renewals
+            lease_file.unlink()
+            shared.create_lease(lease_file, "second")
+        return read_chunk(*args)
+
+    monkeypatch.setattr(fix, "read_chunk", read_chunk_with_takeover)
+    # The renewal does not notice the takeover during the export
+    with shared.Lease(lease_file, "first", 60.0) as lease:
+        with pytest.raises(Exception):
+            shared.correct_file(META, path, export_path, lease)
+        assert lease.lost.is_set()
+
+    # Only the segments written before the takeover are in the partial file
+    partial = fix.partial_path(export_path)
+    with nptdms.TdmsFile.open(str(partial)) as tdms_file:
+        assert len(tdms_file["Untitled"][synthetic.channel_name(0)]) == 29 * 6
+    assert not export_path.exists()
+    assert shared.read_owner(lease_file) == "second"
+
+
+def test_renewed_lease_is_not_broken(tmpdir):
+    path = pathlib.Path(tmpdir) / "file.fixit_lease"
+    shared.create_lease(path, "first")
+    observations: shared.Observations = {}
+    assert not shared.acquire(path, "second", observations, 0.2)
+    time.sleep(0.3)
+    os.utime(path, ns=(1, 1))
+    assert not shared.acquire(path, "second", observations, 0.2)
+    assert shared.read_owner(path) == "first"
+    time.sleep(0.3)
+    assert shared.acquire(path, "second", observations, 0.2)
+    assert shared.read_owner(path) == "second"
@@ -0,0 +1,67 @@
+import numpy as np
+import pathlib
+import pytest
+
+from fixitfelix import fix, source, streaming, synthetic
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+    dtype="int32",
+    segment_samples=100,
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def load(tmpdir, file_selection=None) -> source.SourceFile:
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    return fix.preprocess(META, path, file_selection)
+
+
+@pytest.mark.parametrize("block_samples", [1, 7, 100, 603, 1000])
+def test_yields_corrected_blocks(tmpdir, block_samples):
+    source_file = load(tmpdir)
+    blocks = list(streaming.iter_corrected(source_file, block_samples))
+    source_file.tdms_operator.close()
+
+    assert [block.start for block in blocks] == list(
+        range(0, 603, block_samples)
+    )
+    assert all(
+        len(block.data["Untitled/A"]) == block_samples for block in blocks[:-1]
+    )
+    for channel_number, name in enumerate(["A", "B"]):
+        np.testing.assert_array_equal(
+            np.concatenate(
+                [block.data[f"Untitled/{name}"] for block in blocks]
+            ),
+            synthetic.channel_values(np.arange(603), channel_number, "int32"),
+        )
+
+
+def test_yields_blocks_per_group(tmpdir):
+    source_file = load(
+        tmpdir, source.Selection(channels=("B",), start=100, stop=250)
+    )
+    blocks = list(
+        streaming.iter_corrected(source_file, block_samples=64, by_group=True)
+    )
+    source_file.tdms_operator.close()
+
+    assert [block.start for block in blocks] == [100, 164, 228]
+    values = np.concatenate([block.data["Untitled"] for block in blocks])
+    assert values.shape == (150, 1)
+    np.testing.assert_array_equal(
+        values[:, 0], synthetic.channel_values(np.arange(100, 250), 1, "int32"),
+    )
@@ -0,0 +1,58 @@
+import nptdms
+import numpy as np
+import pathlib
+
+from fixitfelix import fix, source, synthetic
+
+
+def test_reproduces_example_file(tmpdir):
+    spec = synthetic.SyntheticSpec(
+        chunk_size=6, recurrence_size=2, recurrence_distance=3, total_samples=19
+    )
+    path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, spec)
+
+    example = nptdms.TdmsFile("tests/assets/example_file.tdms")
+    generated = nptdms.TdmsFile(path)
+    assert np.array_equal(
+        generated["Untitled"]["A"][:], example["Untitled"]["A"][:]
+    )
+
+
+def test_corrected_file_counts_upwards(tmpdir):
+    spec = synthetic.SyntheticSpec(
+        chunk_size=50,
+        recurrence_size=7,
+        recurrence_distance=5,
+        total_samples=1000,
+        channel_count=3,
+        dtype="int16",
+        segment_samples=123,
+    )
+    meta = source.MetaData(
+        chunk_size=50,
+        recurrence_size=7,
+        recurrence_distance=5,
+        consistency_sample_size=10,
+        segment_size=0,
+    )
+    path = pathlib.Path(tmpdir) / "synthetic.tdms"
+    synthetic.write_synthetic_tdms(path, spec)
+    output = pathlib.Path(tmpdir) / "output"
+    fix.export_correct_data(filename=str(path), meta=meta, output_file=output)
+
+    channel = nptdms.TdmsFile(str(output) + ".tdms")["Untitled"]["C"]
+    expected_length = sum(
+        length
+        for _, length in fix.calculate_index_ranges_to_preserve(50, 7, 1000)
+    )
+    assert channel.dtype == np.int16
+    assert np.array_equal(
+        channel[:], 3 * np.arange(1, expected_length + 1, dtype=np.int16)
+    )
+
+
+def test_channel_names():
+    assert synthetic.channel_name(0) == "A"
+    assert synthetic.channel_name(25) == "Z"
+    assert synthetic.channel_name(26) == "AA"
@@ -0,0 +1,73 @@
+import nptdms
+import numpy as np
+import pathlib
+
+from fixitfelix import fix, source, synthetic, tdms_index
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=803,
+    channel_count=2,
+    segment_samples=100,
+)
+
+META = source.MetaData(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    consistency_sample_size=10,
+    segment_size=0,
+)
+
+
+def read_all(tdms_file) -> np.ndarray:
+    return np.stack([c[:] for c in tdms_file["Untitled"].channels()])
+
+
+def test_index_file_is_read_by_nptdms(tmpdir):
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    with nptdms.TdmsFile.open(str(path)) as tdms_file:
+        expected = read_all(tdms_file)
+
+    assert tdms_index.index_files(str(tmpdir)) == [path]
+    assert tdms_index.has_valid_index(path)
+    assert tdms_index.index_files(str(tmpdir)) == []
+    index = tdms_index.index_path(path)
+    assert index.name == "source.tdms_index"
+    with nptdms.TdmsFile.open(str(index)) as tdms_file:
+        assert tdms_file["Untitled"]["A"].properties == {}
+        assert len(tdms_file["Untitled"]["A"]) == 803
+    with tdms_index.open_tdms(path) as tdms_file:
+        np.testing.assert_array_equal(read_all(tdms_file), expected)
+
+
+def test_outdated_index_is_ignored(tmpdir):
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    tdms_index.write_index_file(path)
+    with nptdms.TdmsWriter(str(path), mode="a") as tdms_writer:
+        tdms_writer.write_segment(
+            [nptdms.ChannelObject("Untitled", "A", np.arange(10))]
+        )
+
+    assert not tdms_index.has_valid_index(path)
+    with tdms_index.open_tdms(path) as tdms_file:
+        assert len(tdms_file["Untitled"]["A"]) == 813
+
+
+def test_writes_index_of_corrected_file(tmpdir):
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+    output_file = str(pathlib.Path(tmpdir) / "output")
+
+    fix.export_correct_data(str(path), META, output_file)
+
+    export_path = pathlib.Path(output_file + ".tdms")
+    assert tdms_index.has_valid_index(export_path)
+    with nptdms.TdmsFile.open(str(export_path)) as tdms_file:
+        np.testing.assert_array_equal(
+            tdms_file["Untitled"]["B"][:], 2 * np.arange(1, 604)
+        )
@@ -0,0 +1,75 @@
+import pathlib
+
+import yaml
+from click.testing import CliRunner
+
+from fixitfelix import cli, config, synthetic, tuning
+
+SPEC = synthetic.SyntheticSpec(
+    chunk_size=6,
+    recurrence_size=2,
+    recurrence_distance=3,
+    total_samples=20_003,
+    channel_count=2,
+    dtype="int32",
+)
+
+
+def test_chooses_smallest_setting_near_best():
+    measurements = [
+        tuning.Measurement(1, 1, 50.0),
+        tuning.Measurement(2, 1, 95.0),
+        tuning.Measurement(4, 1, 100.0),
+        tuning.Measurement(8, 1, 92.0),
+    ]
+    assert tuning.choose_smallest(measurements, "block_size") == 2
+
+
+def test_tunes_folder(tmpdir, monkeypatch):
+    monkeypatch.setattr(tuning, "BLOCK_SIZES", [4_000, 16_000, 1_000_000])
+    monkeypatch.setattr(tuning, "WORKER_COUNTS", [1, 2, 4])
+    folder = pathlib.Path(tmpdir) / "campaign"
+    folder.mkdir()
+    synthetic.write_synthetic_tdms(
+        folder / "small.tdms", SPEC._replace(total_samples=803)
+    )
+    synthetic.write_synthetic_tdms(folder / "large.tdms", SPEC)
+    assert tuning.find_input_file(folder) == folder / "large.tdms"
+
+    result = tuning.tune(folder, pathlib.Path(tmpdir), 100_000)
+
+    # Blocks larger than a measurement are skipped
+    assert [(m.block_size, m.workers) for m in result.reads] == [
+        (4_000, 1),
+        (16_000, 1),
+        (result.read_block_size, 2),
+        (result.read_block_size, 4),
+    ]
+    assert [m.block_size for m in result.writes] == [4_000, 16_000]
+    assert result.segment_size in [4e-6, 16e-6]
+    assert result.workers in [1, 2, 4]
+    assert list(pathlib.Path(tmpdir).iterdir()) == [folder]
+
+
+def test_cli_stores_settings(tmpdir, monkeypatch):
+    monkeypatch.setattr(tuning, "BLOCK_SIZES", [4_000, 16_000])
+    monkeypatch.setattr(tuning, "WORKER_COUNTS", [1, 2])
+    config_path = pathlib.Path(tmpdir) / "config.yaml"
+    config_path.write_text(yaml.safe_dump({"chunk_size": 6}))
+    monkeypatch.setattr(cli, "PATH_TO_CONFIG", config_path)
+    monkeypatch.setattr(
+        cli, "CLI_CONFIG", config.CliConfig.from_yaml(config_path)
+    )
+    path = pathlib.Path(tmpdir) / "source.tdms"
+    synthetic.write_synthetic_tdms(path, SPEC)
+
+    result = CliRunner().invoke(
+        cli.main, ["tune", str(path), "--calibration_bytes", "50000"]
+    )
+
+    assert result.exit_code == 0, result.output
+    stored = yaml.safe_load(config_path.read_text())
+    assert stored["chunk_size"] == 6
+    assert stored["segment_size"] in [4e-6, 16e-6]
+    assert stored["read_block_size"] in [4_000, 16_000]
+    assert stored["workers"] in [1, 2]